@@ -3,6 +3,7 @@
 To access the remote build data use the class BuildResult.
 """
 
+from array import array
 from cStringIO import StringIO
 
 from lxml import etree
@@ -13,7 +14,7 @@ from osc2.util.xml import fromstring, OscElement
 from osc2.util.cpio import CpioArchive
 from osc2.core import Osc
 
-__all__ = ['BuildResult']
+__all__ = ['BuildResult', 'ResultMatrix']
 
 
 class Status(OscElement):
@@ -149,6 +150,22 @@ class BuildResult(object):
         self.repository = repository
         self.arch = arch
 
+    def _result_request(self, kwargs):
+        """Performs the _result http request and returns the response.
+
+        kwargs are the keyword arguments of the result method.
+
+        """
+        package = kwargs.pop('package', self.package)
+        repository = kwargs.pop('repository', self.repository)
+        arch = kwargs.pop('arch', self.arch)
+        request = Osc.get_osc().get_reqobj()
+        path = "/build/%s/_result" % self.project
+        if 'schema' not in kwargs:
+            kwargs['schema'] = BuildResult.RESULT_SCHEMA
+        return request.get(path, package=package, repository=repository,
+                           arch=arch, **kwargs)
+
     def result(self, **kwargs):
         """Get the build result.
 
@@ -161,18 +178,24 @@ class BuildResult(object):
         current package, repository and arch instance attributes.
 
         """
-        package = kwargs.pop('package', self.package)
-        repository = kwargs.pop('repository', self.repository)
-        arch = kwargs.pop('arch', self.arch)
-        request = Osc.get_osc().get_reqobj()
-        path = "/build/%s/_result" % self.project
-        if 'schema' not in kwargs:
-            kwargs['schema'] = BuildResult.RESULT_SCHEMA
-        f = request.get(path, package=package, repository=repository,
-                        arch=arch, **kwargs)
+        f = self._result_request(kwargs)
         results = fromstring(f.read(), status=Status)
         return results
 
+    def result_matrix(self, **kwargs):
+        """Get the build result as a ResultMatrix.
+
+        In contrast to the result method, the response is parsed
+        incrementally into a compact ResultMatrix (no objectified
+        tree is built).
+
+        Keyword arguments:
+        see the result method
+
+        """
+        f = self._result_request(kwargs)
+        return ResultMatrix.parse(f)
+
     def _prepare_kwargs(self, kwargs, *required):
         for i in required:
             if i not in kwargs and getattr(self, i, ''):
@@ -230,6 +253,234 @@ class BuildResult(object):
         return fromstring(f.read())
 
 
+class ResultMatrix(object):
+    """Represents a build result in a compact columnar structure.
+
+    Each cell of the matrix is a (package, repository, arch, code)
+    tuple. The package, repository, arch and code strs are interned
+    and each column is stored as an array of indexes.
+
+    """
+
+    def __init__(self):
+        """Constructs a new (empty) ResultMatrix object."""
+        super(ResultMatrix, self).__init__()
+        self.packages = []
+        self.repositories = []
+        self.archs = []
+        self.codes = []
+        self._index = {}
+        self._pkg_col = array('I')
+        self._repo_col = array('H')
+        self._arch_col = array('H')
+        self._code_col = array('H')
+        # maps a cell to its details (most cells have no details)
+        self._details = {}
+        # maps a (package idx, repository idx, arch idx) tuple to a cell
+        self._cell_index = {}
+        # maps a kind and an interned index to the array of its cells
+        self._rows = {}
+        # maps a (repository, arch) tuple to the result's state
+        self._states = {}
+
+    @staticmethod
+    def _intern(values, index, value):
+        """Returns the index of value in the values list.
+
+        If value is not present, it is appended. index maps
+        a value to its index in values.
+
+        """
+        idx = index.get(value)
+        if idx is None:
+            idx = len(values)
+            values.append(value)
+            index[value] = idx
+        return idx
+
+    def _idx(self, kind, value):
+        """Returns the interned index of value (or None).
+
+        kind is one of 'packages', 'repositories', 'archs' or
+        'codes'.
+
+        """
+        return self._index.get(kind, {}).get(value)
+
+    def append(self, package, repository, arch, code, details=''):
+        """Appends a new cell to the matrix."""
+        index = self._index
+        i = len(self._code_col)
+        for kind, value, col in (('packages', package, self._pkg_col),
+                                 ('repositories', repository,
+                                  self._repo_col),
+                                 ('archs', arch, self._arch_col),
+                                 ('codes', code, self._code_col)):
+            idx = self._intern(getattr(self, kind),
+                               index.setdefault(kind, {}), value)
+            col.append(idx)
+            rows = self._rows.setdefault(kind, {})
+            if idx not in rows:
+                rows[idx] = array('I')
+            rows[idx].append(i)
+        key = (self._pkg_col[i], self._repo_col[i], self._arch_col[i])
+        self._cell_index.setdefault(key, i)
+        if details:
+            self._details[i] = details
+
+    def state(self, repository, arch):
+        """Returns the state of the repository/arch result (or None)."""
+        return self._states.get((repository, arch))
+
+    def _cell_idx(self, package, repository, arch):
+        """Returns the index of the cell (or None)."""
+        key = (self._idx('packages', package),
+               self._idx('repositories', repository),
+               self._idx('archs', arch))
+        return self._cell_index.get(key)
+
+    def code(self, package, repository, arch):
+        """Returns the code of the cell or None, if it does not exist."""
+        i = self._cell_idx(package, repository, arch)
+        if i is None:
+            return None
+        return self.codes[self._code_col[i]]
+
+    def details(self, package, repository, arch):
+        """Returns the details of the cell (or '')."""
+        i = self._cell_idx(package, repository, arch)
+        if i is None:
+            return ''
+        return self._details.get(i, '')
+
+    def _cells(self, package=None, repository=None, arch=None, code=None):
+        """Yields the indexes of all matching cells.
+
+        A filter which is None matches everything. Only the cells
+        of the most selective filter are scanned.
+
+        """
+        if (package is not None and repository is not None
+                and arch is not None and code is None):
+            i = self._cell_idx(package, repository, arch)
+            if i is not None:
+                yield i
+            return
+        filters = []
+        for kind, value, col in (('packages', package, self._pkg_col),
+                                 ('repositories', repository,
+                                  self._repo_col),
+                                 ('archs', arch, self._arch_col),
+                                 ('codes', code, self._code_col)):
+            if value is None:
+                continue
+            idx = self._idx(kind, value)
+            if idx is None:
+                # no cell can match
+                return
+            filters.append((len(self._rows[kind][idx]), kind, col, idx))
+        if not filters:
+            for i in xrange(len(self._code_col)):
+                yield i
+            return
+        filters.sort()
+        _, kind, _, idx = filters.pop(0)
+        for i in self._rows[kind][idx]:
+            for _, _, col, idx in filters:
+                if col[i] != idx:
+                    break
+            else:
+                yield i
+
+    def find(self, package=None, repository=None, arch=None, code=None):
+        """Returns a list of all matching cells.
+
+        A cell is a (package, repository, arch, code) tuple.
+        A filter which is None matches everything. For instance,
+        find(repository='X', code='failed') returns all cells of
+        failed packages in repository X.
+
+        """
+        return [self._cell(i) for i in self._cells(package, repository,
+                                                   arch, code)]
+
+    def find_packages(self, code, repository=None, arch=None):
+        """Returns a sorted list of packages which have code code.
+
+        Keyword arguments:
+        repository -- limit the search to repository (default: None)
+        arch -- limit the search to arch (default: None)
+
+        """
+        pkgs = set([self.packages[self._pkg_col[i]]
+                    for i in self._cells(repository=repository, arch=arch,
+                                         code=code)])
+        return sorted(pkgs)
+
+    def diff(self, old):
+        """Returns the differences between old and this matrix.
+
+        old is a ResultMatrix (for instance, a previous snapshot).
+        A list of (package, repository, arch, old_code, new_code)
+        tuples is returned. If a cell does not exist in old, old_code
+        is None. If a cell does not exist anymore, new_code is None.
+
+        """
+        old_cells = dict(((pkg, repo, arch), code)
+                         for pkg, repo, arch, code in old)
+        diff = []
+        for pkg, repo, arch, code in self:
+            old_code = old_cells.pop((pkg, repo, arch), None)
+            if old_code != code:
+                diff.append((pkg, repo, arch, old_code, code))
+        for (pkg, repo, arch), old_code in old_cells.iteritems():
+            diff.append((pkg, repo, arch, old_code, None))
+        return diff
+
+    def _cell(self, i):
+        """Returns the i-th cell."""
+        return (self.packages[self._pkg_col[i]],
+                self.repositories[self._repo_col[i]],
+                self.archs[self._arch_col[i]],
+                self.codes[self._code_col[i]])
+
+    def __len__(self):
+        return len(self._code_col)
+
+    def __iter__(self):
+        for i in xrange(len(self._code_col)):
+            yield self._cell(i)
+
+    @classmethod
+    def parse(cls, source):
+        """Returns a new ResultMatrix object.
+
+        source is a file-like object or a filename, which contains
+        a resultlist. The data is parsed incrementally and each
+        processed element is freed immediately.
+
+        """
+        matrix = cls()
+        repository = arch = None
+        for event, elm in etree.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                if elm.tag == 'result':
+                    repository = elm.get('repository')
+                    arch = elm.get('arch')
+                    matrix._states[(repository, arch)] = elm.get('state')
+                continue
+            if elm.tag == 'status':
+                details = elm.findtext('details') or ''
+                matrix.append(elm.get('package'), repository, arch,
+                              elm.get('code'), details)
+                elm.clear()
+            elif elm.tag == 'result':
+                elm.clear()
+                while elm.getprevious() is not None:
+                    del elm.getparent()[0]
+        return matrix
+
+
 class BuildInfo(object):
     """Provides methods to work with a buildinfo element."""
 
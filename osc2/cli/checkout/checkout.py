@@ -4,6 +4,7 @@ import os
 from collections import Sequence
 
 from osc2.wc.project import Project
+from osc2.wc.package import SparseSkipHandler
 from osc2.wc.util import wc_is_project
 from osc2.cli.cli import at_most
 from osc2.cli.update.update import (WCUpdateController,
@@ -77,6 +78,16 @@ class WCCheckoutController(WCUpdateController):
         elif info.get('project') is not None:
             self._checkout_project(info)
 
+    def _build_query(self, info):
+        """Builds query dict."""
+        query = super(WCCheckoutController, self)._build_query(info)
+        max_size = info.get('sparse_size')
+        patterns = info.get('sparse_pattern')
+        if max_size is not None or patterns:
+            handler = SparseSkipHandler(max_size=max_size, patterns=patterns)
+            query['skip_handlers'] = [handler]
+        return query
+
     @at_most(1, 'package', msg="At most one remote argument allowed.")
     def _checkout_package(self, apiurl, project, package, info):
         tl = RendererUpdateTransactionListener(self._renderer)
@@ -85,7 +96,8 @@ class WCCheckoutController(WCUpdateController):
             prj = Project(path, transaction_listener=[tl])
         else:
             prj = Project.init(path, project, apiurl,
-                               transaction_listener=[tl])
+                               transaction_listener=[tl],
+                               object_store=info.get('object_store', False))
         self._update_project(prj, info, package)
 
     @at_most(1, 'project', msg="At most one remote argument allowed.")
@@ -94,5 +106,6 @@ class WCCheckoutController(WCUpdateController):
         path = self._path_join(info.project)
         tl = RendererUpdateTransactionListener(self._renderer)
         prj = Project.init(path, info.project, info.apiurl,
-                           transaction_listener=[tl])
+                           transaction_listener=[tl],
+                           object_store=info.get('object_store', False))
         self._update_project(prj, info)
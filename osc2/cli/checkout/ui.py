@@ -26,4 +26,16 @@ class Checkout(CommandDescription, OscCommand):
                         action='store_true')
     opt_revision = Option('r', 'revision', 'list revision',
                           default='latest')
+    opt_object_store = Option('', 'object-store',
+                              ('share identical files between the packages '
+                               'of a new project working copy'),
+                              action='store_true')
+    opt_sparse_size = Option('', 'sparse-size',
+                             ('do not download files which are larger than '
+                              'SPARSE_SIZE bytes (see fetch)'),
+                             type=int)
+    opt_sparse_pattern = Option('', 'sparse-pattern',
+                                ('do not download files which match the '
+                                 'pattern (see fetch)'),
+                                action='append')
     func = call(WCCheckoutController().checkout)
@@ -0,0 +1,48 @@
+"""Provides a function to fetch skipped files."""
+
+from collections import Sequence
+
+from osc2.wc.base import TransactionListener
+
+
+class RendererFetchTransactionListener(TransactionListener):
+    """Informs about the downloaded files via the renderer."""
+
+    def __init__(self, renderer, *args, **kwargs):
+        """Constructs a new RendererFetchTransactionListener object.
+
+        renderer is the renderer. *args and **kwargs
+        are parameters for the superclass' __init__ method.
+
+        """
+        super(RendererFetchTransactionListener, self).__init__(*args,
+                                                               **kwargs)
+        self._renderer = renderer
+
+    def begin(self, name, uinfo):
+        return True
+
+    def finished(self, name, aborted=False, abort_reason=''):
+        pass
+
+    def transfer(self, transfer_type, filename):
+        self._renderer.render_text("downloading: %s" % filename)
+
+    def processed(self, entity, new_state, old_state):
+        pass
+
+
+def fetch(renderer, path, info):
+    paths = path
+    if not isinstance(paths, Sequence):
+        paths = [path]
+    tl = RendererFetchTransactionListener(renderer)
+    for path in paths:
+        pkg = path.package_obj(transaction_listener=[tl])
+        if pkg is None:
+            msg = "package working copy required"
+            raise ValueError(msg)
+        filenames = []
+        if path.filename:
+            filenames.append(path.filename)
+        pkg.fetch(*filenames)
@@ -0,0 +1,18 @@
+"""Defines the fetch command."""
+
+from osc2.cli.cli import OscCommand, call
+from osc2.cli.description import CommandDescription
+from osc2.cli.fetch.fetch import fetch
+
+
+class Fetch(CommandDescription, OscCommand):
+    """Downloads the skipped files of a sparse checkout.
+
+    Examples:
+    osc2 fetch /path/prj/pkg      # downloads all skipped files of pkg
+    osc2 fetch /path/prj/pkg/file # downloads the skipped file file
+
+    """
+    cmd = 'fetch'
+    args = '(wc_path)+'
+    func = call(fetch)
@@ -2,6 +2,8 @@
 
 import os
 
+from osc2.util import parallel
+
 
 STATUS_FILE_TEMPLATE = 'status/status_file.jinja2'
 STATUS_PACKAGE_TEMPLATE = 'status/status_package.jinja2'
@@ -42,16 +44,30 @@ def _package_status(renderer, prj, pkg, info):
 
 
 def _project_status(renderer, prj, info):
+    """Shows the status of all packages of the project prj.
+
+    The package working copies are read and their states are
+    collected by at most info.jobs concurrent workers. The
+    results are rendered in package order (as soon as they
+    are available).
+
+    """
     global STATUS_PACKAGE_TEMPLATE
-    for package in prj.packages():
+
+    def collect(package):
+        package_state = prj._status(package)
         pkg = prj.package(package)
         if pkg is None:
-            package_state = prj._status(package)
-            renderer.render(STATUS_PACKAGE_TEMPLATE, states={},
-                            package=package, package_state=package_state,
-                            info=info, path_prefix='')
-        else:
-            _package_status(renderer, prj, prj.package(package), info)
+            return package, package_state, {}, ''
+        states = _package_states(pkg, path=pkg.path)
+        return package, package_state, states, package
+
+    workers = getattr(info, 'jobs', 1) or 1
+    results = parallel.imap(collect, prj.packages(), workers=workers)
+    for package, package_state, states, path_prefix in results:
+        renderer.render(STATUS_PACKAGE_TEMPLATE, states=states,
+                        package=package, package_state=package_state,
+                        info=info, path_prefix=path_prefix)
 
 
 def _package_states(pkg, *filenames, **kwargs):
@@ -19,4 +19,7 @@ class Status(CommandDescription, OscCommand):
     args = '(wc_path)?'
     opt_verbose = Option('v', 'verbose', 'also print unchanged states',
                          action='store_true')
+    opt_jobs = Option('j', 'jobs',
+                      'number of packages which are processed concurrently',
+                      type=int, default=1)
     func = call(status)
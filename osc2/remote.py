@@ -11,6 +11,7 @@ Example usage:
  prj.store()
 """
 
+import copy
 import logging
 import os
 from cStringIO import StringIO
@@ -120,7 +121,7 @@ class RemoteModel(object):
     """Base class for all remote models"""
 
     def __init__(self, tag='', xml_data='', schema='', store_schema='',
-                 **kwargs):
+                 xml_element=None, adopt=False, **kwargs):
         """Creates a new remote model object.
 
         Keyword arguments:
@@ -129,9 +130,17 @@ class RemoteModel(object):
         schema -- path to schema for this model (default: '')
         store_schema -- path to the schema file which is used to validate the
                         response after storing the xml (default: '')
+        xml_element -- an (already parsed) element which represents this
+                       model (default: None)
+        adopt -- if True, xml_element's subtree is moved into this model
+                 instead of being copied; afterwards, xml_element must not
+                 be used anymore (note: already existing python objects
+                 for elements of the subtree keep their classes)
+                 (default: False)
         kwargs -- attributes for the root tag
 
-        Note: if tag _and_ xml_data is specified, tag is ignored
+        Note: if tag _and_ xml_data (or xml_element) is specified, tag is
+        ignored
 
         """
         super(RemoteModel, self).__init__()
@@ -142,6 +151,8 @@ class RemoteModel(object):
 #            raise ValueError("Either specificy tag or xml_data but not both")
         if xml_data:
             self._read_xml_data(xml_data)
+        elif xml_element is not None:
+            self._read_xml_element(xml_element, adopt)
         elif tag:
             self._xml = self._get_parser().makeelement(tag, **kwargs)
         else:
@@ -151,6 +162,31 @@ class RemoteModel(object):
         parser = self._get_parser()
         self._xml = fromstring(xml_data, parser=parser)
 
+    def _read_xml_element(self, element, adopt=False):
+        """Uses element as the root element of this model.
+
+        In contrast to _read_xml_data, the data is not parsed again.
+        If element does not belong to a document which was created by
+        this model's parser, its subtree is moved into a new root element
+        (so that the element class lookup of this model's parser is used).
+        Unless adopt is True, the subtree is copied beforehand.
+
+        """
+        parser = self._get_parser()
+        if not adopt:
+            # note: the copy still uses element's parser
+            element = copy.deepcopy(element)
+        if (element.getparent() is None
+                and element.getroottree().parser is parser):
+            self._xml = element
+            return
+        root = parser.makeelement(element.tag, attrib=dict(element.attrib),
+                                  nsmap=element.nsmap)
+        # (the root's text is ignored - objectify does not support mixed
+        # content anyway)
+        root.extend(list(element.iterchildren()))
+        self._xml = root
+
     def _get_parser(self):
         """Returns a parser object which is configured with RemoteModelElement
         as the default tree_class and uses a StringElement for all data
@@ -6,8 +6,8 @@ Currently only the search for requests is supported.
 
 from lxml import etree
 
-from osc2.remote import Request, RemoteProject
-from osc2.util.xml import fromstring, OscElement
+from osc2.remote import Request, RemoteProject, RemoteModelElement
+from osc2.util.xml import fromstring, OscElement, ElementClassLookup
 from osc2.core import Osc
 
 
@@ -40,7 +40,7 @@ class ROProject(OscElement):
         its state can be changed etc.
 
         """
-        return RemoteProject(xml_data=etree.tostring(self))
+        return RemoteProject(xml_element=self)
 
 
 class RequestCollection(OscElement):
@@ -72,7 +72,7 @@ class RORequest(OscElement):
         its state can be changed etc.
 
         """
-        return Request(xml_data=etree.tostring(self))
+        return Request(xml_element=self)
 
 
 def _find(path, xp, tag_class={}, **kwargs):
@@ -97,34 +97,97 @@ def _find(path, xp, tag_class={}, **kwargs):
     return fromstring(f.read(), **tag_class)
 
 
-def find_request(xp, **kwargs):
+def _iterfind(path, xp, tag, model_class, **kwargs):
+    """Yields model_class objects which match the xpath.
+
+    In contrast to _find, the response is parsed incrementally: an object
+    is yielded as soon as the closing tag of the corresponding element
+    is read and afterwards the element is freed. That is, the complete
+    response is never kept in memory.
+    path is the remote path which is used for the http request.
+    xp is the xpath which is used for the search (either an
+    Expression object or a string). tag is the tag name of the
+    elements (which are direct children of the root element) that are
+    represented by a model_class instance.
+
+    Keyword arguments:
+    **kwargs -- optional parameters for the http request
+
+    """
+    request = Osc.get_osc().get_reqobj()
+    xpath = xp
+    if hasattr(xp, 'tostring'):
+        xpath = xp.tostring()
+    f = request.get(path, match=xpath, **kwargs)
+    # blank text is removed (like the objectify parser does)
+    context = etree.iterparse(f, events=('start', 'end'),
+                              remove_blank_text=True)
+    # the elements are adopted by the models, so they should be created
+    # with the model's element classes right away
+    context.set_element_class_lookup(
+        ElementClassLookup(tree_class=RemoteModelElement))
+    depth = 0
+    try:
+        for event, elm in context:
+            if event == 'start':
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1 or elm.tag != tag:
+                continue
+            yield model_class(xml_element=elm, adopt=True)
+            # free the processed element and its (already processed)
+            # siblings
+            elm.clear()
+            parent = elm.getparent()
+            while elm.getprevious() is not None:
+                parent.remove(elm.getprevious())
+    finally:
+        f.close()
+
+
+def find_request(xp, stream=False, **kwargs):
     """Returns a RequestCollection with objects which match the xpath.
 
     xp is the xpath which is used for the search (either an
     Expression object or a string).
+    If stream is True, a generator is returned, which yields a Request
+    object for each matching request (the response is parsed
+    incrementally). In this case, the response is only validated, if
+    a schema is explicitly passed (the validation requires the complete
+    response).
 
     Keyword arguments:
+    stream -- if True, yield the requests incrementally (default: False)
     **kwargs -- optional parameters for the http request
 
     """
     path = '/search/request'
+    if stream:
+        return _iterfind(path, xp, 'request', Request, **kwargs)
     if 'schema' not in kwargs:
         kwargs['schema'] = RequestCollection.SCHEMA
     tag_class = {'collection': RequestCollection, 'request': RORequest}
     return _find(path, xp, tag_class, **kwargs)
 
 
-def find_project(xp, **kwargs):
+def find_project(xp, stream=False, **kwargs):
     """Returns a ProjectCollection with objects which match the xpath.
 
     xp is the xpath which is used for the search (either an
     Expression object or a string).
+    If stream is True, a generator is returned, which yields a
+    RemoteProject object for each matching project (see find_request
+    for the details).
 
     Keyword arguments:
+    stream -- if True, yield the projects incrementally (default: False)
     **kwargs -- optional parameters for the http request
 
     """
     path = '/search/project'
+    if stream:
+        return _iterfind(path, xp, 'project', RemoteProject, **kwargs)
     if 'schema' not in kwargs:
         kwargs['schema'] = ProjectCollection.SCHEMA
     tag_class = {'collection': ProjectCollection, 'project': ROProject}
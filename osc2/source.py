@@ -1,6 +1,8 @@
 """Provides classes to access the source
 route"""
 
+from lxml import etree
+
 from osc2.util.xml import fromstring, OscElement
 from osc2.remote import RORemoteFile
 from osc2.core import Osc
@@ -56,6 +58,7 @@ class Linkinfo(OscElement):
 class Project(object):
     """Class used to access /source/project data"""
     LIST_SCHEMA = ''
+    INFO_SCHEMA = ''
 
     def __init__(self, name):
         """Creates a new Project object.
@@ -66,10 +69,14 @@ class Project(object):
         super(Project, self).__init__()
         self.name = name
 
-    def list(self, **kwargs):
+    def list(self, names_only=False, **kwargs):
         """List all packages for this project.
 
+        A list of Package objects is returned. If names_only is
+        True, a list of package names is returned instead.
+
         Keyword arguments:
+        names_only -- return only the package names (default: False)
         **kwargs -- optional parameters for the http request
 
         """
@@ -78,19 +85,50 @@ class Project(object):
         if 'schema' not in kwargs:
             kwargs['schema'] = Project.LIST_SCHEMA
         f = request.get(path, **kwargs)
-        entries = fromstring(f.read())
-        r = []
         # using an xml representation for the <entry /> makes no
         # sense
-        for e in entries.iterfind('entry'):
-            r.append(Package(self.name, e.get('name')))
-        return r
+        names = _entry_names(f)
+        if names_only:
+            return names
+        return [Package(self.name, name) for name in names]
+
+    def sourceinfo(self, **kwargs):
+        """Return the source info of all packages.
+
+        A dict is returned which maps a package name to a dict that
+        contains the attributes of the package's <sourceinfo />
+        element (for instance, "srcmd5" or "error"). The source info
+        of all packages is retrieved with a single request.
+
+        Keyword arguments:
+        **kwargs -- optional parameters for the http request (for
+                    instance, package=[...] limits the source info
+                    to the specified packages)
+
+        """
+        request = Osc.get_osc().get_reqobj()
+        path = '/source/' + self.name
+        if 'schema' not in kwargs:
+            kwargs['schema'] = Project.INFO_SCHEMA
+        f = request.get(path, view='info', nofilename='1', **kwargs)
+        info = {}
+        try:
+            for _, elm in etree.iterparse(f, tag='sourceinfo'):
+                info[elm.get('package')] = dict(elm.attrib)
+                elm.clear()
+                while elm.getprevious() is not None:
+                    del elm.getparent()[0]
+        finally:
+            f.close()
+        return info
 
 
 class Package(object):
     """Class used to access /source/project/package data"""
     LIST_SCHEMA = ''
     HISTORY_SCHEMA = ''
+    # a project listing may contain thousands of packages
+    __slots__ = ('project', 'name')
 
     def __init__(self, project, name):
         """Creates a new Package object.
@@ -137,3 +175,21 @@ class Package(object):
             kwargs['schema'] = Package.HISTORY_SCHEMA
         f = request.get(path, **kwargs)
         return fromstring(f.read())
+
+
+def _entry_names(f):
+    """Returns a list which contains the names of all entries.
+
+    f is a file-like object, which contains a directory listing.
+    The data is parsed incrementally with a plain etree parser
+    and each <entry /> is freed after its name was read (that is,
+    no (objectified) tree is built).
+
+    """
+    names = []
+    for _, elm in etree.iterparse(f, tag='entry'):
+        names.append(elm.get('name'))
+        elm.clear()
+        while elm.getprevious() is not None:
+            del elm.getparent()[0]
+    return names
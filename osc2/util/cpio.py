@@ -7,6 +7,7 @@ from collections import namedtuple
 from cStringIO import StringIO
 
 from osc2.util.io import copy_file, iter_read
+from osc2.util.parallel import imap
 
 
 TRAILER = 'TRAILER!!!'
@@ -70,6 +71,22 @@ class FileWrapper(object):
         seek = getattr(self._fobj, 'seek', None)
         return seek is not None
 
+    def is_mmap(self):
+        """Returns True if the underlying file is mmap'ed."""
+        return isinstance(self._fobj, mmap.mmap)
+
+    def pread(self, num, offset):
+        """Reads num bytes starting at the absolute position offset.
+
+        In contrast to read, the file position is not changed. Hence,
+        it is safe to call this method concurrently.
+        A ValueError is raised if the file is not mmap'ed.
+
+        """
+        if not self.is_mmap():
+            raise ValueError('pread is only supported for mmap\'ed files')
+        return self._fobj[offset:offset + num]
+
     def read(self, num=-1):
         """Read num bytes.
 
@@ -176,21 +193,33 @@ class CpioEntity(object):
 class CpioFile(CpioEntity):
     """Represents a regular file in a cpio archive."""
 
-    def __init__(self, fobj, hdr):
+    def __init__(self, fobj, hdr, checksum_class=None):
         """Constructs a new CpioFile object.
 
         fobj is a FileWrapper instance and hdr is the cpio
         header.
 
+        Keyword arguments:
+        checksum_class -- a class which is used to verify the file's
+                          checksum while the file is read (for instance,
+                          CrcChecksum) (default: None)
+
         """
         super(CpioFile, self).__init__(hdr)
         self._fobj = fobj
         self._bytes_read = 0
+        self._checksum_class = checksum_class
+        self._checksum = None
+        if checksum_class is not None:
+            self._checksum = checksum_class(hdr)
 
     def read(self, num=-1):
         """Read num bytes.
 
         If num is -1 read the complete file.
+        A CpioError is raised if the file has a checksum and the
+        checksum does not match (the error is raised by the read
+        call which reads the last byte).
 
         Keyword arguments:
         num -- the number of bytes to be read (default: -1)
@@ -200,28 +229,131 @@ class CpioFile(CpioEntity):
         filesize = self.hdr.filesize
         if num > filesize - self._bytes_read or num == -1:
             num = filesize - self._bytes_read
-        if filesize - self._bytes_read == 0:
-            return ''
-        # ok still some bytes left to read
-        pos = self._fobj.tell()
-        if pos < offset or pos > offset + self.hdr.filesize:
-            self._fobj.seek(offset + self._bytes_read)
-        data = self._fobj.read(num)
-        self._bytes_read += len(data)
+        data = ''
+        if num > 0:
+            # ok still some bytes left to read
+            pos = self._fobj.tell()
+            if pos < offset or pos > offset + self.hdr.filesize:
+                self._fobj.seek(offset + self._bytes_read)
+            data = self._fobj.read(num)
+            self._bytes_read += len(data)
+        if self._checksum is not None:
+            self._checksum.update(data)
         return data
 
-    def copyin(self, dest):
+    def copyin(self, dest, positional=False):
         """Copies the entity to dest.
 
         Despite the fact that the base class requires
         that dest is a directory dest can also be a file or
         file-like object.
 
+        Keyword arguments:
+        positional -- if True, the file contents are read with positional
+                      reads (see FileWrapper.pread), that is, neither the
+                      state of the shared FileWrapper nor the state of this
+                      object is modified (requires an mmap'ed archive)
+                      (default: False)
+
         """
         if not hasattr(dest, 'write'):
             # no file-like object
             dest = os.path.join(dest, self.hdr.name)
-        copy_file(self, dest, mode=self.hdr.mode, mtime=self.hdr.mtime)
+        source = self
+        if positional:
+            source = PositionalFileReader(self._fobj, self.hdr,
+                                          self._checksum_class)
+        copy_file(source, dest, mode=self.hdr.mode, mtime=self.hdr.mtime)
+
+
+class PositionalFileReader(object):
+    """Reads the contents of a regular file in an mmap'ed cpio archive.
+
+    Each reader keeps track of its own position, so that multiple readers
+    can be used concurrently (the FileWrapper's position is never changed).
+
+    """
+
+    def __init__(self, fobj, hdr, checksum_class=None):
+        """Constructs a new PositionalFileReader object.
+
+        fobj is a FileWrapper instance (the file has to be mmap'ed)
+        and hdr is the cpio header of the file.
+        A ValueError is raised if fobj is not mmap'ed.
+
+        Keyword arguments:
+        checksum_class -- a class which is used to verify the file's
+                          checksum while the file is read (default: None)
+
+        """
+        super(PositionalFileReader, self).__init__()
+        if not fobj.is_mmap():
+            raise ValueError('positional reads require an mmap\'ed file')
+        self._fobj = fobj
+        self.hdr = hdr
+        self._bytes_read = 0
+        self._checksum = None
+        if checksum_class is not None:
+            self._checksum = checksum_class(hdr)
+
+    def read(self, num=-1):
+        """Read num bytes.
+
+        If num is -1 read the complete file.
+
+        Keyword arguments:
+        num -- the number of bytes to be read (default: -1)
+
+        """
+        left = self.hdr.filesize - self._bytes_read
+        if num > left or num == -1:
+            num = left
+        data = ''
+        if num > 0:
+            data = self._fobj.pread(num, self.hdr._offset + self._bytes_read)
+            self._bytes_read += len(data)
+        if self._checksum is not None:
+            self._checksum.update(data)
+        return data
+
+
+class CrcChecksum(object):
+    """Incrementally calculates and verifies a crc format checksum.
+
+    The checksum is the (32 bit truncated) sum of all bytes of the
+    file's data.
+
+    """
+
+    def __init__(self, hdr):
+        """Constructs a new CrcChecksum object.
+
+        hdr is the cpio header of the file whose data is checksummed.
+
+        """
+        super(CrcChecksum, self).__init__()
+        self.hdr = hdr
+        self.value = 0
+        self._bytes = 0
+
+    def update(self, data):
+        """Updates the checksum with data.
+
+        If data contains the last byte of the file, the checksum is
+        verified. A CpioError is raised if the checksum does not match.
+
+        """
+        self.value = (self.value + sum(bytearray(data))) & 0xFFFFFFFF
+        self._bytes += len(data)
+        if self._bytes == self.hdr.filesize:
+            self.verify()
+
+    def verify(self):
+        """Raises a CpioError if the checksum does not match."""
+        if self.value != self.hdr.chksum:
+            msg = ("checksum mismatch for \'%s\': %08X (expected: %08X)"
+                   % (self.hdr.name, self.value, self.hdr.chksum))
+            raise CpioError(msg)
 
 
 class CpioHeader(object):
@@ -389,13 +521,19 @@ class NewAsciiReader(ArchiveReader):
 
     """
 
-    def __init__(self, fobj):
+    def __init__(self, fobj, magic=None):
         """Constructs a new NewAsciiReader object.
 
         fobj is a FileWrapper instance.
 
+        Keyword arguments:
+        magic -- the archive magic (default: None, that is
+                 NewAsciiFormat.MAGIC)
+
         """
-        super(NewAsciiReader, self).__init__(fobj, NewAsciiFormat.MAGIC)
+        if magic is None:
+            magic = NewAsciiFormat.MAGIC
+        super(NewAsciiReader, self).__init__(fobj, magic)
 
     def next_header(self):
         if self.trailer_seen:
@@ -457,6 +595,89 @@ class NewAsciiReader(ArchiveReader):
         self._next_header_pos = pos
 
 
+class CrcReader(NewAsciiReader):
+    """This class can read the new ascii format with checksums.
+
+    "New" portable format with crc: magic 070702
+    The checksum of each file is verified while the file is read.
+
+    """
+
+    def __init__(self, fobj):
+        """Constructs a new CrcReader object.
+
+        fobj is a FileWrapper instance.
+
+        """
+        super(CrcReader, self).__init__(fobj, CrcFormat.MAGIC)
+
+    def next_file(self):
+        hdr = self.next_header()
+        if hdr is None:
+            return None
+        return CpioFile(self._fobj, hdr, checksum_class=CrcChecksum)
+
+
+class OdcReader(ArchiveReader):
+    """This class can read the old portable ascii format.
+
+    "Old" portable format: magic 070707
+
+    """
+
+    def __init__(self, fobj):
+        """Constructs a new OdcReader object.
+
+        fobj is a FileWrapper instance.
+
+        """
+        super(OdcReader, self).__init__(fobj, OdcFormat.MAGIC)
+
+    def next_header(self):
+        if self.trailer_seen:
+            return None
+        self._move_next_header_pos()
+        hdr = self._read_header()
+        # the odc format has no padding
+        hdr._offset = self._next_header_pos + OdcFormat.LEN + hdr.namesize
+        self._next_header_pos = hdr._offset + hdr.filesize
+        return hdr
+
+    def next_file(self):
+        hdr = self.next_header()
+        if hdr is None:
+            return None
+        return CpioFile(self._fobj, hdr)
+
+    def _read_header(self):
+        """Returns the newly read header.
+
+        In case of an error a CpioError is raised.
+
+        """
+        global TRAILER
+        data = self._fobj.read(OdcFormat.LEN)
+        if len(data) != OdcFormat.LEN:
+            msg = ("premature end of file (expected at least \'%d\' bytes)"
+                   % OdcFormat.LEN)
+            raise CpioError(msg)
+        (magic, dev, ino, mode, uid, gid, nlink, rdev, mtime, namesize,
+         filesize) = unpack(OdcFormat.FORMAT, data)
+        dev = int(dev, 8)
+        rdev = int(rdev, 8)
+        data = [int(ino, 8), int(mode, 8), int(uid, 8), int(gid, 8),
+                int(nlink, 8), int(mtime, 8), int(filesize, 8),
+                os.major(dev), os.minor(dev), os.major(rdev), os.minor(rdev),
+                int(namesize, 8), 0]
+        hdr = CpioHeader(magic, data, no_convert=True)
+        # read filename
+        data = self._fobj.read(hdr.namesize)
+        # ignore trailing '\0'
+        hdr.name = data[:-1]
+        self.trailer_seen = hdr.name == TRAILER
+        return hdr
+
+
 class NewAsciiWriter(ArchiveWriter):
     """This class can write the new ascii format.
 
@@ -547,6 +768,24 @@ class NewAsciiFormat(object):
         return (4 - (offset % 4)) % 4
 
 
+class CrcFormat(NewAsciiFormat):
+    """Provides class attributes for the new ascii format with crc.
+
+    Except for the magic, the header layout is identical to the
+    new ascii format.
+
+    """
+    MAGIC = '070702'
+
+
+class OdcFormat(object):
+    """Provides class attributes for the old portable ascii format"""
+    MAGIC = '070707'
+    # format and length of the "struct old_ascii_header"
+    FORMAT = '6s6s6s6s6s6s6s6s11s6s11s'
+    LEN = 76
+
+
 class CpioArchive(object):
     """The main interface to all cpio classes.
 
@@ -554,7 +793,8 @@ class CpioArchive(object):
     Currently only reading is supported.
 
     """
-    DEFAULT_READERS = {'070701': NewAsciiReader}
+    DEFAULT_READERS = {'070701': NewAsciiReader, '070702': CrcReader,
+                       '070707': OdcReader}
 
     def __init__(self, filename=None, fobj=None, use_mmap=False, **readers):
         """Constructs a new CpioArchive object.
@@ -611,6 +851,48 @@ class CpioArchive(object):
                 return archive_file
         return None
 
+    def copyin(self, dest, workers=1):
+        """Copies all files of the archive to the directory dest.
+
+        If a filename occurs multiple times in the archive, only its
+        last occurrence is copied (the members that are written are
+        disjoint). If workers is greater than 1 and the archive is
+        mmap'ed, the files are written concurrently by at most workers
+        threads (each thread reads the file contents with positional
+        reads from the shared mmap). Otherwise, the files are copied
+        sequentially (if the archive is not seekable, a file is copied
+        as soon as its header is read).
+        A ValueError is raised if dest is no directory.
+
+        Keyword arguments:
+        workers -- the maximum number of files that are written
+                   concurrently (default: 1)
+
+        """
+        if not os.path.isdir(dest):
+            raise ValueError("dest \"%s\" is no directory" % dest)
+        if not self._fobj.is_seekable():
+            # we cannot go back, so copy each file as soon as it is read
+            # (a later occurrence simply overwrites an earlier one)
+            for archive_file in self:
+                archive_file.copyin(dest)
+            return
+        # the complete member index is needed before we can start
+        index = {}
+        for archive_file in self:
+            index[archive_file.hdr.name] = archive_file
+        members = [archive_file for archive_file in self._files
+                   if index[archive_file.hdr.name] is archive_file]
+        positional = self._fobj.is_mmap()
+        if not positional:
+            workers = 1
+
+        def copyin_member(archive_file):
+            archive_file.copyin(dest, positional=positional)
+
+        for _ in imap(copyin_member, members, workers):
+            pass
+
     def __enter__(self):
         return self
 
@@ -6,13 +6,17 @@ Additionally it provides some convenience methods.
 """
 
 import os
+import errno
+import fcntl
+import ctypes
+import ctypes.util
 import shutil
 from tempfile import NamedTemporaryFile, mkdtemp as orig_mkdtemp
 
 from osc2.util.delegation import StringifiedDelegator, Delegator
 
 
-__all__ = ['copy_file', 'iter_read']
+__all__ = ['copy_file', 'clone_file', 'iter_read']
 
 
 def _copy_file(fsource_obj, fdest_obj, bufsize, size,
@@ -111,18 +115,177 @@ def copy_file(source, dest, mode=0644, mtime=None, bufsize=8096,
         if tmp_filename and os.path.isfile(tmp_filename):
             os.unlink(tmp_filename)
     if not dest_flike:
-        euid = os.geteuid()
-        egid = os.getegid()
-        if uid != euid or euid != 0:
-            # (probably) insufficient permissions
-            uid = -1
-        if gid != egid or egid != 0:
-            # (probably) insufficient permissions
-            gid = -1
-        os.chown(dest, uid, gid)
-        if mtime is not None:
-            os.utime(dest, (-1, mtime))
-        os.chmod(dest, mode)
+        _set_file_attrs(dest, mode, mtime, uid, gid)
+
+
+def _set_file_attrs(dest, mode, mtime, uid, gid):
+    """Set the owner, the mtime and the mode of the file dest.
+
+    No error is raised if the user has insufficient permissions
+    to set uid or gid.
+
+    """
+    euid = os.geteuid()
+    egid = os.getegid()
+    if uid != euid or euid != 0:
+        # (probably) insufficient permissions
+        uid = -1
+    if gid != egid or egid != 0:
+        # (probably) insufficient permissions
+        gid = -1
+    os.chown(dest, uid, gid)
+    if mtime is not None:
+        os.utime(dest, (-1, mtime))
+    os.chmod(dest, mode)
+
+
+# _IOW(0x94, 9, int) (see linux/fs.h)
+FICLONE = 0x40049409
+
+# errnos which indicate that a fast path is not supported (for
+# instance, by the filesystem) - in this case we fall back to the
+# next (slower) method
+_CLONE_UNSUPPORTED = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV,
+                      errno.EINVAL, errno.ENOSYS, errno.EBADF, errno.EPERM,
+                      errno.ETXTBSY)
+
+# False means: not looked up yet
+_COPY_FILE_RANGE = False
+
+
+def _ficlone(fsource_obj, fdest_obj):
+    """Clone fsource_obj into fdest_obj (reflink).
+
+    Return True if the clone was successful, otherwise False.
+
+    """
+    try:
+        fcntl.ioctl(fdest_obj.fileno(), FICLONE, fsource_obj.fileno())
+    except (IOError, OSError) as e:
+        if e.errno not in _CLONE_UNSUPPORTED:
+            raise
+        return False
+    return True
+
+
+def _libc_copy_file_range():
+    """Return the copy_file_range function or None.
+
+    The lookup is only done once.
+
+    """
+    global _COPY_FILE_RANGE
+    if _COPY_FILE_RANGE is False:
+        _COPY_FILE_RANGE = _lookup_copy_file_range()
+    return _COPY_FILE_RANGE
+
+
+def _lookup_copy_file_range():
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    if copy_file_range is not None:
+        return copy_file_range
+    libc_name = ctypes.util.find_library('c')
+    if libc_name is None:
+        return None
+    libc = ctypes.CDLL(libc_name, use_errno=True)
+    func = getattr(libc, 'copy_file_range', None)
+    if func is None:
+        return None
+    func.restype = ctypes.c_ssize_t
+    func.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int,
+                     ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint]
+
+    def copy_file_range(src, dst, count):
+        ret = func(src, None, dst, None, count, 0)
+        if ret < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return ret
+    return copy_file_range
+
+
+def _copy_file_range(fsource_obj, fdest_obj, size):
+    """Copy size bytes from fsource_obj to fdest_obj in kernel space.
+
+    Return True if the copy was successful, otherwise False (in this
+    case, fdest_obj might contain a partial copy, which has to be
+    discarded).
+
+    """
+    copy_file_range = _libc_copy_file_range()
+    if copy_file_range is None:
+        return False
+    src = fsource_obj.fileno()
+    dst = fdest_obj.fileno()
+    copied = 0
+    try:
+        while copied < size:
+            ret = copy_file_range(src, dst, size - copied)
+            if ret == 0:
+                # short copy (for instance, the source shrank or the
+                # filesystem reports no data): let the caller fall back
+                return False
+            copied += ret
+    except OSError as e:
+        if e.errno not in _CLONE_UNSUPPORTED or copied:
+            raise
+        return False
+    return True
+
+
+def clone_file(source, dest, mode=0644, mtime=None, uid=-1, gid=-1):
+    """Copy the file source to the file dest (as cheap as possible).
+
+    source and dest are filenames. The file is cloned via
+    a FICLONE ioctl (reflink) if the filesystem supports it.
+    Otherwise the data is copied via copy_file_range (which avoids
+    the copy from/to userspace) or, if this is not possible either,
+    via copy_file.
+    The cloned file shares its data blocks with the source file
+    until one of them is modified (copy-on-write), that is, it
+    behaves like a regular copy.
+    A ValueError is raised if source does not exist.
+    Regardless of the method, the attributes of dest are set
+    like in copy_file.
+
+    Keyword arguments:
+    mode -- the mode of file dest (default: 0644)
+    mtime -- the mtime of file dest
+    uid -- the uid of file dest (default: -1, that is the uid of
+           the current user is used)
+    gid -- the gid of file dest (default: -1, that is the gid of
+           the current user is used)
+
+    """
+    if not os.path.isfile(source):
+        raise ValueError("source \"%s\" is no file" % source)
+    if os.path.exists(dest) and not os.path.isfile(dest):
+        raise ValueError("dest \"%s\" exists but is no file" % dest)
+    dirname = os.path.dirname(dest)
+    if not os.path.isdir(dirname or os.curdir):
+        raise ValueError("invalid dest filename: dir %s does not exist" %
+                         dirname)
+    tmp_filename = ''
+    cloned = False
+    try:
+        with open(source, 'rb') as fsource_obj:
+            fdest_obj = NamedTemporaryFile(dir=dirname,
+                                           prefix=os.path.basename(dest),
+                                           delete=False)
+            tmp_filename = fdest_obj.name
+            with fdest_obj:
+                size = os.fstat(fsource_obj.fileno()).st_size
+                cloned = (_ficlone(fsource_obj, fdest_obj)
+                          or _copy_file_range(fsource_obj, fdest_obj, size))
+        if cloned:
+            os.rename(tmp_filename, dest)
+    finally:
+        if tmp_filename and os.path.isfile(tmp_filename):
+            os.unlink(tmp_filename)
+    if not cloned:
+        copy_file(source, dest, mode=mode, mtime=mtime, uid=uid, gid=gid)
+        return
+    _set_file_attrs(dest, mode, mtime, uid, gid)
 
 
 def iter_read(fsource, bufsize=8096, size=-1, read_method='read'):
@@ -0,0 +1,61 @@
+"""This module provides helpers to process independent tasks concurrently.
+
+The tasks are executed in a bounded pool of threads. This is mainly
+useful for IO bound tasks (like http requests or writing files).
+"""
+
+from multiprocessing.pool import ThreadPool
+
+
+__all__ = ['imap', 'imap_unordered']
+
+
+def imap(func, iterable, workers=1):
+    """Applies func to each item of iterable and yields the results.
+
+    The results are yielded in the order of iterable (regardless of
+    the order in which they become ready). If workers is greater than
+    1, func is called concurrently by at most workers threads.
+    Otherwise, func is called sequentially in the calling thread.
+    An exception that is raised by func is re-raised in the caller
+    (pending tasks are discarded).
+
+    Keyword arguments:
+    workers -- the maximum number of concurrent func calls (default: 1)
+
+    """
+    if workers <= 1:
+        for item in iterable:
+            yield func(item)
+        return
+    pool = ThreadPool(workers)
+    try:
+        for result in pool.imap(func, iterable):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def imap_unordered(func, iterable, workers=1):
+    """Applies func to each item of iterable and yields the results.
+
+    Like imap, except that the results are yielded as soon as they
+    are ready (that is, the order is arbitrary if workers is greater
+    than 1).
+
+    Keyword arguments:
+    workers -- the maximum number of concurrent func calls (default: 1)
+
+    """
+    if workers <= 1:
+        for item in iterable:
+            yield func(item)
+        return
+    pool = ThreadPool(workers)
+    try:
+        for result in pool.imap_unordered(func, iterable):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
@@ -1,10 +1,75 @@
 """xml utility functions"""
 
+import threading
 from collections import Sequence
 
 from lxml import etree, objectify
 
-__all__ = ['ElementClassLookup', 'get_parser']
+__all__ = ['ElementClassLookup', 'get_parser', 'compile_xpath']
+
+# maximum number of compiled xpath expressions that are cached per thread
+XPATH_CACHE_SIZE = 256
+
+
+class XPathCache(object):
+    """A LRU cache for compiled xpath expressions.
+
+    A cache must not be shared between threads.
+
+    """
+
+    def __init__(self, size):
+        """Constructs a new XPathCache object.
+
+        size is the maximum number of cached expressions.
+
+        """
+        super(XPathCache, self).__init__()
+        self._size = size
+        # maps an xpath str to a [compiled xpath, last use] list
+        self._cache = {}
+        self._tick = 0
+
+    def get(self, xpath):
+        """Returns a compiled etree.XPath object for the xpath str."""
+        self._tick += 1
+        entry = self._cache.get(xpath)
+        if entry is None:
+            if len(self._cache) >= self._size:
+                self._evict()
+            entry = [etree.XPath(xpath), self._tick]
+            self._cache[xpath] = entry
+        entry[1] = self._tick
+        return entry[0]
+
+    def _evict(self):
+        """Removes the least recently used half of the cache entries."""
+        entries = sorted(self._cache.iteritems(), key=lambda x: x[1][1])
+        for xpath, _ in entries[:max(len(entries) / 2, 1)]:
+            del self._cache[xpath]
+
+
+_xpath_cache = threading.local()
+
+
+def compile_xpath(xp):
+    """Returns a compiled etree.XPath object for the xpath xp.
+
+    xp is either a str or an xpath Expression object (see util.xpath).
+    The compiled expressions are cached per thread (LRU). Instead of
+    interpolating values into the xpath, variables should be used (for
+    instance, "//entry[@name = $name]"), so that the compiled
+    expression can be reused. The values are passed as keyword
+    arguments when the compiled expression is evaluated.
+
+    """
+    if hasattr(xp, 'tostring'):
+        xp = xp.tostring()
+    try:
+        cache = _xpath_cache.cache
+    except AttributeError:
+        cache = _xpath_cache.cache = XPathCache(XPATH_CACHE_SIZE)
+    return cache.get(xp)
 
 
 class XPathFindMixin:
@@ -15,10 +80,13 @@ class XPathFindMixin:
     inherits from ElementBase, whose __init__ must not be
     overriden by subclasses (see comment in lxml/classlookup.pxi).
 
+    The xpath is compiled only once (see compile_xpath) and
+    **variables are bound to the xpath's variables.
+
     """
 
-    def find(self, xp):
-        elms = self.findall(xp)
+    def find(self, xp, **variables):
+        elms = self.findall(xp, **variables)
         if isinstance(elms, Sequence):
             if elms:
                 return elms[0]
@@ -26,8 +94,8 @@ class XPathFindMixin:
         # happens if, for example, xp == '2 + 3' (see testcases)
         return elms
 
-    def findall(self, xp):
-        return self.xpath(xp)
+    def findall(self, xp, **variables):
+        return compile_xpath(xp)(self, **variables)
 
 
 class OscElement(XPathFindMixin, objectify.ObjectifiedElement):
@@ -64,6 +132,23 @@ class ElementClassLookup(etree.PythonElementClassLookup):
         return None
 
 
+# a parser must not be used by multiple threads at the same time,
+# hence each thread has its own parser cache
+_parser_cache = threading.local()
+
+
+def _create_parser(tree_class, empty_data_class, lookup_class, tag_class):
+    """Returns a new objectify parser object.
+
+    See get_parser() for the details.
+
+    """
+    parser = objectify.makeparser()
+    lookup = lookup_class(tree_class, empty_data_class, **tag_class)
+    parser.set_element_class_lookup(lookup)
+    return parser
+
+
 def get_parser(tree_class=None, empty_data_class=None,
                lookup_class=ElementClassLookup, **tag_class):
     """Returns an objectify parser object.
@@ -71,6 +156,9 @@ def get_parser(tree_class=None, empty_data_class=None,
     tag_class is a "tag" => "klass" mapping. If a xml is parsed
     with this parser the tag "tag" will be represented by an instance
     of class "klass".
+    The parsers are cached per thread, that is, subsequent calls with
+    the same arguments (in the same thread) return the same parser
+    object. Hence, the returned parser must not be modified.
 
     Keyword arguments:
     tree_class -- class which is used for tree elements (default: None)
@@ -80,9 +168,22 @@ def get_parser(tree_class=None, empty_data_class=None,
                     (default: ElementClassLookup)
 
     """
-    parser = objectify.makeparser()
-    lookup = lookup_class(tree_class, empty_data_class, **tag_class)
-    parser.set_element_class_lookup(lookup)
+    try:
+        parsers = _parser_cache.parsers
+    except AttributeError:
+        parsers = _parser_cache.parsers = {}
+    try:
+        key = (tree_class, empty_data_class, lookup_class,
+               frozenset(tag_class.iteritems()))
+        parser = parsers.get(key)
+    except TypeError:
+        # unhashable tag_class value - do not cache
+        return _create_parser(tree_class, empty_data_class, lookup_class,
+                              tag_class)
+    if parser is None:
+        parser = _create_parser(tree_class, empty_data_class, lookup_class,
+                                tag_class)
+        parsers[key] = parser
     return parser
 
 
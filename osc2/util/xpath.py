@@ -107,6 +107,15 @@ class XPathBuilder(object):
         kwargs.setdefault('in_pred', True)
         return self._factory.create_AttributeExpression(*args, **kwargs)
 
+    def var(self, *args, **kwargs):
+        """Returns a new VariableExpression object.
+
+        *args and **kwargs are additional arguments for the
+        VariableExpression's __init__ method.
+
+        """
+        return self._factory.create_VariableExpression(*args, **kwargs)
+
     def dummy(self):
         """Returns a new DummyExpression object.
 
@@ -209,6 +218,16 @@ class XPathFactory(object):
         kwargs.setdefault('factory', self)
         return LiteralExpression(*args, **kwargs)
 
+    def create_VariableExpression(self, *args, **kwargs):
+        """Constructs a new VariableExpression object.
+
+        *args and **kwargs are additional arguments for the
+        VariableExpression's __init__ method.
+
+        """
+        kwargs.setdefault('factory', self)
+        return VariableExpression(*args, **kwargs)
+
     def create_GeneratorPathDelegate(self, *args, **kwargs):
         """Constructs a new GeneratorPathDelegate object.
 
@@ -719,6 +738,30 @@ class LiteralExpression(Expression):
         return str(self._literal)
 
 
+class VariableExpression(Expression):
+    """Represents a variable reference.
+
+    The value of the variable is bound when the xpath is
+    evaluated (see util.xml.compile_xpath).
+
+    """
+
+    def __init__(self, name, **kwargs):
+        """Constructs a new VariableExpression object.
+
+        name is the name of the variable.
+        **kwargs are the arguments for the superclass'
+        __init__ method.
+
+        """
+        super(VariableExpression, self).__init__(**kwargs)
+        self._name = name
+
+    @children(0, 0)
+    def tostring(self):
+        return '$' + self._name
+
+
 class PredicateExpression(PathExpression):
     """Represents a xpath predicate"""
 
@@ -1,11 +1,17 @@
 """Class to manage package working copies."""
 
 import os
+import sys
+import time
 import hashlib
 import copy
 import subprocess
 import errno
-from difflib import unified_diff
+import stat
+import bisect
+import fnmatch
+from collections import namedtuple
+from difflib import unified_diff, SequenceMatcher
 
 from lxml import etree
 
@@ -14,8 +20,9 @@ from osc2.source import File, Directory, Linkinfo
 from osc2.source import Package as SourcePackage
 from osc2.remote import RWLocalFile
 from osc2.util.xml import fromstring
-from osc2.util.io import copy_file
+from osc2.util.io import clone_file
 from osc2.util.listinfo import ListInfo
+from osc2.util import parallel
 from osc2.wc.base import (WorkingCopy, UpdateStateMixin, CommitStateMixin,
                           FileConflictError, PendingTransactionError,
                           no_pending_transaction)
@@ -24,13 +31,20 @@ from osc2.wc.util import (wc_read_package, wc_read_project, wc_read_apiurl,
                           wc_write_apiurl, wc_write_files, wc_read_files,
                           missing_storepaths, WCInconsistentError,
                           wc_pkg_data_filename, XMLTransactionState,
-                          wc_diff_mkdir, _storedir, _PKG_DATA,
-                          wc_verify_format, wc_write_version)
+                          wc_diff_mkdir, wc_object_store, _storedir,
+                          _PKG_DATA, wc_verify_format, wc_write_version,
+                          _storefile, _read_storefile, _write_storefile)
 
 
-def file_md5(filename):
-    """Return the md5sum of filename's content.
+FileScan = namedtuple('FileScan', ['md5', 'size', 'binary'])
+
 
+def file_scan(filename):
+    """Return a FileScan object for filename.
+
+    The FileScan object contains the md5sum, the size and the
+    binary flag (see is_binaryfile) of filename's content, which
+    are computed by reading the file only once.
     A ValueError is raised if filename does not exist or
     is no file.
 
@@ -40,12 +54,25 @@ def file_md5(filename):
         raise ValueError(msg)
     bufsize = 1024 * 1024
     md5 = hashlib.md5()
+    size = 0
     with open(filename, 'rb') as f:
         data = f.read(bufsize)
+        binary = '\0' in data[:4096]
         while data:
             md5.update(data)
+            size += len(data)
             data = f.read(bufsize)
-    return md5.hexdigest()
+    return FileScan(md5.hexdigest(), size, binary)
+
+
+def file_md5(filename):
+    """Return the md5sum of filename's content.
+
+    A ValueError is raised if filename does not exist or
+    is no file.
+
+    """
+    return file_scan(filename).md5
 
 
 def is_binaryfile(filename):
@@ -62,6 +89,279 @@ def is_binaryfile(filename):
     return '\0' in data
 
 
+class FileMD5Cache(object):
+    """Caches the md5sums (and binary flags) of working copy files.
+
+    Each FileScan object (see file_scan) is stored together with the
+    stat data (size, mtime and ctime (in ns) and inode) of the file at
+    the time it was scanned. A file is only rescanned if its stat data
+    changed (the ctime also detects modifications which restore the
+    mtime, for instance, "touch -r" or "cp -p").
+    The cache is persisted in the storedir (similar to git's index).
+    In order to be safe against modifications which happen in the same
+    second in which the file was scanned (and thus leave the stat data
+    unchanged), a scan is not cached if the file's mtime is not older
+    than the time at which the file was scanned.
+
+    """
+    FILENAME = '_md5cache'
+    HEADER = 'md5cache 3'
+
+    def __init__(self, path):
+        """Constructs a new FileMD5Cache object.
+
+        path is the path to the package working copy.
+
+        """
+        super(FileMD5Cache, self).__init__()
+        self._path = path
+        self._entries = None
+
+    @staticmethod
+    def _stat_key(st):
+        return (st.st_size, int(st.st_mtime * 1000000000),
+                int(st.st_ctime * 1000000000), st.st_ino)
+
+    def _read(self):
+        """Read the persisted cache entries.
+
+        Return a filename -> (stat key, FileScan) mapping. Since new
+        entries are appended to the storefile, the storefile is
+        compacted if it contains too many outdated entries. A storefile
+        with an unknown format is discarded.
+
+        """
+        entries = {}
+        try:
+            data = _read_storefile(self._path, FileMD5Cache.FILENAME)
+        except ValueError:
+            data = ''
+        lines = data.splitlines()
+        if not lines or lines[0] != FileMD5Cache.HEADER:
+            self._entries = entries
+            self._write()
+            return entries
+        for line in lines[1:]:
+            fields = line.split(' ', 6)
+            if len(fields) != 7:
+                continue
+            size, mtime_ns, ctime_ns, ino, md5, binary, filename = fields
+            try:
+                key = (int(size), int(mtime_ns), int(ctime_ns), int(ino))
+            except ValueError:
+                continue
+            entries[filename] = (key, FileScan(md5, key[0], binary == '1'))
+        if len(lines) > 2 * len(entries) + 16:
+            self._entries = entries
+            self._write()
+        return entries
+
+    @staticmethod
+    def _format(filename, key, scan):
+        return "%d %d %d %d %s %d %s\n" % (key + (scan.md5, scan.binary,
+                                                  filename))
+
+    def _write(self):
+        """Write all cache entries to the storefile."""
+        lines = [FileMD5Cache.HEADER + '\n']
+        lines.extend([self._format(filename, key, scan)
+                      for filename, (key, scan)
+                      in sorted(self._entries.iteritems())])
+        data = ''.join(lines)
+        try:
+            _write_storefile(self._path, FileMD5Cache.FILENAME,
+                             data.rstrip('\n'))
+        except (IOError, OSError) as e:
+            # the cache is optional
+            if e.errno not in (errno.EACCES, errno.EPERM, errno.EROFS):
+                raise
+
+    def _append(self, filename, key, scan):
+        """Append a cache entry to the storefile."""
+        fname = _storefile(self._path, FileMD5Cache.FILENAME)
+        try:
+            with open(fname, 'a') as f:
+                f.write(self._format(filename, key, scan))
+        except IOError as e:
+            # the cache is optional
+            if e.errno not in (errno.EACCES, errno.EPERM, errno.EROFS):
+                raise
+
+    def scan(self, filename):
+        """Return the FileScan object of the wc file filename.
+
+        filename is the name of a file in the working copy (it
+        may also be a path relative to the working copy, for
+        instance, the path to a store file).
+        A ValueError is raised if filename does not exist or
+        is no file.
+
+        """
+        if self._entries is None:
+            self._entries = self._read()
+        wc_filename = os.path.join(self._path, filename)
+        # the timestamp has to be taken before the stat call
+        now = int(time.time())
+        try:
+            st = os.stat(wc_filename)
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
+            msg = "filename \"%s\" does not exist or is no file" % filename
+            raise ValueError(msg)
+        key = self._stat_key(st)
+        entry = self._entries.get(filename)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        scan = file_scan(wc_filename)
+        if int(st.st_mtime) < now and scan.size == st.st_size:
+            self._entries[filename] = (key, scan)
+            self._append(filename, key, scan)
+        elif entry is not None:
+            # racy file: do not trust the (outdated) entry anymore
+            del self._entries[filename]
+        return scan
+
+    def md5(self, filename):
+        """Return the md5sum of the wc file filename.
+
+        See scan for the details.
+
+        """
+        return self.scan(filename).md5
+
+    def cached(self, filename):
+        """Return the cached FileScan object of the wc file filename.
+
+        In contrast to scan, the file is never read: None is returned
+        if there is no up-to-date cache entry for filename (or if
+        filename does not exist).
+
+        """
+        if self._entries is None:
+            self._entries = self._read()
+        entry = self._entries.get(filename)
+        if entry is None:
+            return None
+        try:
+            st = os.stat(os.path.join(self._path, filename))
+        except OSError:
+            return None
+        if entry[0] != self._stat_key(st):
+            return None
+        return entry[1]
+
+    def is_binary(self, filename):
+        """Return True if the wc file filename is a binary file.
+
+        See scan for the details.
+
+        """
+        return self.scan(filename).binary
+
+
+class BlobCache(object):
+    """A content-addressed cache for remote file revisions.
+
+    Each blob is stored in the storedir under its md5sum, that is
+    a blob is shared between all revisions which contain a file with
+    the same content. Additionally, store files with a known md5sum
+    can be registered as seeds: a missing blob is cloned from a
+    matching seed instead of being downloaded.
+    The size of the cache is bounded: if it exceeds max_size, the
+    least recently used blobs are removed.
+
+    """
+    DIRNAME = 'blobs'
+    MAX_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, path, max_size=None):
+        """Constructs a new BlobCache object.
+
+        path is the path to the package working copy.
+
+        Keyword arguments:
+        max_size -- the maximum size of all blobs in bytes
+                    (default: BlobCache.MAX_SIZE)
+
+        """
+        super(BlobCache, self).__init__()
+        self._path = _storefile(path, BlobCache.DIRNAME)
+        self._max_size = max_size
+        if max_size is None:
+            self._max_size = BlobCache.MAX_SIZE
+        self._seeds = {}
+
+    def _filename(self, md5):
+        return os.path.join(self._path, md5)
+
+    def _mkdir(self):
+        if not os.path.isdir(self._path):
+            os.mkdir(self._path)
+
+    def seed(self, md5, filename):
+        """Register filename as the source for the blob md5.
+
+        filename has to be a file whose md5sum is md5 (for
+        instance, a file in the store's data dir).
+
+        """
+        self._seeds.setdefault(md5, filename)
+
+    def get(self, md5):
+        """Return the filename of the blob md5.
+
+        If the blob is not cached but a seed is available, it is
+        cloned from the seed. None is returned if the blob is not
+        available.
+
+        """
+        filename = self._filename(md5)
+        if os.path.isfile(filename):
+            # the mtime is used to determine the least recently used blobs
+            os.utime(filename, None)
+            return filename
+        seed = self._seeds.get(md5)
+        if seed is None or not os.path.isfile(seed):
+            return None
+        self._mkdir()
+        clone_file(seed, filename)
+        return filename
+
+    def add(self, md5, filename):
+        """Add a copy of filename as the blob md5.
+
+        The filename of the blob is returned. If the md5sum of
+        filename is not md5 (for instance, because of a corrupt
+        download), nothing is added and None is returned.
+
+        """
+        if file_md5(filename) != md5:
+            return None
+        self._mkdir()
+        blob = self._filename(md5)
+        clone_file(filename, blob)
+        return blob
+
+    def shrink(self):
+        """Remove the least recently used blobs if the cache is too large.
+
+        """
+        if not os.path.isdir(self._path):
+            return
+        blobs = []
+        size = 0
+        for md5 in os.listdir(self._path):
+            st = os.stat(self._filename(md5))
+            blobs.append((st.st_mtime, st.st_size, md5))
+            size += st.st_size
+        blobs.sort()
+        while size > self._max_size and blobs:
+            mtime, blob_size, md5 = blobs.pop(0)
+            os.unlink(self._filename(md5))
+            size -= blob_size
+
+
 class WCOutOfDateError(Exception):
     """Exception raised if the wc is out of date.
 
@@ -91,6 +391,11 @@ class Merge(object):
     BINARY = 2
     FAILURE = 3
 
+    # an optional callable which returns the (cached) FileScan object
+    # of a filename or None if no cheap scan is available (set by
+    # the Package before a merge)
+    scan = None
+
     def merge(self, my_filename, old_filename, your_filename, out_filename):
         """Perform a file merge.
 
@@ -101,11 +406,38 @@ class Merge(object):
         FAILURE -- some internal failure occurred
 
         """
-        if is_binaryfile(my_filename) or is_binaryfile(your_filename):
-            if file_md5(my_filename) == file_md5(old_filename):
-                copy_file(your_filename, out_filename)
+        if self._is_binary(my_filename) or self._is_binary(your_filename):
+            if self._md5(my_filename) == self._md5(old_filename):
+                clone_file(your_filename, out_filename)
                 return Merge.SUCCESS
             return Merge.BINARY
+        return self._merge(my_filename, old_filename, your_filename,
+                           out_filename)
+
+    def _scan(self, filename):
+        if self.scan is None:
+            return None
+        return self.scan(filename)
+
+    def _is_binary(self, filename):
+        scan = self._scan(filename)
+        if scan is None:
+            return is_binaryfile(filename)
+        return scan.binary
+
+    def _md5(self, filename):
+        scan = self._scan(filename)
+        if scan is None:
+            return file_md5(filename)
+        return scan.md5
+
+    def _merge(self, my_filename, old_filename, your_filename, out_filename):
+        """Merge the text files (via diff3).
+
+        The return values are the same as for the merge method
+        (except BINARY).
+
+        """
         merge_cmd = "diff3 -m -E %s %s %s > %s" % (my_filename, old_filename,
                                                    your_filename, out_filename)
         ret = subprocess.call(merge_cmd, shell=True)
@@ -117,6 +449,268 @@ class Merge(object):
             return Merge.FAILURE
 
 
+def _myers_trace(a, b, max_edits):
+    """Return the trace of the Myers diff algorithm for a and b.
+
+    The trace contains a copy of the furthest reaching x positions
+    (mapped by diagonal) for each number of edits. None is returned
+    if a and b differ by more than max_edits edits.
+
+    """
+    n = len(a)
+    m = len(b)
+    v = {1: 0}
+    trace = []
+    for d in xrange(min(n + m, max_edits) + 1):
+        trace.append(v.copy())
+        for k in xrange(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                return trace
+    return None
+
+
+def _myers_blocks(a, alo, ahi, b, blo, bhi, trace):
+    """Return the matching blocks which are encoded in the trace."""
+    blocks = []
+    x = ahi - alo
+    y = bhi - blo
+    for d in xrange(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if d == 0:
+            prev_x = prev_y = start_x = 0
+        else:
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                prev_k = k + 1
+                start_x = v[prev_k]
+            else:
+                prev_k = k - 1
+                start_x = v[prev_k] + 1
+            prev_x = v[prev_k]
+            prev_y = prev_x - prev_k
+        if x > start_x:
+            blocks.append((alo + start_x, blo + start_x - k, x - start_x))
+        x = prev_x
+        y = prev_y
+    blocks.reverse()
+    return blocks
+
+
+def _unique_lcs(a, alo, ahi, b, blo, bhi):
+    """Return the longest common subsequence of the unique lines.
+
+    Only lines which occur exactly once in a[alo:ahi] and exactly once
+    in b[blo:bhi] are considered (patience diff). A list of (i, j)
+    tuples is returned.
+
+    """
+    index = {}
+    for i in xrange(alo, ahi):
+        line = a[i]
+        index[line] = None if line in index else i
+    btoa = {}
+    for j in xrange(blo, bhi):
+        line = b[j]
+        i = index.get(line)
+        if i is None:
+            continue
+        if line in btoa:
+            # not unique in b
+            index[line] = None
+            continue
+        btoa[line] = (i, j)
+    pairs = [btoa[b[j]] for j in xrange(blo, bhi)
+             if b[j] in btoa and index[b[j]] is not None]
+    # longest increasing subsequence of the a positions (patience sorting)
+    tops = []
+    backpointers = {}
+    for i, j in pairs:
+        pos = bisect.bisect(tops, i)
+        tops[pos:pos + 1] = [i]
+        backpointers[i] = (j, tops[pos - 1] if pos else None)
+    result = []
+    i = tops[-1] if tops else None
+    while i is not None:
+        j, prev = backpointers[i]
+        result.append((i, j))
+        i = prev
+    result.reverse()
+    return result
+
+
+def _matching_segment(a, alo, ahi, b, blo, bhi, max_edits, blocks):
+    """Append the matching blocks of a[alo:ahi] and b[blo:bhi] to blocks."""
+    # strip the common prefix and suffix
+    start = alo
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        alo += 1
+        blo += 1
+    if alo > start:
+        blocks.append((start, blo - (alo - start), alo - start))
+    end = ahi
+    while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+    if alo < ahi and blo < bhi:
+        anchors = None
+        if ahi - alo + bhi - blo > max_edits:
+            # small segments are directly matched by the Myers algorithm
+            anchors = _unique_lcs(a, alo, ahi, b, blo, bhi)
+        if anchors:
+            for i, j in anchors:
+                if i > alo or j > blo:
+                    _matching_segment(a, alo, i, b, blo, j, max_edits,
+                                      blocks)
+                blocks.append((i, j, 1))
+                alo = i + 1
+                blo = j + 1
+            _matching_segment(a, alo, ahi, b, blo, bhi, max_edits, blocks)
+        else:
+            trace = _myers_trace(a[alo:ahi], b[blo:bhi], max_edits)
+            if trace is not None:
+                blocks.extend(_myers_blocks(a, alo, ahi, b, blo, bhi, trace))
+            else:
+                matcher = SequenceMatcher(None, a[alo:ahi], b[blo:bhi])
+                blocks.extend([(alo + i, blo + j, n) for i, j, n
+                               in matcher.get_matching_blocks() if n])
+    if ahi < end:
+        blocks.append((ahi, bhi, end - ahi))
+
+
+def _matching_blocks(a, b, max_edits=256):
+    """Return the matching blocks of the sequences a and b.
+
+    The blocks are (i, j, n) triples such that a[i:i + n] == b[j:j + n]
+    (like difflib.SequenceMatcher's get_matching_blocks), adjacent
+    blocks are merged and the last block is (len(a), len(b), 0).
+    The lines which are unique in both sequences are used as anchors
+    (patience diff). The segments between the anchors are matched
+    with the Myers diff algorithm (which is also used by GNU diff) if
+    they differ by at most max_edits insertions and deletions and
+    with difflib's SequenceMatcher otherwise.
+
+    """
+    blocks = []
+    _matching_segment(a, 0, len(a), b, 0, len(b), max_edits, blocks)
+    merged = []
+    for i, j, n in blocks:
+        if merged:
+            prev_i, prev_j, prev_n = merged[-1]
+            if prev_i + prev_n == i and prev_j + prev_n == j:
+                merged[-1] = (prev_i, prev_j, prev_n + n)
+                continue
+        merged.append((i, j, n))
+    merged.append((len(a), len(b), 0))
+    return merged
+
+
+class ThreeWayMerge(Merge):
+    """Line-based three-way merge (without a diff3 subprocess).
+
+    The merged file resembles the output of "diff3 -m -E": changes
+    which were made in only one file (or identically in both files)
+    are merged and overlapping (or adjacent) changes are bracketed
+    with conflict markers.
+    Note: if lines repeat, the alignment of the lines might differ
+    from diff3's alignment (that is, a change might be merged which
+    diff3 reports as a conflict and vice versa). Therefore, it has
+    to be explicitly enabled via the Package's merge_class argument.
+
+    """
+    START_MARKER = '<<<<<<< %s\n'
+    MID_MARKER = '=======\n'
+    END_MARKER = '>>>>>>> %s\n'
+
+    def _sync_regions(self, old, my, your):
+        """Return the regions which are unchanged in my and your.
+
+        Each region is a (old start, old end, my start, my end,
+        your start, your end) tuple. The last region is always
+        empty and marks the end of the files.
+
+        """
+        my_matches = _matching_blocks(old, my)
+        your_matches = _matching_blocks(old, your)
+        regions = []
+        i = j = 0
+        while i < len(my_matches) and j < len(your_matches):
+            my_old, my_start, my_len = my_matches[i]
+            your_old, your_start, your_len = your_matches[j]
+            start = max(my_old, your_old)
+            end = min(my_old + my_len, your_old + your_len)
+            if start < end:
+                my_start += start - my_old
+                your_start += start - your_old
+                regions.append((start, end, my_start, my_start + end - start,
+                                your_start, your_start + end - start))
+            if my_old + my_len < your_old + your_len:
+                i += 1
+            else:
+                j += 1
+        regions.append((len(old), len(old), len(my), len(my), len(your),
+                        len(your)))
+        return regions
+
+    def _merge_lines(self, old, my, your, my_label, your_label):
+        """Merge the line lists and return a (lines, conflicts) tuple."""
+        lines = []
+        conflicts = 0
+        old_pos = my_pos = your_pos = 0
+        for region in self._sync_regions(old, my, your):
+            old_start, old_end, my_start, my_end, your_start, your_end = region
+            base = old[old_pos:old_start]
+            mine = my[my_pos:my_start]
+            yours = your[your_pos:your_start]
+            if mine == yours or base == yours:
+                lines.extend(mine)
+            elif base == mine:
+                lines.extend(yours)
+            else:
+                conflicts += 1
+                lines.append(ThreeWayMerge.START_MARKER % my_label)
+                lines.extend(self._terminated(mine))
+                lines.append(ThreeWayMerge.MID_MARKER)
+                lines.extend(self._terminated(yours))
+                lines.append(ThreeWayMerge.END_MARKER % your_label)
+            lines.extend(old[old_start:old_end])
+            old_pos, my_pos, your_pos = old_end, my_end, your_end
+        return lines, conflicts
+
+    @staticmethod
+    def _terminated(lines):
+        """Ensure that the last line ends with a newline."""
+        if lines and not lines[-1].endswith('\n'):
+            lines = lines[:-1] + [lines[-1] + '\n']
+        return lines
+
+    def _merge(self, my_filename, old_filename, your_filename, out_filename):
+        try:
+            with open(my_filename, 'r') as f:
+                my = f.readlines()
+            with open(old_filename, 'r') as f:
+                old = f.readlines()
+            with open(your_filename, 'r') as f:
+                your = f.readlines()
+            lines, conflicts = self._merge_lines(old, my, your, my_filename,
+                                                 your_filename)
+            with open(out_filename, 'w') as f:
+                f.writelines(lines)
+        except (IOError, OSError):
+            return Merge.FAILURE
+        if conflicts:
+            return Merge.CONFLICT
+        return Merge.SUCCESS
+
+
 class Diff(ListInfo):
     """Encapsulates files for a diff and diff logic.
 
@@ -132,6 +726,8 @@ class Diff(ListInfo):
         self.wc_path = ''
         self.old_path = ''
         self._remote_files = None
+        self._blob_cache = None
+        self._file_cache = None
         self.revision_data = {}
 
     def wc_filename(self, filename):
@@ -144,18 +740,41 @@ class Diff(ListInfo):
         if not os.path.exists(path) and self._remote_files is not None:
             for entry in self._remote_files:
                 if entry.get('name') == filename:
-                    f = entry.file()
-                    f.write_to(path)
+                    self._fetch(entry, path)
                     break
         return path
 
+    def _fetch(self, entry, path):
+        """Write the remote file entry to path.
+
+        If a blob cache is available, the data is only downloaded
+        if the cache contains no blob with the entry's md5sum.
+
+        """
+        md5 = entry.get('md5')
+        blob = None
+        if self._blob_cache is not None and md5:
+            blob = self._blob_cache.get(md5)
+        if blob is not None:
+            clone_file(blob, path)
+            return
+        entry.file().write_to(path)
+        if self._blob_cache is not None and md5:
+            self._blob_cache.add(md5, path)
+
     def cleanup(self):
         """Remove downloaded files.
 
+        The blobs in the blob cache are kept, so that subsequent
+        diffs can reuse them (the least recently used blobs are
+        removed, if the cache is too large).
+
         Note: it is perfectly ok if subclasses decide to
               cache the downloaded data for some time.
 
         """
+        if self._blob_cache is not None:
+            self._blob_cache.shrink()
         if self._remote_files is None:
             return
         for filename in os.listdir(self.old_path):
@@ -169,40 +788,136 @@ class Diff(ListInfo):
 
 
 class UnifiedDiff(Diff):
-    """Perform unified diff."""
+    """Perform unified diff.
+
+    The diff is generated incrementally: process is called
+    with the file header and then with each hunk (or, for added
+    and deleted files, with chunks of at most CHUNK_LINES lines).
+    That is, the complete diff is never kept in memory.
+    Added and deleted files are streamed, that is, the memory usage
+    is bounded by CHUNK_LINES lines. For a modified file, both the
+    old and the wc file are read into memory, because difflib's
+    SequenceMatcher needs both sequences (the generated hunks are
+    still passed to process one by one).
+
+    """
     DIFF_HEADER = "Index: %s\n" + '=' * 67 + '\n'
     DIFF_FILES = "--- %s\t(%s)\n+++ %s\t(%s)\n"
+    NO_NEWLINE = '\n\\ No newline at end of file\n'
+    CHUNK_LINES = 1024
+
+    def __init__(self, *args, **kwargs):
+        super(UnifiedDiff, self).__init__(*args, **kwargs)
+        self._binary = {}
 
     def process(self, data):
         """Process generated diff data.
 
-        data is a list which contains the diff.
+        data is a list which contains a part of the diff (the
+        parts are passed in the order in which they appear in
+        the diff).
         Subclasses may override this method to present
         the diff data.
 
         """
         pass
 
+    def _is_binary(self, filepath):
+        """Return True if filepath is a binary file.
+
+        The result is cached so that each file is only
+        checked once. For wc and store files, an up-to-date
+        binary flag is reused from the package's FileMD5Cache.
+        Otherwise, only the beginning of the file is checked
+        (see is_binaryfile) instead of scanning the complete file.
+
+        """
+        is_binary = self._binary.get(filepath)
+        if is_binary is None:
+            dirname = os.path.dirname(filepath)
+            data_path = os.path.dirname(wc_pkg_data_filename(self.wc_path,
+                                                             'x'))
+            scan = None
+            if (self._file_cache is not None
+                    and dirname in (self.wc_path, data_path)):
+                relpath = os.path.relpath(filepath, self.wc_path)
+                scan = self._file_cache.cached(relpath)
+            if scan is not None:
+                is_binary = scan.binary
+            else:
+                is_binary = is_binaryfile(filepath)
+            self._binary[filepath] = is_binary
+        return is_binary
+
     def _diff_binary(self, filename, old_filepath, wc_filepath):
         is_binary = False
         data = [UnifiedDiff.DIFF_HEADER % filename]
         if wc_filepath and not old_filepath:
-            is_binary = is_binaryfile(wc_filepath)
+            is_binary = self._is_binary(wc_filepath)
             data.append("Binary file \"%s\" has been added.\n" % filename)
         elif not wc_filepath and old_filepath:
-            is_binary = is_binaryfile(old_filepath)
+            is_binary = self._is_binary(old_filepath)
             data.append("Binary file \"%s\" has been deleted.\n" % filename)
         else:
             # unified diff does not care about unchanged, so this
             # is the modified case
-            is_binary = (is_binaryfile(wc_filepath)
-                         or is_binaryfile(old_filepath))
+            is_binary = (self._is_binary(wc_filepath)
+                         or self._is_binary(old_filepath))
             data.append("Binary file \"%s\" has changed.\n" % filename)
         if not is_binary:
             return None
         return data
 
+    def _chunks(self, lines):
+        """Group the iterable lines into lists of CHUNK_LINES lines."""
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= self.CHUNK_LINES:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _prefixed_lines(self, filepath, prefix):
+        """Yield the lines of filepath prefixed with prefix."""
+        line = '\n'
+        with open(filepath, 'r') as f:
+            for line in f:
+                yield prefix + line
+        if not line.endswith('\n'):
+            yield UnifiedDiff.NO_NEWLINE
+
+    def _line_count(self, filepath):
+        """Return the number of lines of filepath.
+
+        The file is read in blocks, that is, the memory usage does
+        not depend on the length of the lines.
+
+        """
+        bufsize = 1024 * 1024
+        count = 0
+        last = '\n'
+        with open(filepath, 'rb') as f:
+            data = f.read(bufsize)
+            while data:
+                count += data.count('\n')
+                last = data[-1]
+                data = f.read(bufsize)
+        if last != '\n':
+            # the last line has no trailing newline
+            count += 1
+        return count
+
     def _diff_add_delete(self, filename, filepath, revision, add):
+        """Generate the diff of an added or deleted file.
+
+        The file is streamed in chunks of at most CHUNK_LINES lines.
+        Since the hunk header contains the number of lines, the file
+        is read twice: the line count is computed blockwise before
+        the lines are generated.
+
+        """
         # difflib does not correctly handle new/deleted files
         old_revision = wc_revision = revision
         if add:
@@ -212,67 +927,87 @@ class UnifiedDiff(Diff):
             wc_revision = 'working copy'
             data = self._diff_binary(filename, filepath, None)
         if data is not None:
-            return data
+            yield data
+            return
         data = [UnifiedDiff.DIFF_HEADER % filename]
         data.append((UnifiedDiff.DIFF_FILES % (filename, old_revision,
                                                filename, wc_revision)))
-        with open(filepath, 'r') as f:
-            diff = f.readlines()
+        count = self._line_count(filepath)
         if add:
-            data.append('@@ -0,0 +1,%s @@\n' % len(diff))
-            data.extend(['+' + line for line in diff])
+            data.append('@@ -0,0 +1,%s @@\n' % count)
+            prefix = '+'
         else:
-            data.append('@@ -1,%s +0,0 @@\n' % len(diff))
-            data.extend(['-' + line for line in diff])
-        self._fixup_newline(data)
-        return data
+            data.append('@@ -1,%s +0,0 @@\n' % count)
+            prefix = '-'
+        yield data
+        for chunk in self._chunks(self._prefixed_lines(filepath, prefix)):
+            yield chunk
 
     def _fixup_newline(self, data):
         if not data:
             return
         if not data[-1].endswith('\n'):
-            data.append('\n\\ No newline at end of file\n')
+            data.append(UnifiedDiff.NO_NEWLINE)
+
+    def _diff_hunks(self, filename, old_filepath, wc_filepath, revision):
+        """Generate the hunks of a modified file.
+
+        Note: both files are read into memory, because difflib's
+        SequenceMatcher needs both sequences. Only the generated
+        diff is passed to process hunk by hunk.
+
+        """
+        data = self._diff_binary(filename, old_filepath, wc_filepath)
+        if data is not None:
+            yield data
+            return
+        old_revision = "revision %s" % revision
+        wc_revision = 'working copy'
+        fromfile = "%s\t(%s)" % (filename, old_revision)
+        tofile = "%s\t(%s)" % (filename, wc_revision)
+        # difflib's SequenceMatcher needs both sequences
+        with open(old_filepath) as f:
+            old = f.readlines()
+        with open(wc_filepath) as f:
+            wc = f.readlines()
+        diff = unified_diff(old, wc, fromfile=fromfile, tofile=tofile)
+        data = [UnifiedDiff.DIFF_HEADER % filename]
+        hunks = 0
+        for i, line in enumerate(diff):
+            if i < 2:
+                line = line.replace(' \n', '\n')
+            elif line.startswith('@@'):
+                if hunks:
+                    # the previous hunk is complete
+                    yield data
+                    data = []
+                hunks += 1
+            data.append(line)
+        self._fixup_newline(data)
+        yield data
 
     def _diff_add(self):
         for filename in self.added:
             wc_filename = self.wc_filename(filename)
-            data = self._diff_add_delete(filename, wc_filename,
-                                         'working copy', True)
-            self.process(data)
+            for data in self._diff_add_delete(filename, wc_filename,
+                                              'working copy', True):
+                self.process(data)
 
     def _diff_delete(self):
         for filename in self.deleted:
             old_filename = self.old_filename(filename)
-            data = self._diff_add_delete(filename, old_filename,
-                                         self.revision_data['rev'], False)
-            self.process(data)
+            for data in self._diff_add_delete(filename, old_filename,
+                                              self.revision_data['rev'],
+                                              False):
+                self.process(data)
 
     def _diff_modified(self):
         for filename in self.modified:
             old_filename = self.old_filename(filename)
-            old_revision = "revision %s" % self.revision_data['rev']
             wc_filename = self.wc_filename(filename)
-            wc_revision = 'working copy'
-            fromfile = "%s\t(%s)" % (filename, old_revision)
-            tofile = "%s\t(%s)" % (filename, wc_revision)
-            data = self._diff_binary(filename, old_filename, wc_filename)
-            if data is not None:
+            for data in self._diff_hunks(filename, old_filename, wc_filename,
+                                         self.revision_data['rev']):
                 self.process(data)
-                continue
-            data = [UnifiedDiff.DIFF_HEADER % filename]
-            with open(old_filename) as f:
-                old = f.readlines()
-            with open(wc_filename) as f:
-                wc = f.readlines()
-            diff = unified_diff(old, wc, fromfile=fromfile, tofile=tofile)
-            # hmm is it possible to avoid the conversion?
-            diff = list(diff)
-            if len(diff) >= 1:
-                diff[0] = diff[0].replace(' \n', '\n')
-                diff[1] = diff[1].replace(' \n', '\n')
-            data.extend(diff)
-            self._fixup_newline(data)
-            self.process(data)
 
     def _diff_missing(self):
         for filename in self.missing:
@@ -373,6 +1108,45 @@ class FileSkipHandler(object):
         raise NotImplementedError()
 
 
+class SparseSkipHandler(FileSkipHandler):
+    """Skips large files and files which match certain patterns.
+
+    This can be used for a sparse checkout: the skipped files are
+    tracked as placeholders (state 'S') and can be downloaded on
+    demand via the Package's fetch method. Only new files are
+    skipped, that is files which are already checked out are
+    still updated.
+
+    """
+
+    def __init__(self, max_size=None, patterns=None):
+        """Constructs a new SparseSkipHandler object.
+
+        Keyword arguments:
+        max_size -- files which are larger than max_size bytes are
+                    skipped (default: None (no size limit))
+        patterns -- a list of fnmatch patterns; files whose name
+                    matches a pattern are skipped (default: None)
+
+        """
+        super(SparseSkipHandler, self).__init__()
+        self.max_size = max_size
+        self.patterns = patterns or []
+
+    def _skip(self, filename, entry):
+        if (self.max_size is not None
+                and int(entry.get('size', 0)) > self.max_size):
+            return True
+        for pattern in self.patterns:
+            if fnmatch.fnmatch(filename, pattern):
+                return True
+        return False
+
+    def skip(self, uinfo):
+        skips = [f for f in uinfo.added if self._skip(f, uinfo.data[f])]
+        return skips, []
+
+
 class FileCommitPolicy(object):
     """Used to manipulate the calculated commitinfo."""
 
@@ -396,6 +1170,7 @@ class PackageUpdateState(XMLTransactionState, UpdateStateMixin):
                                                  uinfo, xml_data, **states)
         if xml_data is None:
             self._xml.append(uinfo.remote_xml)
+            self._write()
 
     def _listnames(self):
         return ('unchanged', 'added', 'deleted', 'modified',
@@ -409,7 +1184,7 @@ class PackageUpdateState(XMLTransactionState, UpdateStateMixin):
         data = {}
         for filenames in lists.itervalues():
             for filename in filenames:
-                elm = directory.find("//entry[@name='%s']" % filename)
+                elm = directory.find('//entry[@name = $name]', name=filename)
                 data[filename] = elm
         return FileUpdateInfo(data=data, remote_xml=directory, **lists)
 
@@ -477,7 +1252,8 @@ class Package(WorkingCopy):
     """Represents a package working copy."""
 
     def __init__(self, path, skip_handlers=None, commit_policies=None,
-                 merge_class=Merge, verify_format=True, **kwargs):
+                 merge_class=Merge, verify_format=True,
+                 transfer_workers=1, **kwargs):
         """Constructs a new package object.
 
         path is the path to the working copy.
@@ -494,6 +1270,8 @@ class Package(WorkingCopy):
         merge_class -- class which is used for a file merge
                        (default: Merge)
         verify_format -- verify working copy format (default: True)
+        transfer_workers -- the maximum number of files which are
+                            transferred concurrently (default: 1)
         **kwargs -- see class WorkingCopy for the details
 
         """
@@ -508,12 +1286,26 @@ class Package(WorkingCopy):
         self.skip_handlers = skip_handlers or []
         self.commit_policies = commit_policies or []
         self.merge_class = merge_class
+        self.transfer_workers = transfer_workers
+        self._md5cache = FileMD5Cache(path)
+        self._object_store = wc_object_store(path)
         with wc_lock(path):
             self._files = wc_read_files(path)
         # call super at the end due to finish_pending_transaction
         super(Package, self).__init__(path, PackageUpdateState,
                                       PackageCommitState, **kwargs)
 
+    def _blob_cache(self):
+        """Return a BlobCache which is seeded with the store files."""
+        cache = BlobCache(self.path)
+        for entry in self._files:
+            md5 = entry.get('md5')
+            if not md5 or entry.get('state') == 'A':
+                continue
+            filename = wc_pkg_data_filename(self.path, entry.get('name'))
+            cache.seed(md5, filename)
+        return cache
+
     def files(self):
         """Return list of filenames which are tracked."""
         filenames = []
@@ -548,7 +1340,7 @@ class Package(WorkingCopy):
             return 'D'
         elif st != 'S' and not exists:
             return '!'
-        elif st == ' ' and entry.get('md5') != file_md5(fname):
+        elif st == ' ' and entry.get('md5') != self._md5cache.md5(filename):
             return 'M'
         return st
 
@@ -695,8 +1487,9 @@ class Package(WorkingCopy):
                 my_filename = wc_filename + '.mine'
                 # a rename would be more efficient but also more error prone
                 # (if a update is interrupted)
-                copy_file(wc_filename, my_filename)
+                clone_file(wc_filename, my_filename)
             merge = self.merge_class()
+            merge.scan = self._merge_scan(filename, my_filename, old_filename)
             ret = merge.merge(my_filename, old_filename, your_filename,
                               wc_filename)
             if ret == Merge.SUCCESS:
@@ -706,19 +1499,40 @@ class Package(WorkingCopy):
                     ustate.processed(filename, ' ')
                 os.unlink(my_filename)
             elif ret in (Merge.CONFLICT, Merge.BINARY, Merge.FAILURE):
-                copy_file(your_filename, wc_filename + '.rev%s' % uinfo.srcmd5)
+                rev_filename = wc_filename + '.rev%s' % uinfo.srcmd5
+                clone_file(your_filename, rev_filename)
                 ustate.processed(filename, 'C')
             # copy over new storefile
             os.rename(your_filename, old_filename)
             self.notifier.processed(filename, ustate.entrystates[filename], st)
 
+    def _merge_scan(self, filename, my_filename, old_filename):
+        """Return a scan function for the merge of filename.
+
+        The scans of my_filename (a copy of the wc file) and
+        old_filename (the store file) are looked up in the
+        FileMD5Cache. For all other files (for instance, the freshly
+        downloaded file) None is returned, so that the merge only
+        does a cheap binary check instead of a full scan.
+
+        """
+        store_filename = os.path.relpath(old_filename, self.path)
+
+        def scan(fname):
+            if fname == old_filename:
+                return self._md5cache.scan(store_filename)
+            elif fname == my_filename:
+                return self._md5cache.scan(filename)
+            return None
+        return scan
+
     def _perform_adds(self, ustate):
         uinfo = ustate.info
         for filename in uinfo.added:
             wc_filename = os.path.join(self.path, filename)
             store_filename = wc_pkg_data_filename(self.path, filename)
             new_filename = os.path.join(ustate.location, filename)
-            copy_file(new_filename, wc_filename)
+            clone_file(new_filename, wc_filename)
             ustate.processed(filename, ' ')
             os.rename(new_filename, store_filename)
             self.notifier.processed(filename, ' ', None)
@@ -737,9 +1551,10 @@ class Package(WorkingCopy):
             store_md5 = ''
             st = self.status(filename)
             if os.path.exists(store_filename):
-                store_md5 = file_md5(store_filename)
+                store_md5 = self._md5cache.md5(
+                    os.path.relpath(store_filename, self.path))
             if (os.path.isfile(wc_filename)
-                    and file_md5(wc_filename) == store_md5):
+                    and self._md5cache.md5(filename) == store_md5):
                 os.unlink(wc_filename)
             if store_md5:
                 os.unlink(store_filename)
@@ -747,11 +1562,62 @@ class Package(WorkingCopy):
             self.notifier.processed(filename, new_state, st)
 
     def _download(self, location, data, *filenames):
-        for filename in filenames:
+        def download(filename):
             path = os.path.join(location, filename)
+            md5 = data[filename].get('md5')
+            if self._link_object(md5, path):
+                return None
             f = data[filename].file(apiurl=self.apiurl)
-            self.notifier.transfer('download', filename)
             f.write_to(path)
+            self._add_object(md5, path)
+            return filename
+
+        # the listeners are notified in the calling thread
+        for filename in parallel.imap(download, filenames,
+                                      workers=self.transfer_workers):
+            if filename is not None:
+                self.notifier.transfer('download', filename)
+
+    def _link_object(self, md5, path):
+        """Hardlink the object md5 from the object store to path.
+
+        Return True if the object exists. Otherwise False is returned.
+        If a hardlink is not possible, the object is cloned.
+
+        """
+        if self._object_store is None or not md5:
+            return False
+        obj = os.path.join(self._object_store, md5)
+        if not os.path.isfile(obj):
+            return False
+        if os.path.lexists(path):
+            os.unlink(path)
+        try:
+            os.link(obj, path)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            clone_file(obj, path)
+        return True
+
+    def _add_object(self, md5, path):
+        """Add the file path to the object store (as object md5).
+
+        The file is only added if its md5sum is md5.
+
+        """
+        if self._object_store is None or not md5:
+            return
+        obj = os.path.join(self._object_store, md5)
+        if os.path.exists(obj) or file_md5(path) != md5:
+            return
+        try:
+            os.link(path, obj)
+        except OSError as e:
+            # EEXIST: the object was added concurrently
+            if e.errno not in (errno.EEXIST, errno.EXDEV, errno.EPERM,
+                               errno.EMLINK):
+                raise
 
     def is_modified(self):
         cinfo = self._calculate_commitinfo()
@@ -868,6 +1734,7 @@ class Package(WorkingCopy):
                 filelist = self._commit_filelist(cfilelist, **kwargs)
             else:
                 filelist = missing
+            self._commit_unsent_files(cstate, cinfo, send_filenames)
             cstate.append_filelist(filelist)
             cstate.state = CommitStateMixin.STATE_COMMITTING
         # only local changes left
@@ -885,7 +1752,7 @@ class Package(WorkingCopy):
             if os.path.exists(store_filename):
                 # just to reduce disk space usage
                 os.unlink(store_filename)
-            copy_file(commit_filename, wc_filename)
+            clone_file(commit_filename, wc_filename)
             os.rename(commit_filename, store_filename)
         self._files.merge(cstate.entrystates, cstate.filelist)
         # fixup mtimes
@@ -913,8 +1780,7 @@ class Package(WorkingCopy):
                 continue
             _append_entry(xml, self._files.find(filename))
         for filename in cinfo.added + cinfo.modified:
-            wc_filename = os.path.join(self.path, filename)
-            md5 = file_md5(wc_filename)
+            md5 = self._md5cache.md5(filename)
             _append_entry(xml, {'name': filename, 'md5': md5})
         xml_data = etree.tostring(xml, pretty_print=True)
         return xml_data
@@ -942,17 +1808,64 @@ class Package(WorkingCopy):
         return send_filenames
 
     def _commit_files(self, cstate, send_filenames):
-        for filename in send_filenames:
-            st = self.status(filename)
+        """Upload the files send_filenames.
+
+        Each upload is recorded in the commit state as soon as it is
+        finished. If an upload fails, the remaining uploads are still
+        done and recorded before the error is re-raised.
+        Note: an interrupted transfer is rolled back by the next
+        commit, which only sends the files that the server still
+        reports as missing.
+
+        """
+        def upload(filename):
             wc_filename = os.path.join(self.path, filename)
             path = "/source/%s/%s/%s" % (self.project, self.name, filename)
-            lfile = RWLocalFile(wc_filename, wb_path=path, append=True)
+            try:
+                lfile = RWLocalFile(wc_filename, wb_path=path, append=True)
+                lfile.write_back(force=True, rev='repository',
+                                 apiurl=self.apiurl)
+            except Exception:
+                return filename, None, sys.exc_info()
+            return filename, lfile, None
+
+        states = dict([(f, self.status(f)) for f in send_filenames])
+        # the uploads are done concurrently but the commit state and
+        # the listeners are only updated in the calling thread
+        uploads = parallel.imap_unordered(upload, send_filenames,
+                                          workers=self.transfer_workers)
+        error = None
+        for filename, lfile, exc_info in uploads:
+            if exc_info is not None:
+                if error is None:
+                    error = exc_info
+                continue
             self.notifier.transfer('upload', filename)
-            lfile.write_back(force=True, rev='repository', apiurl=self.apiurl)
             cstate.processed(filename, ' ')
             commit_filename = os.path.join(cstate.location, filename)
             # move wcfile into transaction dir
             os.rename(lfile.path, commit_filename)
+            self.notifier.processed(filename, ' ', states[filename])
+        if error is not None:
+            raise error[0], error[1], error[2]
+
+    def _commit_unsent_files(self, cstate, cinfo, send_filenames):
+        """Process the added and modified files which were not sent.
+
+        The server already knows these files (for instance, because
+        they were uploaded by an interrupted commit whose transfer was
+        rolled back). Their wc files are copied into the transaction
+        dir, so that the store files are updated as well.
+
+        """
+        for filename in cinfo.added + cinfo.modified:
+            commit_filename = os.path.join(cstate.location, filename)
+            if filename in send_filenames or os.path.exists(commit_filename):
+                continue
+            st = self.status(filename)
+            wc_filename = os.path.join(self.path, filename)
+            clone_file(wc_filename, commit_filename)
+            cstate.processed(filename, ' ')
             self.notifier.processed(filename, ' ', st)
 
     def latest_revision(self):
@@ -1016,12 +1929,64 @@ class Package(WorkingCopy):
         elif st == 'D':
             self._files.set(filename, ' ')
             if not os.path.exists(wc_filename):
-                copy_file(store_filename, wc_filename)
+                clone_file(store_filename, wc_filename)
         elif st in ('M', '!'):
             self._files.set(filename, ' ')
-            copy_file(store_filename, wc_filename)
+            clone_file(store_filename, wc_filename)
         self._files.write()
 
+    @no_pending_transaction
+    def fetch(self, *filenames):
+        """Download skipped files.
+
+        The skipped files (state 'S'), for instance the placeholders
+        of a sparse checkout (see SparseSkipHandler), are downloaded
+        in the wc's current revision and are not skipped anymore.
+        If no filenames are specified, all skipped files are fetched.
+        A ValueError is raised if a file is not skipped. A
+        FileConflictError is raised if an untracked file with the
+        same name but a different content exists in the working copy.
+
+        """
+        with wc_lock(self.path):
+            if not filenames:
+                filenames = [f for f in self.files()
+                             if self.status(f) == 'S']
+            invalid = [f for f in filenames if self.status(f) != 'S']
+            if invalid:
+                msg = "files not skipped: %s" % ', '.join(invalid)
+                raise ValueError(msg)
+            conflicts = []
+            for filename in filenames:
+                wc_filename = os.path.join(self.path, filename)
+                md5 = self._files.find(filename).get('md5')
+                # the file might be fetched by an interrupted fetch call
+                if (os.path.exists(wc_filename)
+                        and self._md5cache.md5(filename) != md5):
+                    conflicts.append(filename)
+            if conflicts:
+                raise FileConflictError(conflicts)
+
+            def fetch(filename):
+                entry = self._files.find(filename)
+                md5 = entry.get('md5')
+                store_filename = wc_pkg_data_filename(self.path, filename)
+                downloaded = False
+                if not self._link_object(md5, store_filename):
+                    entry.file(apiurl=self.apiurl).write_to(store_filename)
+                    self._add_object(md5, store_filename)
+                    downloaded = True
+                clone_file(store_filename, os.path.join(self.path, filename))
+                return filename, downloaded
+
+            # the listeners are notified in the calling thread
+            for filename, downloaded in parallel.imap(
+                    fetch, filenames, workers=self.transfer_workers):
+                if downloaded:
+                    self.notifier.transfer('download', filename)
+                self._files.set(filename, ' ')
+            self._files.write()
+
     def add(self, filename):
         """Add filename to working copy.
 
@@ -1082,6 +2047,10 @@ class Package(WorkingCopy):
         self._files.set(filename, 'D')
         self._files.write()
 
+    def revision_data(self):
+        """Return a dict which contains the wc's revision data."""
+        return self._files.revision_data()
+
     def is_link(self):
         """Return True if the package is a source link."""
         return self._files.is_link()
@@ -1126,6 +2095,7 @@ class Package(WorkingCopy):
         if not filenames:
             filenames = self.files()
         diff.wc_path = self.path
+        diff._file_cache = self._md5cache
         diff.revision_data = self._files.revision_data()
         if revision:
             spkg = SourcePackage(self.project, self.name)
@@ -1150,6 +2120,7 @@ class Package(WorkingCopy):
             info.conflicted.extend(missing)
             info.deleted.extend(deleted)
             diff._remote_files = directory
+            diff._blob_cache = self._blob_cache()
             srcmd5 = directory.get('srcmd5')
             diff.old_path = wc_diff_mkdir(self.path, srcmd5)
             diff.revision_data = {'rev': revision, 'srcmd5': srcmd5}
@@ -1198,7 +2169,8 @@ class Package(WorkingCopy):
         return (missing, '', pkg_data)
 
     @staticmethod
-    def repair(path, ext_storedir=None, revision='latest', **kwargs):
+    def repair(path, ext_storedir=None, revision='latest', workers=1,
+               **kwargs):
         """Repair a working copy.
 
         path is the path to the package working copy.
@@ -1209,6 +2181,8 @@ class Package(WorkingCopy):
         apiurl -- apiurl is the apiurl (default: '')
         revision -- the revision of the package (default: 'latest')
         ext_storedir -- path to the storedir (default: None)
+        workers -- the maximum number of missing files which are
+                   downloaded concurrently (default: 1)
 
         """
         global _PKG_DATA
@@ -1238,10 +2212,14 @@ class Package(WorkingCopy):
         files = wc_read_files(path)
         # check again - only pkg_data left
         missing, xml_data, pkg_data = Package.wc_check(path)
-        for filename in pkg_data:
+
+        def download(filename):
             fname = wc_pkg_data_filename(path, filename)
             f = files.find(filename).file()
             f.write_to(fname)
+
+        for _ in parallel.imap(download, pkg_data, workers=workers):
+            pass
         # clean unused storefiles
         store = wc_pkg_data_filename(path, '')
         for filename in os.listdir(store):
@@ -2,9 +2,12 @@
 
 import os
 import shutil
+import threading
+import itertools
 
 from osc2.wc.base import (WorkingCopy, UpdateStateMixin, CommitStateMixin,
-                          PendingTransactionError, FileConflictError)
+                          PendingTransactionError, FileConflictError,
+                          TransactionNotifier)
 from osc2.wc.package import Package
 from osc2.wc.util import (wc_read_project, wc_read_apiurl, wc_read_packages,
                           wc_init, wc_write_apiurl, wc_write_project,
@@ -12,10 +15,12 @@ from osc2.wc.util import (wc_read_project, wc_read_apiurl, wc_read_packages,
                           WCInconsistentError, wc_is_project, wc_is_package,
                           wc_pkg_data_mkdir, XMLTransactionState, _storedir,
                           _STORE, wc_pkg_data_filename, wc_verify_format,
-                          _PKG_DATA, wc_write_version)
+                          _PKG_DATA, wc_write_version, _storefile,
+                          wc_init_object_store)
 from osc2.source import Project as SourceProject
 from osc2.remote import RemotePackage
 from osc2.util.listinfo import ListInfo
+from osc2.util import parallel
 
 
 class PackageUpdateInfo(ListInfo):
@@ -66,15 +71,73 @@ class ProjectUpdateState(XMLTransactionState, UpdateStateMixin):
         initial_state = UpdateStateMixin.STATE_PREPARE
         super(ProjectUpdateState, self).__init__(path, 'update', initial_state,
                                                  uinfo, xml_data, **states)
+        # packages might be processed concurrently
+        self._lock = threading.RLock()
+        if xml_data is None:
+            self._xml.append(self._xml.makeelement('updating'))
+            self._write()
 
     def _listnames(self):
         # it would be sufficient to store only added and deleted
         return ('candidates', 'added', 'deleted', 'conflicted')
 
+    @property
+    def updating(self):
+        """Return the list of packages which are currently updated.
+
+        That is the package's update transaction was finished (or
+        is a delete) but the package was not processed yet.
+
+        """
+        elm = self._xml.find('updating')
+        if elm is not None:
+            return [pkg.get('name') for pkg in elm.iterchildren()]
+        elif self.state != UpdateStateMixin.STATE_UPDATING:
+            return []
+        # state was written by an older version: only a single
+        # package can be in the update state
+        lists = self._lists()
+        for listname in self._listnames():
+            if lists[listname]:
+                return [lists[listname][0]]
+        return []
+
+    def mark_updating(self, package):
+        """Mark package as updating.
+
+        Afterwards the transaction is in state STATE_UPDATING
+        (until all updating packages are processed).
+
+        """
+        with self._lock:
+            self._journal(('updating', package))
+            self.state = UpdateStateMixin.STATE_UPDATING
+
     def processed(self, package, new_state=None):
-        # directly set state back to STATE_PREPARE
-        self.state = UpdateStateMixin.STATE_PREPARE
-        super(ProjectUpdateState, self).processed(package, new_state)
+        with self._lock:
+            updating = [p for p in self.updating if p != package]
+            if not updating:
+                # directly set state back to STATE_PREPARE
+                self.state = UpdateStateMixin.STATE_PREPARE
+            super(ProjectUpdateState, self).processed(package, new_state)
+
+    def _apply(self, record):
+        super(ProjectUpdateState, self)._apply(record)
+        if record[0] not in ('updating', 'processed'):
+            return
+        elm = self._xml.find('updating')
+        if elm is None and record[0] == 'processed':
+            return
+        elif elm is None:
+            elm = self._xml.makeelement('updating')
+            self._xml.append(elm)
+        pkgs = [pkg for pkg in elm.iterchildren()
+                if pkg.get('name') == record[1]]
+        if record[0] == 'updating' and not pkgs:
+            elm.append(elm.makeelement('package', name=record[1]))
+        elif record[0] == 'processed':
+            for pkg in pkgs:
+                elm.remove(pkg)
 
     @property
     def info(self):
@@ -94,6 +157,28 @@ class ProjectUpdateState(XMLTransactionState, UpdateStateMixin):
         return False
 
 
+class _SynchronizedListener(object):
+    """Serializes the calls to a transaction listener.
+
+    Used if a transaction listener is notified by concurrently
+    running package transactions.
+
+    """
+
+    def __init__(self, listener, lock):
+        super(_SynchronizedListener, self).__init__()
+        self._listener = listener
+        self._lock = lock
+
+    def __getattr__(self, name):
+        meth = getattr(self._listener, name)
+
+        def synchronized(*args, **kwargs):
+            with self._lock:
+                return meth(*args, **kwargs)
+        return synchronized
+
+
 class ProjectCommitState(XMLTransactionState, CommitStateMixin):
 
     def __init__(self, path, cinfo=None, xml_data=None, **states):
@@ -155,6 +240,10 @@ class Project(WorkingCopy):
         self.name = wc_read_project(path)
         with wc_lock(path):
             self._packages = wc_read_packages(path)
+        # maps a package name to a (cache key, Package) tuple
+        self._package_cache = {}
+        # the package method might be called concurrently
+        self._package_cache_lock = threading.Lock()
         super(Project, self).__init__(path, ProjectUpdateState,
                                       ProjectCommitState, **kwargs)
 
@@ -193,50 +282,95 @@ class Project(WorkingCopy):
         return []
 
     def _calculate_updateinfo(self, *packages):
+        """Return a PackageUpdateInfo object.
+
+        The remote and the local packages are classified in a single
+        pass (membership tests are done with sets and each package's
+        state is only computed once). If packages are specified, only
+        these packages are considered.
+
+        """
         added = []
         deleted = []
         candidates = []
         conflicted = []
         sprj = SourceProject(self.name)
-        remote_pkgs = [pkg.name for pkg in sprj.list(apiurl=self.apiurl)]
-        local_pkgs = self.packages()
-        for package in remote_pkgs:
-            if package in local_pkgs:
-                candidates.append(package)
-            else:
-                added.append(package)
-        for package in local_pkgs:
-            st = self._status(package)
-            pkg = self.package(package)
-            if pkg is not None and not pkg.is_updateable():
-                conflicted.append(package)
-            elif st != 'A' and package not in remote_pkgs:
-                deleted.append(package)
-        # check for conflicts
-        for package in candidates[:]:
+        remote_pkgs = sprj.list(names_only=True, apiurl=self.apiurl)
+        remote = set(remote_pkgs)
+        wanted = set(packages)
+        local_only = [p for p in self.packages() if p not in remote]
+
+        def updateable(package):
             pkg = self.package(package)
-            if (self._status(package) in ('A', '!')
-                    or not pkg.is_updateable()):
-                conflicted.append(package)
-                candidates.remove(package)
-        for package in added[:]:
-            path = os.path.join(self.path, package)
+            return pkg is None or pkg.is_updateable()
+
+        for package in itertools.chain(remote_pkgs, local_only):
+            if wanted and package not in wanted:
+                continue
             st = self._status(package)
-            if st == '?' and os.path.exists(path):
+            if package not in remote:
+                if not updateable(package):
+                    conflicted.append(package)
+                elif st != 'A':
+                    deleted.append(package)
+            elif st == '?':
+                path = os.path.join(self.path, package)
+                if os.path.exists(path):
+                    conflicted.append(package)
+                else:
+                    added.append(package)
+            elif st in ('A', '!') or not updateable(package):
                 conflicted.append(package)
-                added.remove(package)
-        if packages:
-            # only consider specified packages
-            candidates = [p for p in candidates if p in packages]
-            added = [p for p in added if p in packages]
-            deleted = [p for p in deleted if p in packages]
-            conflicted = [p for p in conflicted if p in packages]
+            else:
+                candidates.append(package)
         return PackageUpdateInfo(self.name, candidates, added, deleted,
                                  conflicted)
 
+    def _remove_unchanged(self, uinfo, packages, revision='latest',
+                          **kwargs):
+        """Remove the unchanged packages from the candidates.
+
+        A candidate is unchanged if its local srcmd5 matches the
+        remote srcmd5 and none of its files is missing. The remote
+        srcmd5s of all packages are retrieved with a single request
+        (instead of one request per candidate). If packages are
+        specified, the request is limited to the candidates.
+        Nothing is removed if a specific revision or an additional
+        query parameter (except expand) is requested or if there is
+        at most one candidate (a batched check saves no request).
+
+        Keyword arguments:
+        revision -- the requested revision (default: 'latest')
+        **kwargs -- the query parameters of the package updates
+
+        """
+        if (revision not in (None, 'latest') or len(uinfo.candidates) < 2
+                or [k for k in kwargs.keys() if k != 'expand']):
+            return
+        query = {}
+        if packages:
+            query['package'] = list(uinfo.candidates)
+        sprj = SourceProject(self.name)
+        sourceinfo = sprj.sourceinfo(apiurl=self.apiurl, **query)
+        # lsrcmd5 is the srcmd5 of the unexpanded link
+        key = 'lsrcmd5'
+        if kwargs.get('expand'):
+            key = 'srcmd5'
+        for package in uinfo.candidates[:]:
+            info = sourceinfo.get(package)
+            if info is None or 'error' in info:
+                continue
+            remote = info.get(key, info.get('srcmd5'))
+            pkg = self.package(package)
+            if remote != pkg.revision_data().get('srcmd5'):
+                continue
+            if '!' in [pkg.status(f) for f in pkg.files()]:
+                continue
+            uinfo.candidates.remove(package)
+
     def _clear_uinfo(self, ustate):
-        self._clear_info(ustate, 'candidates', 'added', 'deleted',
-                         'conflicted')
+        # do not start any new transaction
+        ustate.clear_info(*ustate.updating)
 
     def _clear_cinfo(self, cstate):
         self._clear_info(cstate, 'unchanged', 'added', 'deleted',
@@ -261,10 +395,16 @@ class Project(WorkingCopy):
         will be updated.
 
         Keyword arguments:
+        workers -- the maximum number of packages which are updated
+                   concurrently (default: 1)
+        skip_handlers -- list of FileSkipHandler objects which are
+                         used for the package updates (default: None)
         **kwargs -- optional keyword arguments which will be passed
                     to the Package's update method
 
         """
+        workers = kwargs.pop('workers', 1)
+        skip_handlers = kwargs.pop('skip_handlers', None)
         with wc_lock(self.path):
             ustate = ProjectUpdateState.read_state(self.path)
             if not self.is_updateable(rollback=True):
@@ -272,7 +412,8 @@ class Project(WorkingCopy):
             if (ustate is not None
                     and ustate.state == UpdateStateMixin.STATE_UPDATING):
                 self._clear_uinfo(ustate)
-                self._update(ustate)
+                self._update(ustate, workers=workers,
+                             skip_handlers=skip_handlers)
             else:
                 uinfo = self._calculate_updateinfo(*packages)
                 conflicts = uinfo.conflicted
@@ -280,33 +421,57 @@ class Project(WorkingCopy):
                     # a package might be in conflicts because
                     # its is_updateable method returned False
                     raise FileConflictError(conflicts)
+                if skip_handlers is None:
+                    # a skip handler might unskip files of an unchanged
+                    # package
+                    self._remove_unchanged(uinfo, packages, **kwargs)
                 if not self._transaction_begin('prj_update', uinfo):
                     return
                 states = dict([(p, self._status(p)) for p in self.packages()])
                 ustate = ProjectUpdateState(self.path, uinfo=uinfo, **states)
-                self._update(ustate, **kwargs)
+                self._update(ustate, workers=workers,
+                             skip_handlers=skip_handlers, **kwargs)
                 self.notifier.finished('prj_update', aborted=False)
 
-    def _update(self, ustate, **kwargs):
-        self._perform_adds(ustate, **kwargs)
+    def _update(self, ustate, workers=1, skip_handlers=None, **kwargs):
+        self._perform_adds(ustate, workers=workers,
+                           skip_handlers=skip_handlers, **kwargs)
         self._perform_deletes(ustate)
-        self._perform_candidates(ustate, **kwargs)
+        self._perform_candidates(ustate, workers=workers,
+                                 skip_handlers=skip_handlers, **kwargs)
         self._packages.merge(ustate.entrystates)
         ustate.cleanup()
 
-    def _perform_adds(self, ustate, **kwargs):
+    def _notifier(self, workers):
+        """Return a TransactionNotifier for package transactions.
+
+        If workers is greater than 1, the calls to the transaction
+        listeners are serialized.
+
+        """
+        listener = self.notifier.listener
+        if workers > 1:
+            lock = threading.RLock()
+            listener = [_SynchronizedListener(l, lock) for l in listener]
+        return TransactionNotifier(listener)
+
+    def _perform_adds(self, ustate, workers=1, skip_handlers=None,
+                      **kwargs):
         uinfo = ustate.info
-        tl = self.notifier.listener
-        for package in uinfo.added:
+        updating = ustate.updating
+        notifier = self._notifier(workers)
+
+        def add(package):
             tmp_dir = os.path.join(ustate.location, package)
             storedir = wc_pkg_data_filename(self.path, package)
-            if ustate.state == UpdateStateMixin.STATE_PREPARE:
+            if package not in updating:
                 os.mkdir(storedir)
                 pkg = Package.init(tmp_dir, self.name, package,
                                    self.apiurl, storedir,
-                                   transaction_listener=tl)
+                                   transaction_listener=notifier.listener,
+                                   skip_handlers=skip_handlers)
                 pkg.update(**kwargs)
-                ustate.state = UpdateStateMixin.STATE_UPDATING
+                ustate.mark_updating(package)
             # fixup symlink
             new_dir = os.path.join(self.path, package)
             path = os.path.relpath(storedir, new_dir)
@@ -317,7 +482,10 @@ class Project(WorkingCopy):
                 os.symlink(path, old_storelink)
                 os.rename(tmp_dir, new_dir)
             ustate.processed(package, ' ')
-            self.notifier.processed(package, ' ', None)
+            notifier.processed(package, ' ', None)
+
+        for _ in parallel.imap(add, uinfo.added, workers=workers):
+            pass
 
     def _perform_deletes(self, ustate):
         global _STORE
@@ -325,7 +493,7 @@ class Project(WorkingCopy):
         for package in uinfo.deleted:
             st = self._status(package)
             # a delete is always possible
-            ustate.state = UpdateStateMixin.STATE_UPDATING
+            ustate.mark_updating(package)
             # XXX: None is not a good idea
             self.notifier.begin('update', None)
             self._remove_wc_dir(package, notify=True)
@@ -333,11 +501,15 @@ class Project(WorkingCopy):
             self.notifier.finished('update', aborted=False)
             self.notifier.processed(package, None, st)
 
-    def _perform_candidates(self, ustate, **kwargs):
+    def _perform_candidates(self, ustate, workers=1, skip_handlers=None,
+                            **kwargs):
         uinfo = ustate.info
-        tl = self.notifier.listener
-        for package in uinfo.candidates:
-            pkg = self.package(package, transaction_listener=tl)
+        notifier = self._notifier(workers)
+
+        def update(package):
+            pkg = self.package(package,
+                               transaction_listener=notifier.listener,
+                               skip_handlers=skip_handlers)
             # pkg should never ever be None at this point
             if pkg is None:
                 msg = "package \"%s\" is an invalid candidate." % package
@@ -346,7 +518,10 @@ class Project(WorkingCopy):
             # FIXME: is ' ' the correct state?
             ustate.processed(package, ' ')
             # FIXME: old state should be self._status(package)
-            self.notifier.processed(package, ' ', ' ')
+            notifier.processed(package, ' ', ' ')
+
+        for _ in parallel.imap(update, uinfo.candidates, workers=workers):
+            pass
 
     def _remove_wc_dir(self, package, notify=False):
         pkg = self.package(package)
@@ -613,13 +788,50 @@ class Project(WorkingCopy):
 
         *args and **kwargs are additional arguments for the
         Package's __init__ method.
+        If neither args nor kwargs are specified, the Package object
+        is cached until the package's _files or its transaction state
+        changes. This method is thread-safe.
 
         """
         path = os.path.join(self.path, package)
         st = self._status(package)
         if st in ('!', '?') or not wc_is_package(path):
+            with self._package_cache_lock:
+                self._package_cache.pop(package, None)
             return None
-        return Package(path, *args, **kwargs)
+        if args or kwargs:
+            return Package(path, *args, **kwargs)
+        key = self._package_cache_key(path)
+        with self._package_cache_lock:
+            cached = self._package_cache.get(package)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        # the Package is constructed without holding the lock (at worst,
+        # a package is constructed twice by concurrent calls)
+        pkg = Package(path)
+        # the key might have changed (pending transaction)
+        key = self._package_cache_key(path)
+        with self._package_cache_lock:
+            self._package_cache[package] = (key, pkg)
+        return pkg
+
+    def _package_cache_key(self, path):
+        """Return the cache key for the package wc path.
+
+        The key consists of the stat data of the package's _files
+        and transaction storefiles.
+
+        """
+        key = []
+        for filename in ('_files', XMLTransactionState.FILENAME,
+                         XMLTransactionState.JOURNAL):
+            try:
+                st = os.stat(_storefile(path, filename))
+            except OSError:
+                key.append(None)
+                continue
+            key.append((st.st_ino, st.st_size, st.st_mtime))
+        return tuple(key)
 
     @classmethod
     def wc_check(cls, path):
@@ -708,9 +920,17 @@ class Project(WorkingCopy):
         *args and **kwargs are additional arguments for the
         Project's __init__ method.
 
+        Keyword arguments:
+        object_store -- if True, identical files of the project's
+                        packages are shared via a project-wide object
+                        store (see wc_object_store) (default: False)
+
         """
+        object_store = kwargs.pop('object_store', False)
         wc_init(path)
         wc_write_project(path, project)
         wc_write_apiurl(path, apiurl)
         wc_write_packages(path, '<packages/>')
+        if object_store:
+            wc_init_object_store(path)
         return Project(path, *args, **kwargs)
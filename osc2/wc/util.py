@@ -8,6 +8,7 @@ import os
 import errno
 import fcntl
 import shutil
+import urllib
 
 from lxml import etree, objectify
 
@@ -15,7 +16,6 @@ from osc2.wc.base import AbstractTransactionState
 from osc2.source import File, Directory, Linkinfo
 from osc2.util.io import mkstemp
 from osc2.util.xml import fromstring
-from osc2.util.xpath import XPathBuilder
 
 __all__ = ['wc_is_project', 'wc_is_package', 'wc_read_project',
            'wc_read_package', 'wc_read_apiurl']
@@ -24,6 +24,7 @@ __all__ = ['wc_is_project', 'wc_is_package', 'wc_read_project',
 _STORE = '.osc'
 _PKG_DATA = 'data'
 _DIFF_DATA = 'diff'
+_OBJECTS = 'objects'
 _LOCK = 'wc.lock'
 _VERSION = 2.0
 
@@ -213,8 +214,17 @@ class XMLEntryTracker(AbstractEntryTracker):
         self._path = path
         xml_data = _read_storefile(self._path, filename)
         # XXX: validation
-        self._xml = self._fromstring(xml_data)
         self._tag = entry_tag
+        self._set_xml(self._fromstring(xml_data))
+
+    def _set_xml(self, xml):
+        """Set the xml tree and (re)build the name -> entry index."""
+        self._xml = xml
+        self._index = {}
+        for elm in xml.iterdescendants(self._tag):
+            # keep the first entry (in document order) if a name
+            # is not unique
+            self._index.setdefault(elm.get('name'), elm)
 
     def add(self, name, state):
         if self.find(name) is not None:
@@ -222,17 +232,16 @@ class XMLEntryTracker(AbstractEntryTracker):
         elm = self._xml.makeelement(self._tag, name=name,
                                     state=state)
         self._xml.append(elm)
+        self._index[name] = elm
 
     def remove(self, name):
-        elm = self.find(name)
+        elm = self._index.pop(name, None)
         if elm is None:
             raise ValueError("entry \"%s\" does not exist" % name)
-        self._xml.remove(elm)
+        elm.getparent().remove(elm)
 
     def find(self, name):
-        xpb = XPathBuilder()
-        xp = xpb.descendant(self._tag)[xpb.attr('name') == name]
-        return self._xml.find(xp.tostring())
+        return self._index.get(name)
 
     def set(self, name, new_state):
         entry = self.find(name)
@@ -281,9 +290,8 @@ class XMLPackageTracker(XMLEntryTracker):
                 self.add(package, st)
             else:
                 self.set(package, st)
-        for package in self._xml.findall(self._tag):
-            name = package.get('name')
-            if name not in new_states.keys():
+        for name in self._index.keys():
+            if name not in new_states:
                 self.remove(name)
         self.write()
 
@@ -301,7 +309,7 @@ class XMLFileTracker(XMLEntryTracker):
         if (len(filenames) != len(st_filenames)
                 or set(filenames) != set(st_filenames)):
             raise ValueError("data of new_states and new_entries mismatch")
-        self._xml = new_entries
+        self._set_xml(new_entries)
         for filename, st in new_states.iteritems():
             if st == 'A':
                 # add files with state 'A' again
@@ -332,7 +340,19 @@ class XMLFileTracker(XMLEntryTracker):
 
 
 class XMLTransactionState(AbstractTransactionState):
-    """Represents the state of a transaction"""
+    """Represents the state of a transaction.
+
+    The initial state is stored as xml. The progress of the transaction
+    (processed entries and state changes) is appended to a journal
+    file, which is replayed when the state is read again. This avoids
+    rewriting the complete xml file for each processed entry.
+
+    """
+    JOURNAL = os.path.join(AbstractTransactionState.DIR, 'journal')
+    # number of journal records after which the journal is fsync'ed
+    JOURNAL_SYNC = 64
+    # number of journal records after which the journal is compacted
+    JOURNAL_COMPACT = 4096
 
     def __init__(self, path, name, initial_state, info=None,
                  xml_data=None, **states):
@@ -355,9 +375,17 @@ class XMLTransactionState(AbstractTransactionState):
         trans_dir = _storefile(self._path, XMLTransactionState.DIR)
         data_dir = os.path.join(trans_dir, _PKG_DATA)
         self._location = data_dir
+        self._state_index = {}
+        self._info_index = {}
+        self._journal_fobj = None
+        self._journal_size = 0
+        self._journal_records = 0
+        self._unsynced_records = 0
         if xml_data:
             self._xml = fromstring(xml_data, entry=File, directory=Directory,
                                    linkinfo=Linkinfo)
+            self._build_index()
+            self._replay()
         else:
             self.cleanup()
             os.mkdir(trans_dir)
@@ -371,13 +399,25 @@ class XMLTransactionState(AbstractTransactionState):
             self._xml.append(self._xml.makeelement('info'))
             for listname in self._listnames():
                 self._add_list(listname, info)
+            self._build_index()
             self._write()
 
+    def _build_index(self):
+        """Build the entry -> elements indices for the states and info."""
+        self._state_index = {}
+        for elm in self._xml.find('states').iterchildren():
+            self._state_index[elm.get('entry')] = elm
+        self._info_index = {}
+        for elm in self._xml.find('info').iterdescendants():
+            if elm.text is not None:
+                self._info_index.setdefault(elm.text, []).append(elm)
+
     def _add_states(self, states):
         states_elm = self._xml.find('states')
         for entry, st in states.iteritems():
             elm = states_elm.makeelement('state', entry=entry, name=st)
             states_elm.append(elm)
+            self._state_index[entry] = elm
 
     def _add_list(self, listname, info):
         info_elm = self._xml.find('info')
@@ -390,29 +430,122 @@ class XMLTransactionState(AbstractTransactionState):
             getattr(child, 'file').__setitem__(-1, data)
 
     def _write(self):
+        """Write the complete state and truncate the journal."""
         objectify.deannotate(self._xml)
         etree.cleanup_namespaces(self._xml)
         xml_data = etree.tostring(self._xml, pretty_print=True)
         _write_storefile(self._path, XMLTransactionState.FILENAME, xml_data)
+        # the journal is obsolete (replaying it is idempotent, so it
+        # does not matter if we crash before it is removed)
+        self._close_journal()
+        journal = _storefile(self._path, XMLTransactionState.JOURNAL)
+        if os.path.exists(journal):
+            os.unlink(journal)
+        self._journal_size = 0
+        self._journal_records = 0
+
+    def _close_journal(self):
+        if self._journal_fobj is None:
+            return
+        self._sync_journal()
+        self._journal_fobj.close()
+        self._journal_fobj = None
+
+    def _sync_journal(self):
+        if self._journal_fobj is not None and self._unsynced_records:
+            os.fsync(self._journal_fobj.fileno())
+        self._unsynced_records = 0
+
+    def _journal(self, record, sync=False):
+        """Apply the record and append it to the journal.
+
+        record is a tuple of strs (or None). Each record is
+        flushed immediately but only fsync'ed every JOURNAL_SYNC
+        records (or if sync is True).
 
-    def processed(self, entry, new_state=None):
-        # remove file from info
-        info_elm = self._xml.find('info')
-        elm = info_elm.find("//*[text() = '%s']" % entry)
-        if elm is None:
-            raise ValueError("file \"%s\" is not known" % entry)
-        elm.getparent().remove(elm)
+        """
+        self._apply(record)
+        if self._journal_records >= XMLTransactionState.JOURNAL_COMPACT:
+            self._write()
+            return
+        if (self._journal_fobj is None
+                and missing_storepaths(self._path,
+                                       XMLTransactionState.FILENAME)):
+            # the journal is useless without the state file
+            self._write()
+            return
+        if self._journal_fobj is None:
+            self._journal_fobj = self._open_journal()
+        line = '\t'.join([_quote_field(field) for field in record]) + '\n'
+        self._journal_fobj.write(line)
+        self._journal_fobj.flush()
+        self._journal_size += len(line)
+        self._journal_records += 1
+        self._unsynced_records += 1
+        if sync or self._unsynced_records >= XMLTransactionState.JOURNAL_SYNC:
+            self._sync_journal()
+
+    def _open_journal(self):
+        """Open the journal for appending."""
+        journal = _storefile(self._path, XMLTransactionState.JOURNAL)
+        fobj = open(journal, 'a+')
+        fobj.seek(0, os.SEEK_END)
+        if fobj.tell() > self._journal_size:
+            # remove an incomplete record (the writer crashed)
+            fobj.truncate(self._journal_size)
+        return fobj
+
+    def _replay(self):
+        """Replay the journal (if it exists)."""
+        journal = _storefile(self._path, XMLTransactionState.JOURNAL)
+        if not os.path.isfile(journal):
+            return
+        with open(journal, 'r') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    # incomplete record (the writer crashed)
+                    break
+                record = [_unquote_field(field)
+                          for field in line[:-1].split('\t')]
+                self._apply(tuple(record))
+                self._journal_size += len(line)
+                self._journal_records += 1
+
+    def _apply(self, record):
+        """Apply a journal record to the xml.
+
+        Applying a record has to be idempotent.
+        Subclasses may override this method in order to support
+        additional records.
+
+        """
+        if record[0] == 'state':
+            self._xml.set('state', record[1])
+        elif record[0] == 'processed':
+            self._apply_processed(record[1], record[2])
+
+    def _apply_processed(self, entry, new_state):
+        # remove entry from info
+        elms = self._info_index.get(entry)
+        if elms:
+            elm = elms.pop(0)
+            elm.getparent().remove(elm)
         # update states
-        elm = self._xml.find("//state[@entry = '%s']" % entry)
-        if elm is None:
+        elm = self._state_index.get(entry)
+        if elm is None and new_state is not None:
             self._add_states({entry: new_state})
-            elm = self._xml.find("//state[@entry = '%s']" % entry)
-        if new_state is None:
-            # remove node
-            elm.getparent().remove(elm)
+        elif new_state is None:
+            if elm is not None:
+                # remove node
+                del self._state_index[entry]
+                elm.getparent().remove(elm)
         else:
             elm.set('name', new_state)
-        self._write()
+
+    def processed(self, entry, new_state=None):
+        if not self._info_index.get(entry):
+            raise ValueError("file \"%s\" is not known" % entry)
+        self._journal(('processed', entry, new_state))
 
     @property
     def location(self):
@@ -428,8 +561,7 @@ class XMLTransactionState(AbstractTransactionState):
 
     @state.setter
     def state(self, new_state):
-        self._xml.set('state', new_state)
-        self._write()
+        self._journal(('state', new_state), sync=True)
 
     @property
     def entrystates(self):
@@ -453,20 +585,22 @@ class XMLTransactionState(AbstractTransactionState):
                 lists[listname].append(entry)
         return lists
 
-    def clear_info(self, entry):
-        """Remove all entries but entry from info lists."""
+    def clear_info(self, *entries):
+        """Remove all entries but entries from info lists."""
         info_elm = self._xml.find('info')
         for listname in self._listnames():
             delete = []
             for entry_elm in info_elm.find(listname).iterchildren():
-                if entry_elm.text != entry:
+                if entry_elm.text not in entries:
                     delete.append(entry_elm)
             for entry_elm in delete:
                 entry_elm.getparent().remove(entry_elm)
+        self._build_index()
         self._write()
 
     def cleanup(self):
         """Remove _transaction dir"""
+        self._close_journal()
         path = _storefile(self._path, XMLTransactionState.DIR)
         if os.path.exists(path):
             shutil.rmtree(path)
@@ -478,7 +612,7 @@ class XMLTransactionState(AbstractTransactionState):
         path is the path to the package working copy.
         If the update state file does not exist None
         is returned. Otherwise a XMLTransactionState subclass
-        instance is returned.
+        instance is returned (the journal is already replayed).
 
         """
         ret = None
@@ -490,6 +624,35 @@ class XMLTransactionState(AbstractTransactionState):
         return ret
 
 
+def _quote_field(field):
+    """Return the escaped journal field (None is the empty str).
+
+    The field is escaped, so that it contains no tab or newline.
+
+    """
+    if field is None:
+        return ''
+    if isinstance(field, unicode):
+        field = field.encode('utf-8')
+    return urllib.quote(field, safe='')
+
+
+def _unquote_field(field):
+    """Return the unescaped journal field (or None).
+
+    A non-ascii field is returned as unicode (like lxml does).
+
+    """
+    if not field:
+        return None
+    field = urllib.unquote(field)
+    try:
+        field.decode('ascii')
+    except UnicodeDecodeError:
+        return field.decode('utf-8')
+    return field
+
+
 def _storedir(path):
     """Return the storedir path"""
     global _STORE
@@ -843,6 +1006,42 @@ def wc_pkg_data_filename(path, filename):
     return os.path.join(data_path, filename)
 
 
+def wc_object_store(path):
+    """Return the path to the object store of the package wc path.
+
+    The object store is an optional, content-addressed store in
+    the storedir of a project working copy (each file is named
+    after its md5sum). The data files of the project's packages
+    are hardlinks to the files in the object store. None is returned
+    if path is no package of a project working copy or if the
+    project working copy has no object store.
+
+    """
+    global _PKG_DATA, _OBJECTS
+    # the storedir of a package in a project wc is the
+    # project's storedir/_PKG_DATA/package dir
+    storedir = os.path.realpath(_storedir(path))
+    data_dir = os.path.dirname(storedir)
+    if os.path.basename(data_dir) != _PKG_DATA:
+        return None
+    objects = os.path.join(os.path.dirname(data_dir), _OBJECTS)
+    if not os.path.isdir(objects):
+        return None
+    return objects
+
+
+def wc_init_object_store(path):
+    """Create an object store for the project wc path.
+
+    Nothing happens if the object store already exists.
+
+    """
+    global _OBJECTS
+    objects = _storefile(path, _OBJECTS)
+    if not os.path.isdir(objects):
+        os.mkdir(objects)
+
+
 def wc_diff_mkdir(path, revision):
     """Return the filename to the diff dir.
 
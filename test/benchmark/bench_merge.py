@@ -0,0 +1,86 @@
+"""Benchmark the in-process three-way merge against diff3.
+
+Usage: python -m test.benchmark.bench_merge [files] [lines]
+
+Merges files (default: 200) generated text files with lines
+(default: 300) lines each (with non-overlapping changes in "my" and
+"your" file and a conflict in every 10th file) with the diff3 based
+Merge class and the ThreeWayMerge class. The elapsed times and the
+number of differing results are printed.
+
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+
+from osc2.wc.package import Merge, ThreeWayMerge
+
+
+def _write(path, lines):
+    with open(path, 'w') as f:
+        f.writelines(lines)
+
+
+def _generate(tmpdir, files, lines):
+    rand = random.Random(42)
+    triples = []
+    for i in xrange(files):
+        old = ["line %d: %d\n" % (j, rand.randint(0, 1000))
+               for j in xrange(lines)]
+        my = list(old)
+        your = list(old)
+        for j in xrange(0, lines, 20):
+            my[j] = "my change %d\n" % j
+            your[j + 10] = "your change %d\n" % j
+        if i % 10 == 0:
+            your[0] = "conflicting change\n"
+        triple = []
+        for name, data in (('my', my), ('old', old), ('your', your)):
+            path = os.path.join(tmpdir, "%s%d" % (name, i))
+            _write(path, data)
+            triple.append(path)
+        triples.append(triple)
+    return triples
+
+
+def _run(merge_class, triples, suffix):
+    start = time.time()
+    results = []
+    for my, old, your in triples:
+        out = my + suffix
+        ret = merge_class().merge(my, old, your, out)
+        results.append(ret)
+    return time.time() - start, results
+
+
+def _read(filename):
+    with open(filename, 'r') as f:
+        return f.read()
+
+
+def main(files=200, lines=300):
+    tmpdir = tempfile.mkdtemp(prefix='osc2_bench_merge')
+    try:
+        triples = _generate(tmpdir, files, lines)
+        diff3_time, diff3_results = _run(Merge, triples, '.diff3')
+        py_time, py_results = _run(ThreeWayMerge, triples, '.py')
+        differing = 0
+        for (my, old, your), ret1, ret2 in zip(triples, diff3_results,
+                                               py_results):
+            if (ret1 != ret2
+                    or _read(my + '.diff3') != _read(my + '.py')):
+                differing += 1
+        print "merged %d files with %d lines" % (files, lines)
+        print "diff3:         %.3fs" % diff3_time
+        print "ThreeWayMerge: %.3fs" % py_time
+        print "differing results: %d" % differing
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
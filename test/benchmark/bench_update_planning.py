@@ -0,0 +1,87 @@
+"""Benchmark the project update planning.
+
+Usage: python -m test.benchmark.bench_update_planning [packages...]
+
+Creates a project working copy which is grown to each of the
+specified numbers of packages (default: 1000 5000 10000 20000) and
+measures the time that is needed to calculate the update info (the
+added, deleted, candidate and conflicted packages) of a project update.
+The remote package list contains 95% of the local packages (the rest
+is deleted on the server) and 5% new packages. No http requests are
+issued (the remote package list is generated).
+
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import osc2.wc.project
+from osc2.wc.project import Project
+from osc2.wc.package import Package
+from osc2.wc.util import wc_pkg_data_mkdir, wc_write_packages
+
+
+class _SourceProject(object):
+    """Returns a generated remote package list."""
+    names = []
+
+    def __init__(self, name):
+        self.name = name
+
+    def list(self, names_only=False, **kwargs):
+        return _SourceProject.names
+
+
+def _grow(path, start, stop):
+    for i in xrange(start, stop):
+        package = "package%d" % i
+        pkg_path = os.path.join(path, package)
+        os.mkdir(pkg_path)
+        storedir = wc_pkg_data_mkdir(path, package)
+        Package.init(pkg_path, 'prj', package, 'http://localhost',
+                     ext_storedir=storedir)
+    entries = ['<package name="package%d" state=" "/>' % i
+               for i in xrange(stop)]
+    wc_write_packages(path, '<packages>%s</packages>' % ''.join(entries))
+
+
+def _remote(packages):
+    names = ["package%d" % i for i in xrange(packages) if i % 20 != 0]
+    names.extend(["new%d" % i for i in xrange(packages / 20)])
+    return names
+
+
+def main(sizes):
+    tmpdir = tempfile.mkdtemp(prefix='bench_update_planning')
+    orig = osc2.wc.project.SourceProject
+    osc2.wc.project.SourceProject = _SourceProject
+    try:
+        path = os.path.join(tmpdir, 'prj')
+        Project.init(path, 'prj', 'http://localhost')
+        current = 0
+        print "%10s %10s %10s %14s" % ('packages', 'setup (s)', 'plan (s)',
+                                       'per pkg (us)')
+        for size in sizes:
+            start = time.time()
+            _grow(path, current, size)
+            current = size
+            _SourceProject.names = _remote(size)
+            setup = time.time() - start
+            prj = Project(path)
+            start = time.time()
+            uinfo = prj._calculate_updateinfo()
+            elapsed = time.time() - start
+            assert len(uinfo.candidates) + len(uinfo.deleted) == size
+            print "%10d %10.2f %10.3f %14.1f" % (size, setup, elapsed,
+                                                 elapsed * 1e6 / size)
+    finally:
+        osc2.wc.project.SourceProject = orig
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]]
+    main(sizes or [1000, 5000, 10000, 20000])
@@ -0,0 +1,67 @@
+import os
+import unittest
+from collections import namedtuple
+
+from osc2.oscargs import WCPath
+from osc2.wc.package import Package
+from osc2.cli.fetch.fetch import fetch
+from test.httptest import GET
+from test.osctest import OscTest
+from test.cli.util.test_shell import MockRenderer
+
+
+def suite():
+    return unittest.makeSuite(TestFetch)
+
+
+Info = namedtuple('Info', [])
+
+
+class TestFetch(OscTest):
+    def __init__(self, *args, **kwargs):
+        kwargs['fixtures_dir'] = os.path.join('cli', 'fetch',
+                                              'test_fetch_fixtures')
+        super(TestFetch, self).__init__(*args, **kwargs)
+
+    def _rendered(self, renderer):
+        return [r.text for r in renderer.rendered]
+
+    @GET(('http://localhost/source/prj/pkg/big'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='big_file')
+    @GET(('http://localhost/source/prj/pkg/large'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='large_file')
+    def test_fetch1(self):
+        """test fetch (all skipped files)"""
+        path = self.fixture_file('pkg')
+        renderer = MockRenderer()
+        fetch(renderer, WCPath(None, path, None), Info())
+        self.assertEqual(self._rendered(renderer),
+                         ['downloading: big', 'downloading: large'])
+        pkg = Package(path)
+        self.assertEqual(pkg.status('big'), ' ')
+        self.assertEqual(pkg.status('large'), ' ')
+        self._exists(path, 'big')
+        self._exists(path, 'large')
+
+    @GET(('http://localhost/source/prj/pkg/large'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='large_file')
+    def test_fetch2(self):
+        """test fetch (a single file)"""
+        path = self.fixture_file('pkg')
+        renderer = MockRenderer()
+        wc_path = WCPath(None, path, os.path.join(path, 'large'))
+        fetch(renderer, [wc_path], Info())
+        self.assertEqual(self._rendered(renderer), ['downloading: large'])
+        pkg = Package(path)
+        self.assertEqual(pkg.status('big'), 'S')
+        self.assertEqual(pkg.status('large'), ' ')
+        self._not_exists(path, 'big')
+
+    def test_fetch3(self):
+        """test fetch (no package wc)"""
+        path = self.fixture_file('pkg')
+        self.assertRaises(ValueError, fetch, MockRenderer(),
+                          WCPath(path, None, None), Info())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import threading
+import unittest
+from collections import namedtuple
+
+from osc2.wc.project import Project
+from osc2.cli.status.status import _project_status
+from test.osctest import OscTest
+from test.cli.util.test_shell import MockRenderer
+
+
+def suite():
+    return unittest.makeSuite(TestStatus)
+
+
+Info = namedtuple('Info', ['jobs'])
+
+
+class TestStatus(OscTest):
+    def __init__(self, *args, **kwargs):
+        kwargs['fixtures_dir'] = os.path.join('cli', 'status',
+                                              'test_status_fixtures')
+        super(TestStatus, self).__init__(*args, **kwargs)
+
+    def _rendered(self, renderer):
+        return [(r.kwargs['package'], r.kwargs['package_state'],
+                 r.kwargs['states']) for r in renderer.rendered]
+
+    def test_project_status1(self):
+        """test project status (package order, multiple workers)"""
+        prj = Project(self.fixture_file('prj'))
+        renderer = MockRenderer()
+        _project_status(renderer, prj, Info(jobs=4))
+        rendered = self._rendered(renderer)
+        self.assertEqual([r[0] for r in rendered], prj.packages())
+        self.assertEqual(rendered[0], ('foo', ' ', {'file': ' '}))
+        # missing package
+        self.assertEqual(rendered[3], ('xxx', '!', {}))
+        # the result does not depend on the number of workers
+        renderer = MockRenderer()
+        _project_status(renderer, Project(self.fixture_file('prj')),
+                        Info(jobs=1))
+        self.assertEqual(self._rendered(renderer), rendered)
+
+    def test_project_status2(self):
+        """test project status (results are rendered when available)"""
+        prj = Project(self.fixture_file('prj'))
+        first_rendered = threading.Event()
+        status = prj._status
+        waited = []
+
+        def _status(package):
+            # the last package is only collected after the first
+            # package was rendered
+            if package == 'foo_modified' and not waited:
+                waited.append(first_rendered.wait(5) or
+                              first_rendered.is_set())
+            return status(package)
+
+        class Renderer(MockRenderer):
+            def render(self, *args, **kwargs):
+                super(Renderer, self).render(*args, **kwargs)
+                first_rendered.set()
+
+        prj._status = _status
+        renderer = Renderer()
+        _project_status(renderer, prj, Info(jobs=len(prj.packages())))
+        self.assertEqual(waited, [True])
+        self.assertEqual(len(renderer.rendered), len(prj.packages()))
+
+    def test_project_status3(self):
+        """test project status (exception in a worker)"""
+        prj = Project(self.fixture_file('prj'))
+        status = prj._status
+
+        def _status(package):
+            if package == 'foo_modified':
+                raise ValueError(package)
+            return status(package)
+
+        prj._status = _status
+        renderer = MockRenderer()
+        self.assertRaises(ValueError, _project_status, renderer, prj,
+                          Info(jobs=4))
+        # the results of the preceding packages are rendered
+        packages = [r[0] for r in self._rendered(renderer)]
+        self.assertEqual(packages, prj.packages()[:-1])
+
+if __name__ == '__main__':
+    unittest.main()
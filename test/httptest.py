@@ -3,12 +3,15 @@ import cStringIO
 import unittest
 import urllib2
 import shutil
+import threading
 from difflib import unified_diff
 
 from osc2.util.io import mkdtemp
 from test.xmltest import compare_xml
 
 EXPECTED_REQUESTS = []
+# the requests might be issued by multiple threads
+EXPECTED_REQUESTS_LOCK = threading.Lock()
 
 
 class RequestWrongOrder(Exception):
@@ -95,8 +98,27 @@ class MyHTTPHandler(urllib2.HTTPHandler, urllib2.HTTPSHandler):
         # HTTPHandler's inheritance hierarchy extends object
         urllib2.HTTPHandler.__init__(self, *args, **kwargs)
 
+    def _pop_expected(self, req):
+        """Pops the expected request for req.
+
+        Consecutive expected requests, which are marked as unordered
+        (for instance, because they are issued concurrently), are
+        matched in any order.
+
+        """
+        with EXPECTED_REQUESTS_LOCK:
+            i = 0
+            while (i < len(self._exp_requests)
+                   and self._exp_requests[i][2].get('unordered', False)):
+                method, url = self._exp_requests[i][0:2]
+                if req.get_full_url() == url and req.get_method() == method:
+                    return self._exp_requests.pop(i)
+                i += 1
+            return self._exp_requests.pop(0)
+
     def http_open(self, req):
-        r = self._exp_requests.pop(0)
+        r = self._pop_expected(req)
+        r[2].pop('unordered', None)
         if req.get_full_url() != r[1] or req.get_method() != r[0]:
             raise RequestWrongOrder(req.get_full_url(), r[1], req.get_method(),
                                     r[0])
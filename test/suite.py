@@ -18,7 +18,10 @@ from test.util import test_cpio
 from test.util import test_xml
 from test.util import test_io
 from test.util import test_delegation
+from test.util import test_parallel
 from test.cli.util import test_shell
+from test.cli.status import test_status
+from test.cli.fetch import test_fetch as test_cli_fetch
 
 
 def additional_tests():
@@ -40,7 +43,10 @@ def additional_tests():
     suite.addTests(test_xml.suite())
     suite.addTests(test_io.suite())
     suite.addTests(test_delegation.suite())
+    suite.addTests(test_parallel.suite())
     suite.addTests(test_shell.suite())
+    suite.addTests(test_status.suite())
+    suite.addTests(test_cli_fetch.suite())
     return suite
 
 if __name__ == '__main__':
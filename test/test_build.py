@@ -3,7 +3,8 @@ from cStringIO import StringIO
 
 from lxml import etree
 
-from osc2.build import BuildResult, BinaryList, BuildInfo, BuildDependency
+from osc2.build import (BuildResult, BinaryList, BuildInfo, BuildDependency,
+                        ResultMatrix)
 from test.osctest import OscTest
 from test.httptest import GET, POST
 
@@ -129,6 +130,82 @@ class TestBuild(OscTest):
         br = BuildResult('test')
         self.assertRaises(etree.DocumentInvalid, br.result)
 
+    @GET('http://localhost/build/test/_result', file='prj_result.xml')
+    def test_resultmatrix1(self):
+        """project result matrix"""
+        br = BuildResult('test')
+        matrix = br.result_matrix()
+        self.assertEqual(len(matrix), 6)
+        self.assertEqual(matrix.packages, ['foo', 'bar', 'osc'])
+        self.assertEqual(matrix.repositories, ['openSUSE_Factory'])
+        self.assertEqual(matrix.archs, ['i586', 'x86_64'])
+        self.assertEqual(matrix.codes, ['disabled', 'succeeded', 'building'])
+        self.assertEqual(list(matrix)[2],
+                         ('osc', 'openSUSE_Factory', 'i586', 'building'))
+        self.assertEqual(matrix.code('osc', 'openSUSE_Factory', 'x86_64'),
+                         'succeeded')
+        self.assertTrue(matrix.code('osc', 'openSUSE_Factory', 'ppc') is None)
+        self.assertEqual(matrix.details('osc', 'openSUSE_Factory', 'i586'),
+                         'builds on host foo')
+        self.assertEqual(matrix.details('bar', 'openSUSE_Factory', 'i586'),
+                         '')
+        self.assertEqual(matrix.state('openSUSE_Factory', 'i586'),
+                         'building')
+        self.assertEqual(matrix.find_packages('succeeded'), ['bar', 'osc'])
+        self.assertEqual(matrix.find_packages('succeeded', arch='i586'),
+                         ['bar'])
+        self.assertEqual(matrix.find_packages('failed'), [])
+        self.assertEqual(matrix.find(package='foo', arch='x86_64'),
+                         [('foo', 'openSUSE_Factory', 'x86_64', 'disabled')])
+        self.assertEqual(matrix.find(repository='unknown'), [])
+
+    @GET('http://localhost/build/test/_result', file='prj_result.xml')
+    def test_resultmatrix2(self):
+        """diff two result matrices"""
+        br = BuildResult('test')
+        matrix = br.result_matrix()
+        old = ResultMatrix()
+        old.append('foo', 'openSUSE_Factory', 'i586', 'disabled')
+        old.append('bar', 'openSUSE_Factory', 'i586', 'failed')
+        old.append('osc', 'openSUSE_Factory', 'i586', 'building')
+        old.append('osc', 'openSUSE_Factory', 'ppc', 'failed')
+        diff = sorted(matrix.diff(old))
+        self.assertEqual(diff, [
+            ('bar', 'openSUSE_Factory', 'i586', 'failed', 'succeeded'),
+            ('bar', 'openSUSE_Factory', 'x86_64', None, 'succeeded'),
+            ('foo', 'openSUSE_Factory', 'x86_64', None, 'disabled'),
+            ('osc', 'openSUSE_Factory', 'ppc', 'failed', None),
+            ('osc', 'openSUSE_Factory', 'x86_64', None, 'succeeded')])
+        self.assertEqual(matrix.diff(matrix), [])
+
+    def test_resultmatrix3(self):
+        """indexed queries of a result matrix"""
+        matrix = ResultMatrix()
+        cells = []
+        for i in xrange(100):
+            for repo in ('repo1', 'repo2'):
+                for arch in ('i586', 'x86_64'):
+                    code = 'succeeded'
+                    if i % 10 == 0 and arch == 'i586':
+                        code = 'failed'
+                    cells.append(('pkg%d' % i, repo, arch, code))
+                    matrix.append(*cells[-1])
+        self.assertEqual(list(matrix), cells)
+        self.assertEqual(matrix.code('pkg10', 'repo2', 'i586'), 'failed')
+        self.assertEqual(matrix.code('pkg11', 'repo2', 'i586'), 'succeeded')
+        self.assertTrue(matrix.code('pkg100', 'repo2', 'i586') is None)
+        self.assertTrue(matrix.code('pkg10', 'repo3', 'i586') is None)
+        expected = [c for c in cells if c[3] == 'failed' and c[1] == 'repo1']
+        self.assertEqual(matrix.find(repository='repo1', code='failed'),
+                         expected)
+        self.assertEqual(matrix.find('pkg20', 'repo1', 'i586'),
+                         [('pkg20', 'repo1', 'i586', 'failed')])
+        self.assertEqual(matrix.find('pkg20', 'repo1', 'i586', 'succeeded'),
+                         [])
+        self.assertEqual(matrix.find(), cells)
+        self.assertEqual(matrix.find_packages('failed', arch='x86_64'), [])
+        self.assertEqual(len(matrix.find_packages('failed', 'repo2')), 10)
+
     @GET('http://localhost/build/test/openSUSE_Factory/i586/_repository',
          file='binarylist1.xml')
     def test_binarylist1(self):
@@ -7,7 +7,8 @@ from lxml import etree
 
 from osc2.remote import (RemoteProject, RemotePackage, Request,
                          RORemoteFile, RWRemoteFile, RWLocalFile,
-                         RemotePerson, RemoteGroup)
+                         RemotePerson, RemoteGroup, RemoteModelElement)
+from osc2.util.xml import fromstring
 from test.osctest import OscTest
 from test.httptest import GET, PUT, POST, DELETE
 
@@ -151,6 +152,39 @@ class TestRemoteModel(OscTest):
         """test delete method"""
         self.assertFalse(RemoteProject.delete('foo'))
 
+    def test_project13(self):
+        """create a remote project from an existing element (copy)"""
+        xml = fromstring('<collection><project name="foo"><title>bar</title>'
+                         '<person userid="testuser" role="maintainer"/>'
+                         '<repository name="standard"><arch>i586</arch>'
+                         '</repository></project></collection>')
+        prj = RemoteProject(xml_element=xml.project)
+        self.assertEqual(prj.get('name'), 'foo')
+        self.assertEqual(prj.title, 'bar')
+        self.assertTrue(isinstance(prj.repository, RemoteModelElement))
+        prj.repository.add_arch('x86_64')
+        self.assertEqual(prj.repository.arch[:], ['i586', 'x86_64'])
+        prj.add_person(userid='foobar', role='bugowner')
+        self.assertEqual(prj.person[1].get('userid'), 'foobar')
+        # the original element is not modified
+        self.assertEqual(len(xml.project.person[:]), 1)
+        self.assertEqual(xml.project.title, 'bar')
+
+    def test_project14(self):
+        """create a remote project from an existing element (adopt)"""
+        xml = fromstring('<collection><project name="foo"><title>bar</title>'
+                         '</project></collection>')
+        elm = xml.project
+        prj = RemoteProject(xml_element=elm, adopt=True)
+        self.assertEqual(prj.get('name'), 'foo')
+        self.assertEqual(prj.title, 'bar')
+        self.assertTrue(prj._xml.getparent() is None)
+        # the subtree was moved
+        self.assertEqual(len(elm.getchildren()), 0)
+        # an element which was created by the model's parser is used as is
+        prj2 = RemoteProject(xml_element=prj._xml, adopt=True)
+        self.assertTrue(prj2._xml is prj._xml)
+
     @GET('http://localhost/source/openSUSE%3ATools/osc/_meta',
          file='package.xml')
     def test_package1(self):
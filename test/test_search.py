@@ -2,7 +2,8 @@ import unittest
 
 from lxml import etree
 
-from osc2.search import find_request, RequestCollection
+from osc2.remote import Request, RemoteProject
+from osc2.search import find_request, find_project, RequestCollection
 from osc2.util.xpath import XPathBuilder
 from test.osctest import OscTest
 from test.httptest import GET
@@ -47,8 +48,13 @@ class TestSearch(OscTest):
         # test __iter__ method of the collection
         ids = ['1', '42', '108']
         for r in collection:
+            self.assertTrue(isinstance(r, Request))
             self.assertEqual(r.get('id'), ids.pop(0))
+            self.assertEqual(r.action.get('type'), 'submit')
         self.assertTrue(len(ids) == 0)
+        # the collection is not modified
+        self.assertEqual(collection.request[0].action.source.get('project'),
+                         'foo')
 
     @GET(('http://localhost/search/request?match='
           '%2Fstate%5B%40name+%3D+%22new%22%5D'),
@@ -85,5 +91,54 @@ class TestSearch(OscTest):
         xp = xpb.state[xpb.attr('name') == 'declined']
         self.assertRaises(etree.DocumentInvalid, find_request, xp)
 
+    @GET(('http://localhost/search/request?match='
+          '%2Fstate%5B%40name+%3D+%22new%22+or+%40name+%3D+%22review%22%5D'),
+         file='collection_request1.xml')
+    def test_request5(self):
+        """test find_request (stream)"""
+        xpath = '/state[@name = "new" or @name = "review"]'
+        ids = ['1', '42', '108']
+        for r in find_request(xpath, stream=True):
+            self.assertTrue(isinstance(r, Request))
+            self.assertEqual(r.get('id'), ids.pop(0))
+            if r.get('id') == '1':
+                self.assertEqual(r.action.source.get('project'), 'foo')
+            elif r.get('id') == '108':
+                self.assertEqual(r.review[2].get('by_group'),
+                                 'autobuild-team')
+        self.assertTrue(len(ids) == 0)
+
+    @GET(('http://localhost/search/request?match='
+          '%2Fstate%5B%40name+%3D+%22new%22%5D'),
+         file='collection_request1.xml')
+    @GET(('http://localhost/search/request?match='
+          '%2Fstate%5B%40name+%3D+%22new%22%5D'),
+         file='collection_request1.xml')
+    def test_request6(self):
+        """test find_request (stream and non-stream serialization)"""
+        xpath = '/state[@name = "new"]'
+        expected = [r.tostring() for r in find_request(xpath)]
+        streamed = [r.tostring() for r in find_request(xpath, stream=True)]
+        self.assertEqual(len(expected), 3)
+        self.assertEqual(streamed, expected)
+
+    @GET('http://localhost/search/project?match=%40name+%3D+%22foo%22',
+         text=('<collection matches="2"><project name="foo">'
+               '<title>foo</title><description/>'
+               '<person userid="bar" role="maintainer"/></project>'
+               '<project name="foo:bar"><title/><description/></project>'
+               '</collection>'))
+    def test_project1(self):
+        """test find_project (stream)"""
+        projects = list(find_project('@name = "foo"', stream=True))
+        self.assertEqual(len(projects), 2)
+        self.assertTrue(isinstance(projects[0], RemoteProject))
+        self.assertEqual(projects[0].get('name'), 'foo')
+        self.assertEqual(projects[0].person.get('userid'), 'bar')
+        self.assertEqual(projects[1].get('name'), 'foo:bar')
+        # the remote model is writable
+        projects[1].add_person(userid='foobar', role='bugowner')
+        self.assertEqual(projects[1].person.get('userid'), 'foobar')
+
 if __name__ == '__main__':
     unittest.main()
@@ -32,6 +32,40 @@ class TestSource(OscTest):
         self.assertEqual(pkgs[1].name, 'glibc')
         self.assertEqual(pkgs[2].name, 'python')
 
+    @GET('http://localhost/source/openSUSE%3AFactory', file='pkg_list.xml')
+    def test1_1(self):
+        """test package list (names only)"""
+        prj = Project('openSUSE:Factory')
+        pkgs = prj.list(names_only=True)
+        self.assertEqual(pkgs, ['osc', 'glibc', 'python'])
+
+    @GET('http://localhost/source/', text=('<directory count="2">'
+                                           '<entry name="foo"/>'
+                                           '<entry name="openSUSE:Factory"/>'
+                                           '</directory>'))
+    def test1_2(self):
+        """test global project list"""
+        prj = Project('')
+        prjs = prj.list()
+        self.assertEqual(len(prjs), 2)
+        self.assertEqual(prjs[0].get('name'), 'foo')
+        self.assertEqual(prjs[1].get('name'), 'openSUSE:Factory')
+        # the records are slotted
+        self.assertRaises(AttributeError, setattr, prjs[0], 'foo', 'bar')
+
+    @GET('http://localhost/source/openSUSE%3AFactory?nofilename=1&view=info',
+         file='pkg_sourceinfo.xml')
+    def test1_3(self):
+        """test source info of all packages"""
+        prj = Project('openSUSE:Factory')
+        info = prj.sourceinfo()
+        self.assertEqual(sorted(info.keys()), ['glibc', 'osc', 'python'])
+        self.assertEqual(info['osc']['srcmd5'],
+                         '0cf5d2e3bd2a8a3dd4f3bd0c82e4ea23')
+        self.assertEqual(info['glibc']['lsrcmd5'],
+                         'f0e8e8d6f7ea4c5ef0f4e7bbe6fbd1a9')
+        self.assertEqual(info['python']['error'], 'bad link')
+
     @GET('http://localhost/source/test', file='pkg_list_empty.xml')
     def test2(self):
         """test empty package list"""
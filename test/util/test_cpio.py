@@ -5,7 +5,8 @@ import unittest
 from StringIO import StringIO
 
 from osc2.util.cpio import (FileWrapper, NewAsciiReader, CpioError,
-                            NewAsciiWriter, CpioArchive, cpio_open)
+                            NewAsciiWriter, CpioArchive, cpio_open,
+                            CrcReader, OdcReader)
 from test.osctest import OscTest
 
 
@@ -801,5 +802,136 @@ class TestCpio(OscTest):
         f.seek(158, os.SEEK_SET)
         self.assertRaises(CpioError, archive_reader.next_header)
 
+    def test30(self):
+        """test FileWrapper's pread method"""
+        fname = self.fixture_file('filewrapper1.txt')
+        f = FileWrapper(filename=fname, use_mmap=True)
+        self.assertTrue(f.is_mmap())
+        self.assertEqual(f.read(5), 'This ')
+        self.assertEqual(f.pread(6, 10), 'simple')
+        # the file position is not changed
+        self.assertEqual(f.tell(), 5)
+        self.assertEqual(f.read(2), 'is')
+        f.close()
+        # pread requires an mmap'ed file
+        f = FileWrapper(filename=fname)
+        self.assertFalse(f.is_mmap())
+        self.assertRaises(ValueError, f.pread, 6, 10)
+        f.close()
+
+    def test31(self):
+        """test CpioArchive's copyin method (mmap, multiple workers)"""
+        dest = self.fixture_file('copyin')
+        os.mkdir(dest)
+        fname = self.fixture_file('new_ascii_reader3.cpio')
+        with cpio_open(fname, use_mmap=True) as archive:
+            archive.copyin(dest, workers=4)
+        fname = self.fixture_file('copyin', 'foo')
+        self.assertEqualFile('file foo\n', fname)
+        st = os.stat(fname)
+        self.assertEqual(st.st_mode, 33188)
+        self.assertEqual(st.st_mtime, 1340493596)
+        fname = self.fixture_file('copyin', 'foobar')
+        self.assertEqualFile('This is file\nbar.\n', fname)
+        st = os.stat(fname)
+        self.assertEqual(st.st_mode, 33188)
+        self.assertEqual(st.st_mtime, 1340493602)
+        self.assertEqual(sorted(os.listdir(dest)), ['foo', 'foobar'])
+
+    def test32(self):
+        """test CpioArchive's copyin method (no mmap)"""
+        dest = self.fixture_file('copyin')
+        os.mkdir(dest)
+        fname = self.fixture_file('new_ascii_reader3.cpio')
+        with cpio_open(fname) as archive:
+            # workers is ignored, because the archive is not mmap'ed
+            archive.copyin(dest, workers=4)
+        self.assertEqualFile('file foo\n', os.path.join(dest, 'foo'))
+        self.assertEqualFile('This is file\nbar.\n',
+                             os.path.join(dest, 'foobar'))
+
+    def test33(self):
+        """test CpioArchive's copyin method (unseekable fobj)"""
+        dest = self.fixture_file('copyin')
+        os.mkdir(dest)
+        fname = self.fixture_file('new_ascii_reader3.cpio')
+        sio = StringIO(open(fname, 'r').read())
+        sio.seek = None
+        archive = CpioArchive(fobj=sio)
+        archive.copyin(dest, workers=4)
+        self.assertEqualFile('file foo\n', os.path.join(dest, 'foo'))
+        self.assertEqualFile('This is file\nbar.\n',
+                             os.path.join(dest, 'foobar'))
+
+    def test34(self):
+        """test CpioArchive's copyin method (dest is no directory)"""
+        fname = self.fixture_file('new_ascii_reader3.cpio')
+        with cpio_open(fname, use_mmap=True) as archive:
+            self.assertRaises(ValueError, archive.copyin,
+                              self.fixture_file('foo'), workers=2)
+
+    def test35(self):
+        """test CrcReader"""
+        fname = self.fixture_file('crc_reader1.cpio')
+        with cpio_open(fname) as archive:
+            self.assertEqual(archive.magic, '070702')
+            self.assertTrue(isinstance(archive._reader, CrcReader))
+            self.assertEqual(archive.filenames(), ['foo', 'foobar'])
+            foo = archive.find('foo')
+            self.assertEqual(foo.hdr.chksum, 782)
+            self.assertEqual(foo.hdr.filesize, 9)
+            self.assertEqual(foo.hdr.mtime, 1340493596)
+            # the checksum is verified incrementally
+            self.assertEqual(foo.read(5), 'file ')
+            self.assertEqual(foo.read(), 'foo\n')
+            self.assertEqual(archive.find('foobar').read(),
+                             'This is file\nbar.\n')
+
+    def test36(self):
+        """test CrcReader (checksum mismatch)"""
+        fname = self.fixture_file('crc_reader_invalid_checksum.cpio')
+        with cpio_open(fname) as archive:
+            self.assertEqual(archive.find('foo').read(), 'file foo\n')
+            foobar = archive.find('foobar')
+            # no error until the last byte is read
+            self.assertEqual(foobar.read(4), 'This')
+            self.assertRaises(CpioError, foobar.read)
+
+    def test37(self):
+        """test CrcReader: copyin verifies the checksum"""
+        dest = self.fixture_file('copyin')
+        os.mkdir(dest)
+        fname = self.fixture_file('crc_reader1.cpio')
+        with cpio_open(fname, use_mmap=True) as archive:
+            archive.copyin(dest, workers=2)
+        self.assertEqualFile('file foo\n', os.path.join(dest, 'foo'))
+        self.assertEqualFile('This is file\nbar.\n',
+                             os.path.join(dest, 'foobar'))
+        fname = self.fixture_file('crc_reader_invalid_checksum.cpio')
+        with cpio_open(fname, use_mmap=True) as archive:
+            self.assertRaises(CpioError, archive.copyin, dest, workers=2)
+        with cpio_open(fname) as archive:
+            self.assertRaises(CpioError, archive.copyin, dest)
+
+    def test38(self):
+        """test OdcReader"""
+        fname = self.fixture_file('odc_reader1.cpio')
+        with cpio_open(fname) as archive:
+            self.assertEqual(archive.magic, '070707')
+            self.assertTrue(isinstance(archive._reader, OdcReader))
+            self.assertEqual(archive.filenames(), ['foo', 'foobar'])
+            foo = archive.find('foo')
+            self.assertEqual(foo.hdr.mode, 33188)
+            self.assertEqual(foo.hdr.mtime, 1340493596)
+            self.assertEqual(foo.hdr.filesize, 9)
+            self.assertEqual(foo.hdr.namesize, 4)
+            self.assertEqual(foo.hdr.dev_maj, 8)
+            self.assertEqual(foo.hdr.dev_min, 10)
+            self.assertEqual(foo.hdr._offset, 80)
+            self.assertEqual(foo.read(), 'file foo\n')
+            foobar = archive.find('foobar')
+            self.assertEqual(foobar.hdr.mtime, 1340493602)
+            self.assertEqual(foobar.read(), 'This is file\nbar.\n')
+
 if __name__ == '__main__':
     unittest.main()
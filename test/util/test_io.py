@@ -4,7 +4,8 @@ import sys
 import tempfile
 from cStringIO import StringIO
 
-from osc2.util.io import TemporaryDirectory, mkdtemp, mkstemp
+import osc2.util.io
+from osc2.util.io import TemporaryDirectory, mkdtemp, mkstemp, clone_file
 from test.osctest import OscTestCase
 
 
@@ -290,5 +291,110 @@ class TestIO(OscTestCase):
                 self.assertEqual(f.read(), 'foobar')
         self.assertFalse(os.path.isfile(tmpfile))
 
+    def test_clone_file1(self):
+        """test clone_file"""
+        source = os.path.join(self._tmpdir, 'source')
+        dest = os.path.join(self._tmpdir, 'dest')
+        data = 'foo\0bar\n' * 10000
+        with open(source, 'wb') as f:
+            f.write(data)
+        try:
+            clone_file(source, dest, mode=0600, mtime=1000)
+            with open(dest, 'rb') as f:
+                self.assertEqual(f.read(), data)
+            st = os.stat(dest)
+            self.assertEqual(st.st_mode & 0777, 0600)
+            self.assertEqual(st.st_mtime, 1000)
+            # modifying the clone does not modify the source
+            with open(dest, 'r+b') as f:
+                f.write('bar')
+            with open(source, 'rb') as f:
+                self.assertEqual(f.read(), data)
+            self.assertEqual(sorted(os.listdir(self._tmpdir)),
+                             ['dest', 'source'])
+        finally:
+            for fname in (source, dest):
+                if os.path.exists(fname):
+                    os.unlink(fname)
+
+    def test_clone_file2(self):
+        """test clone_file (nonexistent source)"""
+        source = os.path.join(self._tmpdir, 'source')
+        dest = os.path.join(self._tmpdir, 'dest')
+        self.assertRaises(ValueError, clone_file, source, dest)
+        self.assertFalse(os.path.exists(dest))
+
+    def test_clone_file3(self):
+        """test clone_file (short copy_file_range copy)"""
+        source = os.path.join(self._tmpdir, 'source')
+        dest = os.path.join(self._tmpdir, 'dest')
+        data = 'foo\0bar\n' * 10000
+        with open(source, 'wb') as f:
+            f.write(data)
+
+        def copy_file_range(src, dst, count):
+            # copies the first 100 bytes and then reports EOF
+            if os.fstat(dst).st_size:
+                return 0
+            return os.write(dst, os.read(src, 100))
+        orig_ficlone = osc2.util.io._ficlone
+        orig_copy_file_range = osc2.util.io._COPY_FILE_RANGE
+        osc2.util.io._ficlone = lambda fsource_obj, fdest_obj: False
+        osc2.util.io._COPY_FILE_RANGE = copy_file_range
+        try:
+            clone_file(source, dest)
+            with open(dest, 'rb') as f:
+                self.assertEqual(f.read(), data)
+            self.assertEqual(sorted(os.listdir(self._tmpdir)),
+                             ['dest', 'source'])
+        finally:
+            osc2.util.io._ficlone = orig_ficlone
+            osc2.util.io._COPY_FILE_RANGE = orig_copy_file_range
+            for fname in (source, dest):
+                if os.path.exists(fname):
+                    os.unlink(fname)
+    def test_clone_file4(self):
+        """test clone_file (the attributes do not depend on the method)"""
+        source = os.path.join(self._tmpdir, 'source')
+        dest = os.path.join(self._tmpdir, 'dest')
+        data = 'foo\0bar\n' * 10000
+        with open(source, 'wb') as f:
+            f.write(data)
+
+        def ficlone(fsource_obj, fdest_obj):
+            fdest_obj.write(fsource_obj.read())
+            return True
+
+        def copy_file_range(src, dst, count):
+            return os.write(dst, os.read(src, count))
+        # FICLONE, copy_file_range and copy_file
+        methods = [(ficlone, None),
+                   (lambda fsource_obj, fdest_obj: False, copy_file_range),
+                   (lambda fsource_obj, fdest_obj: False, None)]
+        orig_ficlone = osc2.util.io._ficlone
+        orig_copy_file_range = osc2.util.io._COPY_FILE_RANGE
+        try:
+            for ficlone_func, copy_file_range_func in methods:
+                osc2.util.io._ficlone = ficlone_func
+                osc2.util.io._COPY_FILE_RANGE = copy_file_range_func
+                clone_file(source, dest, mode=0600, mtime=1000,
+                           uid=os.geteuid(), gid=os.getegid())
+                with open(dest, 'rb') as f:
+                    self.assertEqual(f.read(), data)
+                st = os.stat(dest)
+                self.assertEqual(st.st_mode & 0777, 0600)
+                self.assertEqual(st.st_mtime, 1000)
+                self.assertEqual(st.st_uid, os.geteuid())
+                self.assertEqual(st.st_gid, os.getegid())
+                self.assertEqual(sorted(os.listdir(self._tmpdir)),
+                                 ['dest', 'source'])
+                os.unlink(dest)
+        finally:
+            osc2.util.io._ficlone = orig_ficlone
+            osc2.util.io._COPY_FILE_RANGE = orig_copy_file_range
+            for fname in (source, dest):
+                if os.path.exists(fname):
+                    os.unlink(fname)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import threading
+
+from osc2.util.parallel import imap, imap_unordered
+from test.osctest import OscTestCase
+
+
+def suite():
+    return unittest.makeSuite(TestParallel)
+
+
+class TestParallel(OscTestCase):
+    def test1(self):
+        """test imap (sequential)"""
+        threads = set()
+
+        def func(i):
+            threads.add(threading.current_thread())
+            return i * 2
+
+        self.assertEqual(list(imap(func, range(5))), [0, 2, 4, 6, 8])
+        self.assertEqual(threads, set([threading.current_thread()]))
+
+    def test2(self):
+        """test imap (concurrent, results are ordered)"""
+        # the first task finishes last
+        events = [threading.Event() for _ in range(4)]
+
+        def func(i):
+            if i == 0:
+                for event in events[1:]:
+                    event.wait(5)
+            else:
+                events[i].set()
+            return i
+
+        self.assertEqual(list(imap(func, range(4), workers=4)),
+                         [0, 1, 2, 3])
+        self.assertTrue(all([event.is_set() for event in events[1:]]))
+
+    def test3(self):
+        """test imap (exception is re-raised)"""
+        def func(i):
+            if i == 2:
+                raise ValueError('invalid item')
+            return i
+
+        gen = imap(func, range(5), workers=2)
+        self.assertEqual(gen.next(), 0)
+        self.assertEqual(gen.next(), 1)
+        self.assertRaises(ValueError, gen.next)
+    def test4(self):
+        """test imap_unordered (results are yielded when ready)"""
+        # the first task finishes after all other results were yielded
+        yielded = threading.Event()
+
+        def func(i):
+            if i == 0:
+                yielded.wait(5)
+            return i
+
+        results = []
+        for result in imap_unordered(func, range(4), workers=4):
+            results.append(result)
+            if len(results) == 3:
+                yielded.set()
+        self.assertEqual(results[-1], 0)
+        self.assertEqual(sorted(results), [0, 1, 2, 3])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,10 @@
 import unittest
+import threading
 from collections import Sequence
 
-from osc2.util.xml import fromstring
+from osc2.util.xml import (fromstring, get_parser, OscElement,
+                           compile_xpath, XPathCache)
+from osc2.util.xpath import XPathBuilder
 from test.osctest import OscTestCase
 
 
@@ -87,5 +90,71 @@ class TestXML(OscTestCase):
         """iterfind is not overriden (the default does not support an xpath)"""
         self.assertRaises(SyntaxError, self.xml.iterfind, '//foo')
 
+    def test_find_variable(self):
+        """Find with a variable"""
+        elm = self.xml.find('//bar[@name = $name]', name='xyz')
+        self.assertFalse(elm is None)
+        self.assertEqual(elm.get('name'), 'xyz')
+        # a quote in the value is no problem
+        elm = self.xml.find('//bar[@name = $name]', name='x"y\'z')
+        self.assertTrue(elm is None)
+
+    def test_findall_variable(self):
+        """Findall with a variable and an Expression"""
+        xpb = XPathBuilder()
+        xp = xpb.descendant('bar')[xpb.attr('name') == xpb.var('name')]
+        elms = self.xml.findall(xp, name='xyz')
+        self.assertEqual(len(elms), 1)
+        self.assertEqual(len(self.xml.findall(xp, name='abc')), 0)
+
+    def test_compile_xpath_cached(self):
+        """compile_xpath returns a cached compiled xpath"""
+        xp = compile_xpath('//bar[@name = $name]')
+        self.assertTrue(xp is compile_xpath('//bar[@name = $name]'))
+        self.assertFalse(xp is compile_xpath('//bar'))
+
+    def test_xpath_cache_lru(self):
+        """the least recently used xpaths are evicted"""
+        cache = XPathCache(4)
+        xps = [cache.get("/foo%d" % i) for i in range(4)]
+        # use /foo0 and /foo1 again
+        self.assertTrue(cache.get('/foo0') is xps[0])
+        self.assertTrue(cache.get('/foo1') is xps[1])
+        # cache is full => /foo2 and /foo3 are evicted
+        cache.get('/foo4')
+        self.assertTrue(cache.get('/foo0') is xps[0])
+        self.assertTrue(cache.get('/foo1') is xps[1])
+        self.assertFalse(cache.get('/foo2') is xps[2])
+
+    def test_get_parser_cached(self):
+        """get_parser returns a cached parser for the same arguments"""
+        class Foo(OscElement):
+            pass
+
+        parser = get_parser(foo=Foo)
+        self.assertTrue(parser is get_parser(foo=Foo))
+        self.assertFalse(parser is get_parser())
+        self.assertFalse(parser is get_parser(bar=Foo))
+        self.assertFalse(parser is get_parser(tree_class=Foo))
+        xml = fromstring('<root><foo/></root>', foo=Foo)
+        self.assertTrue(isinstance(xml.foo, Foo))
+        # the cached parser can be used multiple times
+        xml = fromstring('<root><foo/><foo/></root>', foo=Foo)
+        self.assertEqual(len(xml.findall('foo')), 2)
+        self.assertTrue(isinstance(xml.findall('foo')[1], Foo))
+
+    def test_get_parser_thread_local(self):
+        """each thread has its own parser cache"""
+        parsers = []
+
+        def create():
+            parsers.append(get_parser())
+
+        thread = threading.Thread(target=create)
+        thread.start()
+        thread.join()
+        self.assertEqual(len(parsers), 1)
+        self.assertFalse(parsers[0] is get_parser())
+
 if __name__ == '__main__':
     unittest.main()
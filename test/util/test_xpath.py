@@ -621,5 +621,20 @@ class TestXPath(OscTest):
         exp = '/foo/bar[x/y or z]'
         self.assertEqual(xp.tostring(), exp)
 
+    def test_variable1(self):
+        """test a variable reference"""
+        xpb = XPathBuilder()
+        xp = xpb.foo.bar[xpb.attr('name') == xpb.var('name')]
+        exp = '/foo/bar[@name = $name]'
+        self.assertEqual(xp.tostring(), exp)
+
+    def test_variable2(self):
+        """test a variable reference in a function"""
+        xpb = XPathBuilder()
+        xp = xpb.foo[xpb.attr('name').contains(xpb.var('x'))
+                     & (xpb.attr('version') != xpb.var('y'))]
+        exp = '/foo[contains(@name, $x) and @version != $y]'
+        self.assertEqual(xp.tostring(), exp)
+
 if __name__ == '__main__':
     unittest.main()
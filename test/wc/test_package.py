@@ -2,16 +2,22 @@ import os
 import unittest
 import stat
 import sys
+import time
+import urllib2
 
 from lxml import etree
 
 from osc2.wc.base import (TransactionListener, FileConflictError,
                           PendingTransactionError)
-from osc2.wc.package import (Package, FileSkipHandler, PackageUpdateState,
-                             FileUpdateInfo, file_md5, is_binaryfile,
-                             FileCommitPolicy, UnifiedDiff, Diff)
+from osc2.wc.package import (Package, FileSkipHandler, SparseSkipHandler,
+                             PackageUpdateState, PackageCommitState,
+                             FileUpdateInfo, file_md5, file_scan,
+                             is_binaryfile,
+                             FileCommitPolicy, UnifiedDiff, Diff,
+                             BlobCache, Merge, ThreeWayMerge)
 from osc2.wc.util import WCInconsistentError, WCFormatVersionError
 from osc2.source import Package as SourcePackage
+from osc2.httprequest import HTTPError
 from osc2.util.io import mkdtemp
 from test.osctest import OscTest
 from test.httptest import GET, PUT, POST
@@ -172,6 +178,83 @@ class TestPackage(OscTest):
         self.assertEqual(pkg.status('nonexistent'), '?')
         self.assertEqual(pkg.status('unknown'), '?')
 
+    def test9_1(self):
+        """test status (md5sum is cached)"""
+        path = self.fixture_file('status1')
+        fname = os.path.join(path, 'file1')
+        os.utime(fname, (1310908346, 1310908346))
+        pkg = Package(path)
+        self.assertEqual(pkg.status('file1'), ' ')
+        cache = os.path.join(path, '.osc', '_md5cache')
+        self.assertTrue(os.path.isfile(cache))
+        with open(cache, 'r') as f:
+            self.assertTrue(f.read().rstrip('\n').endswith(' file1'))
+        # modify the file and restore its mtime: the changed ctime
+        # invalidates the cached md5sum
+        with open(fname, 'r+') as f:
+            f.write('bar foo')
+        os.utime(fname, (1310908346, 1310908346))
+        pkg = Package(path)
+        self.assertEqual(pkg.status('file1'), 'M')
+        # changed mtime: the file is rehashed
+        os.utime(fname, (1310908347, 1310908347))
+        self.assertEqual(pkg.status('file1'), 'M')
+        pkg = Package(path)
+        self.assertEqual(pkg.status('file1'), 'M')
+
+    def test9_2(self):
+        """test status (racy file is not cached)"""
+        path = self.fixture_file('status1')
+        fname = os.path.join(path, 'file1')
+        mtime = int(time.time()) + 100
+        os.utime(fname, (mtime, mtime))
+        pkg = Package(path)
+        self.assertEqual(pkg.status('file1'), ' ')
+        with open(fname, 'r+') as f:
+            f.write('bar foo')
+        os.utime(fname, (mtime, mtime))
+        self.assertEqual(pkg.status('file1'), 'M')
+        pkg = Package(path)
+        self.assertEqual(pkg.status('file1'), 'M')
+
+    def test9_3(self):
+        """test status (binary flag is cached; old cache format)"""
+        path = self.fixture_file('binary')
+        fname = os.path.join(path, 'binary')
+        os.utime(fname, (1310908346, 1310908346))
+        scan = file_scan(fname)
+        self.assertTrue(scan.binary)
+        self.assertEqual(scan.md5, file_md5(fname))
+        self.assertEqual(scan.size, os.path.getsize(fname))
+        cache = os.path.join(path, '.osc', '_md5cache')
+        st = os.stat(fname)
+        # an outdated cache entry without the binary flag
+        with open(cache, 'w') as f:
+            f.write("%d %d %d %s binary\n" % (st.st_size,
+                                              int(st.st_mtime * 1000000000),
+                                              st.st_ino, 'a' * 32))
+        pkg = Package(path)
+        self.assertEqual(pkg._md5cache.scan('binary'), scan)
+        with open(cache, 'r') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], 'md5cache 3')
+        self.assertEqual(lines[1].split(' ', 6)[4:],
+                         [scan.md5, '1', 'binary'])
+
+    def test9_4(self):
+        """test status (cached scan lookup does not read the file)"""
+        path = self.fixture_file('binary')
+        fname = os.path.join(path, 'binary')
+        os.utime(fname, (1310908346, 1310908346))
+        pkg = Package(path)
+        self.assertTrue(pkg._md5cache.cached('binary') is None)
+        scan = pkg._md5cache.scan('binary')
+        self.assertEqual(pkg._md5cache.cached('binary'), scan)
+        # the stat data changed: the entry is outdated
+        os.utime(fname, (1310908347, 1310908347))
+        self.assertTrue(pkg._md5cache.cached('binary') is None)
+        self.assertTrue(pkg._md5cache.cached('nonexistent') is None)
+
     @GET('http://localhost/source/prj/foo', file='foo_list1.xml')
     def test10(self):
         """test _calculate_updateinfo 1"""
@@ -411,6 +494,58 @@ class TestPackage(OscTest):
         self.assertEqual(pkg.status('bar'), ' ')
         self.assertEqual(pkg.status('foobar'), '?')
 
+    @GET('http://localhost/source/prj/update_1?rev=latest',
+         file='update_1_files.xml')
+    @GET(('http://localhost/source/prj/update_1/foo'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='update_1_foo')
+    def test_update1_1(self):
+        """test update (multiple transfer workers)"""
+        path = self.fixture_file('update_1')
+        tl = TL()
+        pkg = Package(path, transfer_workers=4, transaction_listener=[tl])
+        pkg.update()
+        self._check_md5(path, 'foo', '50747782d12074c2c04ba7f90bf264c9')
+        self._check_md5(path, 'foo', '50747782d12074c2c04ba7f90bf264c9',
+                        data=True)
+        self._not_exists(path, '_transaction', store=True)
+        self.assertEqual(pkg.status('foo'), ' ')
+        self.assertEqual(tl._transfer, [('download', 'foo')])
+
+    @GET('http://localhost/source/prj/update_17?rev=latest',
+         file='update_17_files.xml')
+    @GET(('http://localhost/source/prj/update_17/foo'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='update_1_foo',
+         unordered=True)
+    @GET(('http://localhost/source/prj/update_17/bar'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='update_2_foo',
+         unordered=True)
+    @GET(('http://localhost/source/prj/update_17/added'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='update_5_added',
+         unordered=True)
+    @GET(('http://localhost/source/prj/update_17/asdf'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='update_5_asdf',
+         unordered=True)
+    def test_update1_2(self):
+        """test update (adds + modifications, multiple transfer workers)"""
+        path = self.fixture_file('update_17')
+        tl = TL()
+        pkg = Package(path, transfer_workers=4, transaction_listener=[tl])
+        pkg.update()
+        md5s = {'foo': '50747782d12074c2c04ba7f90bf264c9',
+                'bar': 'ab188d08913498abdd01479cbfd6814c',
+                'added': '0e80600e984f2fdf3b341ebdea0b44ee',
+                'asdf': '0ca9f03c0b4cce5a5a317f297475cccf'}
+        for filename, md5 in md5s.iteritems():
+            self._check_md5(path, filename, md5)
+            self._check_md5(path, filename, md5, data=True)
+            self.assertEqual(pkg.status(filename), ' ')
+        self._not_exists(path, 'foobar')
+        self._not_exists(path, 'foobar', data=True)
+        self._not_exists(path, '_transaction', store=True)
+        # one notification per downloaded file
+        self.assertEqual(sorted(tl._transfer),
+                         [('download', f) for f in sorted(md5s.keys())])
+
     @GET('http://apiurl/source/prj/update_2?rev=latest',
          file='update_2_files.xml')
     @GET(('http://apiurl/source/prj/update_2/foo'
@@ -437,6 +572,29 @@ class TestPackage(OscTest):
         self.assertEqual(pkg.status('bar'), ' ')
         self.assertEqual(pkg.status('foobar'), '?')
 
+    @GET('http://apiurl/source/prj/update_2?rev=latest',
+         file='update_2_files.xml')
+    @GET(('http://apiurl/source/prj/update_2/foo'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='update_2_foo')
+    def test_update2_1(self):
+        """test update (custom merge class)"""
+        merges = []
+
+        class CustomMerge(object):
+            def merge(self, my_filename, old_filename, your_filename,
+                      out_filename):
+                merges.append(os.path.basename(out_filename))
+                with open(out_filename, 'w') as f:
+                    f.write(open(your_filename, 'r').read())
+                return Merge.SUCCESS
+
+        path = self.fixture_file('update_2')
+        pkg = Package(path, merge_class=CustomMerge)
+        pkg.update()
+        self.assertEqual(merges, ['foo'])
+        self._check_md5(path, 'foo', 'ab188d08913498abdd01479cbfd6814c')
+        self.assertEqual(pkg.status('foo'), ' ')
+
     @GET('http://localhost/source/prj/update_3?rev=latest',
          file='update_3_files.xml')
     @GET(('http://localhost/source/prj/update_3/foo'
@@ -486,6 +644,31 @@ class TestPackage(OscTest):
         self.assertEqual(pkg.status('bar'), ' ')
         self.assertEqual(pkg.status('foobar'), '?')
 
+    @GET('http://localhost/source/prj/update_4?rev=latest',
+         file='update_4_files.xml')
+    @GET(('http://localhost/source/prj/update_4/foo'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='update_4_foo')
+    def test_update4_1(self):
+        """test update (the new file is not scanned completely)"""
+        scans = []
+
+        class ScanMerge(Merge):
+            def _scan(self, filename):
+                scan = super(ScanMerge, self)._scan(filename)
+                scans.append((os.path.relpath(filename, path),
+                              scan is None))
+                return scan
+
+        path = self.fixture_file('update_4')
+        pkg = Package(path, merge_class=ScanMerge)
+        pkg.update()
+        self.assertEqual(pkg.status('foo'), 'C')
+        # only the new file has no (cached) scan
+        self.assertEqual([f for f, no_scan in scans if no_scan],
+                         [os.path.join('.osc', '_transaction', 'data',
+                                       'foo')])
+        self.assertTrue(('foo.mine', False) in scans)
+
     @GET('http://localhost/source/prj/update_5?rev=latest',
          file='update_5_files.xml')
     @GET('http://localhost/source/prj/update_5?rev=latest',
@@ -793,6 +976,61 @@ class TestPackage(OscTest):
         self.assertEqual(pkg.status('added'), 'A')
         self.assertEqual(pkg.status('file1'), ' ')
 
+    @GET('http://localhost/source/prj/update_6?rev=latest',
+         file='update_6_files.xml')
+    @GET(('http://localhost/source/prj/update_6/asdf'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='update_6_asdf')
+    @GET(('http://localhost/source/prj/update_6/added'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='update_6_added')
+    def test_update17(self):
+        """test update (sparse checkout + fetch all)"""
+        path = self.fixture_file('update_6')
+        tl = TL(abort=False)
+        pkg = Package(path, skip_handlers=[SparseSkipHandler(max_size=15)],
+                      transaction_listener=[tl])
+        pkg.update()
+        # existing files are not skipped
+        self.assertEqual(pkg.status('foo'), ' ')
+        self.assertEqual(pkg.status('added'), 'S')
+        self.assertEqual(pkg.status('asdf'), ' ')
+        self._not_exists(path, 'added')
+        self._not_exists(path, 'added', data=True)
+        self.assertEqual(tl._transfer, [('download', 'asdf')])
+        pkg.fetch()
+        self.assertEqual(pkg.status('added'), ' ')
+        self._check_md5(path, 'added', '0e80600e984f2fdf3b341ebdea0b44ee')
+        self._check_md5(path, 'added', '0e80600e984f2fdf3b341ebdea0b44ee',
+                        data=True)
+        # the downloads of fetch are reported to the listeners
+        self.assertEqual(tl._transfer, [('download', 'asdf'),
+                                        ('download', 'added')])
+
+    @GET('http://localhost/source/prj/update_6?rev=latest',
+         file='update_6_files.xml')
+    @GET(('http://localhost/source/prj/update_6/asdf'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='update_6_asdf')
+    def test_update18(self):
+        """test update (sparse checkout (patterns) + fetch file)"""
+        path = self.fixture_file('update_6')
+        handler = SparseSkipHandler(patterns=['*d*'])
+        pkg = Package(path, skip_handlers=[handler])
+        pkg.update()
+        self.assertEqual(pkg.status('added'), 'S')
+        self.assertEqual(pkg.status('asdf'), 'S')
+        # only skipped files can be fetched
+        self.assertRaises(ValueError, pkg.fetch, 'foo')
+        self.assertRaises(ValueError, pkg.fetch, 'asdf', 'foobar')
+        # an untracked file with a different content exists
+        with open(os.path.join(path, 'added'), 'w') as f:
+            f.write('conflict\n')
+        self.assertRaises(FileConflictError, pkg.fetch)
+        pkg.fetch('asdf')
+        self.assertEqual(pkg.status('asdf'), ' ')
+        self.assertEqual(pkg.status('added'), 'S')
+        self._check_md5(path, 'asdf', '0ca9f03c0b4cce5a5a317f297475cccf')
+        self._check_md5(path, 'asdf', '0ca9f03c0b4cce5a5a317f297475cccf',
+                        data=True)
+
     def test_resolved1(self):
         """test resolved"""
         path = self.fixture_file('status1')
@@ -1210,6 +1448,30 @@ class TestPackage(OscTest):
         self.assertEqual(pkg.status('bar'), ' ')
         self.assertEqual(pkg.status('foobar'), ' ')
 
+    @GET('http://apiurl/source/prj/update_2?rev=latest',
+         file='commit_1_latest.xml')
+    @POST('http://apiurl/source/prj/update_2?cmd=commitfilelist',
+          exp_content_type='application/xml', expfile='commit_1_lfiles.xml',
+          file='commit_1_mfiles.xml')
+    @PUT('http://apiurl/source/prj/update_2/foo?rev=repository',
+         expfile='commit_1_foo', text=UPLOAD_REV)
+    @POST('http://apiurl/source/prj/update_2?cmd=commitfilelist',
+          exp_content_type='application/xml', expfile='commit_1_lfiles.xml',
+          file='commit_1_files.xml')
+    def test_commit1_1(self):
+        """test commit (modified, multiple transfer workers)"""
+        path = self.fixture_file('update_2')
+        tl = TL()
+        pkg = Package(path, transfer_workers=4, transaction_listener=[tl])
+        self.assertEqual(pkg.status('foo'), 'M')
+        pkg.commit()
+        self._check_md5(path, 'foo', '90aa8a29ecd8d33e7b099c0f108c026b',
+                        data=True)
+        self.assertEqual(pkg.status('foo'), ' ')
+        self._not_exists(path, '_transaction', store=True)
+        self.assertEqual(tl._transfer, [('upload', 'foo')])
+        self.assertEqual(tl._processed['foo'], (' ', 'M'))
+
     @GET('http://localhost/source/prj/update_11?rev=latest',
          file='commit_2_latest.xml')
     @POST('http://localhost/source/prj/update_11?cmd=commitfilelist',
@@ -1372,6 +1634,84 @@ class TestPackage(OscTest):
         self.assertEqual(pkg.status('missing'), '!')
         self.assertEqual(pkg.status('added'), ' ')
 
+    @GET('http://localhost/source/prj/commit_6?rev=latest',
+         file='commit_6_latest.xml')
+    @POST('http://localhost/source/prj/commit_6?cmd=commitfilelist&comment=x',
+          expfile='commit_6_lfiles1.xml', file='commit_6_mfiles1.xml')
+    @PUT('http://localhost/source/prj/commit_6/foo?rev=repository',
+         expfile='commit_6_foo', text=UPLOAD_REV, unordered=True)
+    @PUT('http://localhost/source/prj/commit_6/added?rev=repository',
+         expfile='commit_6_added', text=UPLOAD_REV, unordered=True)
+    @POST('http://localhost/source/prj/commit_6?cmd=commitfilelist&comment=x',
+          expfile='commit_6_lfiles1.xml', file='commit_6_files1.xml')
+    def test_commit6_1(self):
+        """test commit (added and modified files, multiple workers)"""
+        path = self.fixture_file('commit_6')
+        tl = TL()
+        pkg = Package(path, transfer_workers=4, transaction_listener=[tl])
+        pkg.commit('foo', 'bar', 'foobar', 'added', comment='x')
+        self._check_md5(path, 'foo', '5fb9f8bed64fb741e760b0db312b7c5a',
+                        data=True)
+        self._check_md5(path, 'added', '8dee900466b680b0717524878e42bf04',
+                        data=True)
+        self._exists(path, 'foo')
+        self._exists(path, 'added')
+        self._not_exists(path, '_transaction', store=True)
+        self.assertEqual(pkg.status('foo'), ' ')
+        self.assertEqual(pkg.status('added'), ' ')
+        self.assertEqual(sorted(tl._transfer), [('upload', 'added'),
+                                                ('upload', 'foo')])
+        self.assertEqual(tl._processed['foo'], (' ', 'M'))
+        self.assertEqual(tl._processed['added'], (' ', 'A'))
+
+    @GET('http://localhost/source/prj/commit_6?rev=latest',
+         file='commit_6_latest.xml')
+    @POST('http://localhost/source/prj/commit_6?cmd=commitfilelist&comment=x',
+          expfile='commit_6_lfiles1.xml', file='commit_6_mfiles1.xml')
+    @PUT('http://localhost/source/prj/commit_6/foo?rev=repository',
+         expfile='commit_6_foo', text=UPLOAD_REV, unordered=True)
+    @PUT('http://localhost/source/prj/commit_6/added?rev=repository',
+         expfile='commit_6_added', unordered=True,
+         exception=urllib2.HTTPError('http://localhost', 500, 'error',
+                                     {}, None))
+    @GET('http://localhost/source/prj/commit_6?rev=latest',
+         file='commit_6_latest.xml')
+    @POST('http://localhost/source/prj/commit_6?cmd=commitfilelist&comment=x',
+          expfile='commit_6_lfiles1.xml', file='commit_6_mfiles2.xml')
+    @PUT('http://localhost/source/prj/commit_6/added?rev=repository',
+         expfile='commit_6_added', text=UPLOAD_REV)
+    @POST('http://localhost/source/prj/commit_6?cmd=commitfilelist&comment=x',
+          expfile='commit_6_lfiles1.xml', file='commit_6_files1.xml')
+    def test_commit6_2(self):
+        """test commit (failed upload, multiple workers)"""
+        path = self.fixture_file('commit_6')
+        tl = TL()
+        pkg = Package(path, transfer_workers=4, transaction_listener=[tl])
+        self.assertRaises(HTTPError, pkg.commit, 'foo', 'bar', 'foobar',
+                          'added', comment='x')
+        # the finished upload is recorded
+        self.assertEqual(tl._transfer, [('upload', 'foo')])
+        cstate = PackageCommitState.read_state(path)
+        self.assertEqual(cstate.entrystates['foo'], ' ')
+        self.assertEqual(cstate.entrystates['added'], 'A')
+        self.assertEqual(os.listdir(cstate.location), ['foo'])
+        # the server only reports the file of the failed upload as
+        # missing, so only this file is sent again
+        tl = TL()
+        pkg = Package(path, transfer_workers=4, transaction_listener=[tl])
+        pkg.commit('foo', 'bar', 'foobar', 'added', comment='x')
+        self.assertEqual(tl._transfer, [('upload', 'added')])
+        # the store file of the already uploaded file is updated as well
+        self.assertEqual(tl._processed['foo'], (' ', 'M'))
+        self._check_md5(path, 'foo', '5fb9f8bed64fb741e760b0db312b7c5a',
+                        data=True)
+        self._check_md5(path, 'added', '8dee900466b680b0717524878e42bf04',
+                        data=True)
+        self._exists(path, 'foo')
+        self._not_exists(path, '_transaction', store=True)
+        self.assertEqual(pkg.status('foo'), ' ')
+        self.assertEqual(pkg.status('added'), ' ')
+
     def test_commit7(self):
         """test commit (fails because a missing file should be committed)"""
         path = self.fixture_file('commit_6')
@@ -1678,6 +2018,189 @@ class TestPackage(OscTest):
         self.assertEqual(d.missing, ['missing'])
         self.assertEqual(d.skipped, ['skipped'])
 
+    @GET('http://localhost/source/foo/status1?rev=77',
+         file='status1_list2.xml')
+    @GET(('http://localhost/source/foo/status1/added'
+          '?rev=bbbbaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='status1_added')
+    @GET('http://localhost/source/foo/status1?rev=77',
+         file='status1_list2.xml')
+    def test_diff13(self):
+        """test diff (remote revision; blob is cached after cleanup)"""
+        path = self.fixture_file('status1')
+        ud = UD()
+        pkg = Package(path)
+        pkg.diff(ud, 'added', revision='77')
+        ud.diff()
+        ud.cleanup()
+        self._not_exists(path, 'diff', store=True)
+        self._exists(path, 'blobs', '2efdf9a5f8ecb7089e7ffa2762e9c6e6',
+                     store=True)
+        # the file is not downloaded again
+        data = ud.diff_data
+        ud = UD()
+        pkg.diff(ud, 'added', revision='77')
+        ud.diff()
+        self.assertEqual(ud.diff_data, data)
+        ud.cleanup()
+
+    @GET('http://localhost/source/foo/status1?rev=78',
+         file='status1_list3.xml')
+    def test_diff14(self):
+        """test diff (remote revision; blob is seeded from the store)"""
+        path = self.fixture_file('status1')
+        ud = UD()
+        pkg = Package(path)
+        pkg.diff(ud, 'added', revision='78')
+        ud.diff()
+        self.assertTrue('-foo bar\n' in ud.diff_data)
+        self._exists(path, 'blobs', '5ceaa7ed396ccb8e959c02753cb4bd18',
+                     store=True)
+        ud.cleanup()
+
+    def test_diff15(self):
+        """test diff (process is called incrementally)"""
+        class ChunkUD(UnifiedDiff):
+            CHUNK_LINES = 2
+
+            def __init__(self):
+                super(ChunkUD, self).__init__()
+                self.chunks = []
+
+            def process(self, data):
+                self.chunks.append(data)
+        path = self.fixture_file('status1')
+        with open(os.path.join(path, 'added'), 'w') as f:
+            f.write('a\nb\nc')
+        ud = ChunkUD()
+        pkg = Package(path)
+        pkg.diff(ud, 'added')
+        ud.diff()
+        self.assertEqual(len(ud.chunks), 3)
+        self.assertEqual(ud.chunks[0][-1], '@@ -0,0 +1,3 @@\n')
+        self.assertEqual(ud.chunks[1], ['+a\n', '+b\n'])
+        self.assertEqual(ud.chunks[2],
+                         ['+c', '\n\\ No newline at end of file\n'])
+
+    def test_diff16(self):
+        """test diff (added file is streamed and not scanned completely)"""
+        import osc2.wc.package
+
+        class ChunkUD(UnifiedDiff):
+            CHUNK_LINES = 2
+
+            def __init__(self):
+                super(ChunkUD, self).__init__()
+                self.chunks = []
+
+            def process(self, data):
+                self.chunks.append(data)
+        path = self.fixture_file('status1')
+        long_line = 'x' * (3 * 1024 * 1024)
+        with open(os.path.join(path, 'added'), 'w') as f:
+            f.write('a\n%s\nb\nc\n' % long_line)
+        ud = ChunkUD()
+        pkg = Package(path)
+        pkg.diff(ud, 'added')
+
+        def file_scan(filename):
+            raise AssertionError("%s is scanned" % filename)
+        orig_file_scan = osc2.wc.package.file_scan
+        osc2.wc.package.file_scan = file_scan
+        try:
+            ud.diff()
+        finally:
+            osc2.wc.package.file_scan = orig_file_scan
+        self.assertEqual(len(ud.chunks), 3)
+        self.assertEqual(ud.chunks[0][-1], '@@ -0,0 +1,4 @@\n')
+        self.assertEqual(ud.chunks[1], ['+a\n', "+%s\n" % long_line])
+        self.assertEqual(ud.chunks[2], ['+b\n', '+c\n'])
+
+    def _merge(self, my, old, your):
+        filenames = []
+        for name, data in (('my', my), ('old', old), ('your', your)):
+            filename = self.fixture_file(name)
+            with open(filename, 'w') as f:
+                f.write(data)
+            filenames.append(filename)
+        out = self.fixture_file('out')
+        ret = ThreeWayMerge().merge(*(filenames + [out]))
+        with open(out, 'r') as f:
+            return ret, f.read()
+
+    def test_threewaymerge0(self):
+        """test ThreeWayMerge is not the default merge class"""
+        path = self.fixture_file('update_6')
+        self.assertTrue(Package(path).merge_class is Merge)
+        pkg = Package(path, merge_class=ThreeWayMerge)
+        self.assertTrue(pkg.merge_class is ThreeWayMerge)
+
+    def test_threewaymerge1(self):
+        """test ThreeWayMerge (no conflicts)"""
+        ret, data = self._merge('a\nb\nc\nd\ne\n', 'a\nb\nc\nd\n',
+                                'A\nb\nc\nd\n')
+        self.assertEqual(ret, Merge.SUCCESS)
+        self.assertEqual(data, 'A\nb\nc\nd\ne\n')
+        # identical changes
+        ret, data = self._merge('a\nB\nc\n', 'a\nb\nc\n', 'a\nB\nc\n')
+        self.assertEqual(ret, Merge.SUCCESS)
+        self.assertEqual(data, 'a\nB\nc\n')
+
+    def test_threewaymerge2(self):
+        """test ThreeWayMerge (conflicts)"""
+        ret, data = self._merge('a\nB\nc\nd\ne\nF\n',
+                                'a\nb\nc\nd\ne\nf\n',
+                                'a\nX\nc\nd\nE\nf')
+        self.assertEqual(ret, Merge.CONFLICT)
+        my = self.fixture_file('my')
+        your = self.fixture_file('your')
+        # same output as "diff3 -m -E" (except for the missing newline)
+        expected = ('a\n<<<<<<< %s\nB\n=======\nX\n>>>>>>> %s\nc\nd\n'
+                    '<<<<<<< %s\ne\nF\n=======\nE\nf\n>>>>>>> %s\n'
+                    % (my, your, my, your))
+        self.assertEqual(data, expected)
+
+    def test_threewaymerge3(self):
+        """test ThreeWayMerge (large file with unique lines)"""
+        old = ['line %d\n' % i for i in range(2000)]
+        my = list(old)
+        your = list(old)
+        for i in range(0, 2000, 100):
+            my[i] = 'my %d\n' % i
+            your.insert(i + 50, 'your %d\n' % i)
+        ret, data = self._merge(''.join(my), ''.join(old), ''.join(your))
+        self.assertEqual(ret, Merge.SUCCESS)
+        expected = list(my)
+        for i in range(0, 2000, 100):
+            expected.insert(i + 50, 'your %d\n' % i)
+        self.assertEqual(data, ''.join(expected))
+
+    def test_blobcache1(self):
+        """test BlobCache (least recently used blobs are removed)"""
+        path = self.fixture_file('status1')
+        cache = BlobCache(path, max_size=20)
+        cache.seed('5ceaa7ed396ccb8e959c02753cb4bd18',
+                   os.path.join(path, '.osc', 'data', 'file1'))
+        blob = cache.get('3b1bdf8c96e0eb96a4e0c7854478ef13')
+        self.assertTrue(blob is None)
+        blob = cache.get('5ceaa7ed396ccb8e959c02753cb4bd18')
+        self.assertEqual(open(blob, 'r').read(), 'foo bar\n')
+        os.utime(blob, (0, 0))
+
+        filename = os.path.join(path, 'modified')
+        with open(filename, 'w') as f:
+            f.write('modified\nfile\n')
+        # the md5sum is verified
+        blob = cache.add('00000000000000000000000000000000', filename)
+        self.assertTrue(blob is None)
+        self._not_exists(path, 'blobs', '00000000000000000000000000000000',
+                         store=True)
+        cache.add('3b1bdf8c96e0eb96a4e0c7854478ef13', filename)
+        cache.shrink()
+        self._exists(path, 'blobs', '3b1bdf8c96e0eb96a4e0c7854478ef13',
+                     store=True)
+        self._not_exists(path, 'blobs', '5ceaa7ed396ccb8e959c02753cb4bd18',
+                         store=True)
+
     def test_repair1(self):
         """test repair (_package missing)"""
         path = self.fixture_file('inv_foo1')
@@ -1702,6 +2225,39 @@ class TestPackage(OscTest):
         self.assertEqual(Package.wc_check(path), ([], '', []))
         Package(path)
 
+    @GET(('http://localhost/source/prj/inv_foo2/file'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='inv_foo2_file')
+    def test_repair2_1(self):
+        """test repair (pkg data file missing, multiple workers)"""
+        path = self.fixture_file('inv_foo2')
+        self._not_exists(path, 'file', data=True)
+        Package.repair(path, workers=4)
+        self._exists(path, 'file', data=True)
+        self.assertEqual(Package.wc_check(path), ([], '', []))
+
+    @GET(('http://localhost/source/prj/inv_foo6/file'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='inv_foo2_file',
+         unordered=True)
+    @GET(('http://localhost/source/prj/inv_foo6/added'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='update_5_added',
+         unordered=True)
+    @GET(('http://localhost/source/prj/inv_foo6/asdf'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='update_5_asdf',
+         unordered=True)
+    def test_repair2_2(self):
+        """test repair (pkg data files missing, multiple workers)"""
+        path = self.fixture_file('inv_foo6')
+        self.assertRaises(WCInconsistentError, Package, path)
+        Package.repair(path, workers=4)
+        self.assertEqual(Package.wc_check(path), ([], '', []))
+        Package(path)
+        self._check_md5(path, 'file', 'd8e8fca2dc0f896fd7cb4cb0031ba249',
+                        data=True)
+        self._check_md5(path, 'added', '0e80600e984f2fdf3b341ebdea0b44ee',
+                        data=True)
+        self._check_md5(path, 'asdf', '0ca9f03c0b4cce5a5a317f297475cccf',
+                        data=True)
+
     @GET('http://localhost/source/prj/inv_foo3?rev=latest',
          file='inv_foo3_files.xml')
     def test_repair3(self):
@@ -1,11 +1,12 @@
 import os
 import unittest
 import shutil
+import threading
 
 from osc2.wc.base import (FileConflictError, TransactionListener,
                           UpdateStateMixin)
-from osc2.wc.project import Project, ProjectUpdateState
-from osc2.wc.util import WCInconsistentError
+from osc2.wc.project import Project, ProjectUpdateState, PackageUpdateInfo
+from osc2.wc.util import WCInconsistentError, wc_init_object_store
 from osc2.util.io import mkdtemp
 from test.osctest import OscTest
 from test.httptest import GET, PUT, POST, DELETE
@@ -550,6 +551,256 @@ class TestProject(OscTest):
         self.assertEqual(ustate.state, UpdateStateMixin.STATE_PREPARE)
         self.assertEqual(ustate.entrystates['foo'], ' ')
 
+    def test_update12(self):
+        """test update (finish pending concurrent add transactions)"""
+        path = self.fixture_file('prj1_update_resume_parallel')
+        prj = Project(path, finish_pending_transaction=False)
+        ustate = ProjectUpdateState.read_state(path)
+        self.assertEqual(ustate.updating, ['foo', 'bar'])
+        prj.update()
+        for package in ('foo', 'bar'):
+            self.assertEqual(prj._status(package), ' ')
+            self._exists(path, package, 'file')
+            self._exists(path, '.osc', 'data', package)
+        # baz was not updated yet
+        self.assertEqual(prj._status('baz'), '?')
+        self._not_exists(path, 'baz')
+        self._not_exists(path, '.osc', '_transaction')
+
+    @GET('http://apiurl/source/prj1', file='prj1_list2.xml')
+    @GET('http://apiurl/source/prj1/foo?rev=latest', file='foo_list2.xml',
+         unordered=True)
+    @GET(('http://apiurl/source/prj1/foo/file'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaf'), file='foo_file',
+         unordered=True)
+    @GET('http://apiurl/source/prj1/bar?rev=latest', file='bar_list1.xml',
+         unordered=True)
+    @GET(('http://apiurl/source/prj1/bar/file'
+          '?rev=bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbf'), file='foo_file',
+         unordered=True)
+    def test_update13(self):
+        """test update (add packages, multiple workers)"""
+        path = self.fixture_file('prj1')
+        tl = TL(abort=False)
+        prj = Project(path, transaction_listener=[tl])
+        self.assertEqual(prj._status('foo'), '?')
+        self.assertEqual(prj._status('bar'), '?')
+        prj.update('foo', 'bar', workers=4)
+        for package in ('foo', 'bar'):
+            self.assertEqual(prj._status(package), ' ')
+            self._exists(path, package, 'file')
+            self._exists(path, '.osc', 'data', package)
+            self.assertEqual(tl._processed[package], (' ', None))
+        self._not_exists(path, '.osc', '_transaction')
+        self.assertEqual(tl._begin, ['prj_update', 'update', 'update'])
+        self.assertEqual(tl._finished, ['update', 'update', 'prj_update'])
+        self.assertEqual(tl._transfer, [('download', 'file'),
+                                        ('download', 'file')])
+
+    @GET('http://apiurl/source/prj1', file='prj1_list2.xml')
+    @GET('http://apiurl/source/prj1/foo?rev=latest', file='foo_list2.xml',
+         unordered=True)
+    @GET(('http://apiurl/source/prj1/foo/file'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaf'), file='foo_file',
+         unordered=True)
+    @GET('http://apiurl/source/prj1/bar?rev=latest', file='bar_list1.xml',
+         unordered=True)
+    @GET(('http://apiurl/source/prj1/bar/file'
+          '?rev=bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbf'), file='foo_file',
+         unordered=True)
+    def test_update13_1(self):
+        """test update (resume an interrupted update, multiple workers)"""
+        bar_processed = threading.Event()
+        processed = ProjectUpdateState.processed
+
+        def interrupt(ustate, package, new_state=None):
+            if package == 'foo':
+                # foo's package transaction is finished but foo is not
+                # processed by the project
+                bar_processed.wait(5)
+                raise ValueError('interrupted')
+            processed(ustate, package, new_state)
+            bar_processed.set()
+
+        path = self.fixture_file('prj1')
+        tl = TL(abort=False)
+        prj = Project(path, transaction_listener=[tl])
+        ProjectUpdateState.processed = interrupt
+        try:
+            self.assertRaises(ValueError, prj.update, 'foo', 'bar',
+                              workers=4)
+        finally:
+            ProjectUpdateState.processed = processed
+        # both package transactions were finished
+        self.assertEqual(tl._finished, ['update', 'update'])
+        self.assertEqual(tl._processed['bar'], (' ', None))
+        self.assertFalse('foo' in tl._processed)
+        ustate = ProjectUpdateState.read_state(path)
+        self.assertEqual(ustate.state, UpdateStateMixin.STATE_UPDATING)
+        self.assertEqual(ustate.updating, ['foo'])
+        # finish the pending update (no package transaction is started)
+        tl = TL(abort=False)
+        prj = Project(path, transaction_listener=[tl],
+                      finish_pending_transaction=False)
+        prj.update(workers=4)
+        for package in ('foo', 'bar'):
+            self.assertEqual(prj._status(package), ' ')
+            self._exists(path, package, 'file')
+            self._exists(path, '.osc', 'data', package)
+        self._not_exists(path, '.osc', '_transaction')
+        self.assertEqual(tl._begin, [])
+        self.assertEqual(tl._transfer, [])
+        self.assertEqual(tl._processed, {'foo': (' ', None)})
+
+    @GET('http://apiurl/source/prj1', file='prj1_list.xml')
+    @GET('http://apiurl/source/prj1/foo?rev=latest', file='foo_list2.xml')
+    @GET(('http://apiurl/source/prj1/foo/file'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaf'), file='foo_file')
+    def test_update14(self):
+        """test update (add package, object store)"""
+        path = self.fixture_file('prj1')
+        wc_init_object_store(path)
+        prj = Project(path)
+        prj.update('foo')
+        self.assertEqual(prj._status('foo'), ' ')
+        obj = os.path.join(path, '.osc', 'objects',
+                           'bd7cd8e5e37fa4c6ea88f9fe2bedd5fe')
+        data = os.path.join(path, '.osc', 'data', 'foo', 'data', 'file')
+        self.assertEqual(os.stat(obj).st_ino, os.stat(data).st_ino)
+        # the wc file is no hardlink
+        wc_file = os.path.join(path, 'foo', 'file')
+        self.assertEqual(os.stat(wc_file).st_nlink, 1)
+
+    @GET('http://apiurl/source/prj1', file='prj1_list.xml')
+    @GET('http://apiurl/source/prj1/foo?rev=latest', file='foo_list2.xml')
+    def test_update15(self):
+        """test update (add package, file exists in the object store)"""
+        path = self.fixture_file('prj1')
+        wc_init_object_store(path)
+        obj = os.path.join(path, '.osc', 'objects',
+                           'bd7cd8e5e37fa4c6ea88f9fe2bedd5fe')
+        shutil.copyfile(self.fixture_file('foo_file'), obj)
+        tl = TL(abort=False)
+        prj = Project(path, transaction_listener=[tl])
+        prj.update('foo')
+        self.assertEqual(prj._status('foo'), ' ')
+        self.assertEqual(tl._transfer, [])
+        data = os.path.join(path, '.osc', 'data', 'foo', 'data', 'file')
+        self.assertEqual(os.stat(obj).st_ino, os.stat(data).st_ino)
+        self._exists(path, 'foo', 'file')
+
+    @GET('http://localhost/source/prj2', file='prj2_list2.xml')
+    @GET(('http://localhost/source/prj2?nofilename=1&package=foo'
+          '&package=foo_modified&view=info'),
+         file='prj2_sourceinfo.xml')
+    @GET('http://localhost/source/prj2/foo?expand=1&rev=latest',
+         file='foo_list1.xml')
+    @GET(('http://localhost/source/prj2/foo/added'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='foo_added_file')
+    def test_update16(self):
+        """test update (unchanged packages are skipped)"""
+        path = self.fixture_file('prj2')
+        tl = ProjectTL()
+        prj = Project(path, transaction_listener=[tl])
+        # no listing is requested for foo_modified
+        prj.update('foo', 'foo_modified', expand='1')
+        self.assertEqual(prj._status('foo'), ' ')
+        self.assertEqual(prj._status('foo_modified'), ' ')
+        self._exists(path, 'foo', 'added')
+        self._not_exists(path, '.osc', '_transaction')
+        self.assertEqual(tl._begin, ['prj_update', 'update'])
+        self.assertTrue('prj_update:foo' in tl._processed)
+        self.assertFalse('prj_update:foo_modified' in tl._processed)
+
+    def test_updatestate1(self):
+        """test ProjectUpdateState (per package updating state)"""
+        path = self.fixture_file('prj1_update_state_prepare')
+        ustate = ProjectUpdateState.read_state(path)
+        self.assertEqual(ustate.updating, [])
+        ustate.mark_updating('foo')
+        ustate = ProjectUpdateState.read_state(path)
+        self.assertEqual(ustate.state, UpdateStateMixin.STATE_UPDATING)
+        self.assertEqual(ustate.updating, ['foo'])
+        ustate.processed('foo', ' ')
+        ustate = ProjectUpdateState.read_state(path)
+        self.assertEqual(ustate.state, UpdateStateMixin.STATE_PREPARE)
+        self.assertEqual(ustate.updating, [])
+
+    def test_updatestate2(self):
+        """test ProjectUpdateState (journal replay)"""
+        path = self.fixture_file('prj1_update_resume_parallel')
+        state_fname = os.path.join(path, '.osc', '_transaction', 'state')
+        journal = os.path.join(path, '.osc', '_transaction', 'journal')
+        state_data = open(state_fname, 'r').read()
+        ustate = ProjectUpdateState.read_state(path)
+        ustate.processed('foo', ' ')
+        # the state file is not rewritten
+        self.assertEqual(open(state_fname, 'r').read(), state_data)
+        self.assertTrue(os.path.isfile(journal))
+        ustate = ProjectUpdateState.read_state(path)
+        self.assertEqual(ustate.entrystates, {'foo': ' '})
+        self.assertEqual(ustate.updating, ['bar'])
+        self.assertEqual(ustate.info.added, ['bar', 'baz'])
+        self.assertEqual(ustate.state, UpdateStateMixin.STATE_UPDATING)
+        # an incomplete record is ignored
+        with open(journal, 'a') as f:
+            f.write('processed\tbar')
+        ustate = ProjectUpdateState.read_state(path)
+        self.assertEqual(ustate.info.added, ['bar', 'baz'])
+        # the incomplete record is removed before a new record is appended
+        ustate.processed('baz', 'A')
+        ustate = ProjectUpdateState.read_state(path)
+        self.assertEqual(ustate.entrystates, {'foo': ' ', 'baz': 'A'})
+        self.assertEqual(ustate.info.added, ['bar'])
+        # clear_info writes the complete state and removes the journal
+        ustate.clear_info(*ustate.updating)
+        self.assertFalse(os.path.exists(journal))
+        ustate = ProjectUpdateState.read_state(path)
+        self.assertEqual(ustate.entrystates, {'foo': ' ', 'baz': 'A'})
+        self.assertEqual(ustate.info.added, ['bar'])
+        ustate.processed('bar', ' ')
+        ustate = ProjectUpdateState.read_state(path)
+        self.assertEqual(ustate.entrystates,
+                         {'foo': ' ', 'bar': ' ', 'baz': 'A'})
+        self.assertEqual(ustate.updating, [])
+        self.assertEqual(ustate.state, UpdateStateMixin.STATE_PREPARE)
+
+    def test_updatestate3(self):
+        """test ProjectUpdateState (journal replay; tab and newline)"""
+        path = self.fixture_file('prj1')
+        name = 'foo\tbar\nbaz%09'
+        uinfo = PackageUpdateInfo('prj1', [], [name, 'foo'], [], [])
+        ustate = ProjectUpdateState(path, uinfo=uinfo)
+        ustate.processed(name, ' ')
+        journal = os.path.join(path, '.osc', '_transaction', 'journal')
+        self.assertTrue(os.path.isfile(journal))
+        ustate = ProjectUpdateState.read_state(path)
+        self.assertEqual(ustate.entrystates, {name: ' '})
+        self.assertEqual(ustate.info.added, ['foo'])
+        ustate.processed('foo', ' ')
+        ustate = ProjectUpdateState.read_state(path)
+        self.assertEqual(ustate.entrystates, {name: ' ', 'foo': ' '})
+        self.assertEqual(ustate.info.added, [])
+
+    def test_package_cache1(self):
+        """test package (cached Package objects)"""
+        path = self.fixture_file('prj2')
+        prj = Project(path)
+        pkg = prj.package('foo')
+        self.assertFalse(pkg is None)
+        self.assertTrue(prj.package('foo') is pkg)
+        # with additional arguments a new object is returned
+        self.assertFalse(prj.package('foo', verify_format=False) is pkg)
+        # modify _files via another Package object
+        other = prj.package('foo', verify_format=False)
+        with open(os.path.join(path, 'foo', 'new'), 'w') as f:
+            f.write('new\n')
+        other.add('new')
+        new_pkg = prj.package('foo')
+        self.assertFalse(new_pkg is pkg)
+        self.assertEqual(new_pkg.status('new'), 'A')
+        self.assertTrue(prj.package('foo') is new_pkg)
+
     def test_commitinfo1(self):
         """test commitinfo (complete project)"""
         path = self.fixture_file('prj2')
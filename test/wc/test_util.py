@@ -5,7 +5,7 @@ from test.osctest import OscTest
 from osc2.util.io import mkdtemp
 from osc2.wc.util import (WCFormatVersionError, wc_is_project, wc_is_package,
                           wc_read_project, wc_read_package, wc_read_apiurl,
-                          WCLock, wc_parent, wc_init)
+                          WCLock, wc_parent, wc_init, wc_read_packages)
 
 
 def suite():
@@ -310,5 +310,38 @@ class TestWCUtil(OscTest):
                           ext_storedir=storedir)
         self.assertFalse(os.path.exists(path))
 
+    def test_tracker1(self):
+        """test XMLPackageTracker find/add/set/remove"""
+        path = self.fixture_file('prj1')
+        packages = wc_read_packages(path)
+        self.assertEqual(packages.find('added').get('state'), 'A')
+        self.assertTrue(packages.find('foo') is None)
+        packages.add('foo', 'A')
+        self.assertEqual(packages.find('foo').get('state'), 'A')
+        self.assertRaises(ValueError, packages.add, 'foo', ' ')
+        packages.set('foo', ' ')
+        self.assertEqual(packages.find('foo').get('state'), ' ')
+        packages.remove('foo')
+        self.assertTrue(packages.find('foo') is None)
+        self.assertRaises(ValueError, packages.remove, 'foo')
+        self.assertRaises(ValueError, packages.set, 'foo', ' ')
+        self.assertEqual([p.get('name') for p in packages],
+                         ['added', 'missing', 'non-standard'])
+
+    def test_tracker2(self):
+        """test XMLPackageTracker merge"""
+        path = self.fixture_file('prj1')
+        packages = wc_read_packages(path)
+        packages.merge({'added': ' ', 'non-standard': 'D', 'new': ' '})
+        self.assertTrue(packages.find('missing') is None)
+        self.assertEqual(packages.find('added').get('state'), ' ')
+        self.assertEqual(packages.find('non-standard').get('state'), 'D')
+        self.assertEqual(packages.find('new').get('state'), ' ')
+        # check written data
+        packages = wc_read_packages(path)
+        self.assertEqual(sorted([p.get('name') for p in packages]),
+                         ['added', 'new', 'non-standard'])
+        self.assertEqual(packages.find('new').get('state'), ' ')
+
 if __name__ == '__main__':
     unittest.main()